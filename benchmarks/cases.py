@@ -0,0 +1,116 @@
+"""
+The benchmarked hot paths. Each case prepares its input outside the timed call.
+"""
+from benchmarks import inputs
+from src.dtprototype.ui.prompts.SuggestionPromptMaker import SuggestionPromptMaker
+from src.dtprototype.ui.prompts.json_to_markdown import JsonToMarkdownConverter
+from src.n8nprototype.backend.metaprompting import text_similarity
+from src.n8nprototype.backend.src.extract_json_from_response import extract
+from src.n8nprototype.backend.src.get_set_n8n_workflow import strip_elements_for_put
+from src.n8nprototype.backend.utils.source_sink import sink_from_n8n
+
+# Sizes of LLM outputs, n8n responses and workflows in bytes
+OUTPUT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+# Numbers of attentions of a SOFT response
+ATTENTION_COUNTS = (10, 100, 1_000, 10_000, 100_000)
+
+
+class Case:
+    """
+    A function benchmarked at several input sizes.
+    """
+
+    def __init__(self, name, sizes, setup):
+        """
+        :param name: Name of the case, the key of its baseline
+        :param sizes: Input sizes, ascending
+        :param setup: Function mapping a size to the function to time (without arguments)
+        """
+        self.name = name
+        self.sizes = sizes
+        self.setup = setup
+
+
+def _similarity(measure):
+    def setup(size):
+        expected = inputs.output_text(size)
+        actual = inputs.mutate(expected)
+        return lambda: measure(actual, expected)
+    return setup
+
+
+def _similarity_many(measure, candidates=50):
+    def setup(size):
+        expected = inputs.output_text(size)
+        actual = [inputs.mutate(expected, seed=seed) for seed in range(candidates)]
+        return lambda: measure(expected, actual)
+    return setup
+
+
+def _reference(size):
+    expected = inputs.output_text(size)
+    actual = inputs.mutate(expected)
+    reference = text_similarity.SimilarityReference(expected)
+    return lambda: reference.cosine(actual)
+
+
+def _json_similarity(size):
+    expected = inputs.output_text(size)
+    actual = f"```json\n{inputs.output_text(size, seed=1)}\n```"
+    return lambda: text_similarity.json_similarity(actual, expected)
+
+
+def _converter(size):
+    data = inputs.soft_response(size)
+    return lambda: JsonToMarkdownConverter(data)
+
+
+def _to_markdown(size):
+    converter = JsonToMarkdownConverter.__new__(JsonToMarkdownConverter)
+    # Only the tree is needed for to_markdown, building the name index is timed by json_to_markdown.init
+    converter.json_data = inputs.soft_response(size)
+    converter.attentions = converter.json_data["attentions"]
+    converter.tree = converter.build_tree()
+    return converter.to_markdown
+
+
+def _sink(size):
+    response = inputs.n8n_text_response(size)
+    return lambda: sink_from_n8n(response)
+
+
+def _extract(size):
+    response = inputs.n8n_text_response(size)
+    return lambda: extract(response)
+
+
+def _strip(size):
+    workflow = inputs.workflow(size)
+    return lambda: strip_elements_for_put(workflow)
+
+
+def _make_prompt(size):
+    maker = SuggestionPromptMaker()
+    issue = inputs.issue_text(size)
+    return lambda: maker.make_prompt(issue)
+
+
+CASES = [
+    Case("text_similarity.simple_similarity", OUTPUT_SIZES, _similarity(text_similarity.simple_similarity)),
+    Case("text_similarity.cosine_text_similarity", OUTPUT_SIZES, _similarity(text_similarity.cosine_text_similarity)),
+    Case("text_similarity.combined_similarity", OUTPUT_SIZES, _similarity(text_similarity.combined_similarity)),
+    Case("text_similarity.cosine_text_similarity_many[50]", OUTPUT_SIZES,
+         _similarity_many(text_similarity.cosine_text_similarity_many)),
+    Case("text_similarity.hashed_cosine_similarity_many[50]", OUTPUT_SIZES,
+         _similarity_many(text_similarity.hashed_cosine_similarity_many)),
+    Case("text_similarity.combined_similarity_many[50]", OUTPUT_SIZES,
+         _similarity_many(text_similarity.combined_similarity_many)),
+    Case("text_similarity.SimilarityReference.cosine", OUTPUT_SIZES, _reference),
+    Case("text_similarity.json_similarity", OUTPUT_SIZES, _json_similarity),
+    Case("json_to_markdown.init", ATTENTION_COUNTS, _converter),
+    Case("json_to_markdown.to_markdown", ATTENTION_COUNTS, _to_markdown),
+    Case("source_sink.sink_from_n8n", OUTPUT_SIZES, _sink),
+    Case("extract_json_from_response.extract", OUTPUT_SIZES, _extract),
+    Case("get_set_n8n_workflow.strip_elements_for_put", OUTPUT_SIZES, _strip),
+    Case("SuggestionPromptMaker.make_prompt", OUTPUT_SIZES, _make_prompt),
+]
@@ -0,0 +1,100 @@
+"""
+Synthetic, seeded inputs for the benchmarks, scaled by size in bytes or by number of attentions.
+"""
+import json
+import random
+
+VOCABULARY = (
+    "issue planning satisfactory present operations safeguard opportunity future threat fault "
+    "business core translation artificial intelligence technology market customer strategy "
+    "risk product service team manager organisation framework validate rule question title "
+    "accuracy workflow decision growth revenue cost quality demand supply vendor process"
+).split()
+
+
+def words(count, seed=0):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+def soft_response(attentions, seed=0):
+    """
+    A SOFT validation response like metaprompting/in/sample-response.json with the given
+    number of attentions, each attached to a random earlier attention.
+    """
+    rng = random.Random(seed)
+    items = []
+    for index in range(attentions):
+        items.append({
+            "id": index + 1,
+            "name": f"Attention {index + 1}",
+            "value": words(rng.randint(3, 12), seed=seed + index),
+            "weight": f"{rng.random():.1f}",
+            "parent_id": rng.randint(1, index) if index and rng.random() < 0.9 else None,
+        })
+    return {"attentions": items, "workflows": [], "reasoning": []}
+
+
+def output_text(size, seed=0):
+    """
+    An LLM output of about size bytes: a pretty printed SOFT response.
+    """
+    per_attention = len(json.dumps(soft_response(20, seed), indent=2)) / 20
+    return json.dumps(soft_response(max(1, int(size / per_attention)), seed), indent=2)
+
+
+def mutate(text, rate=0.1, seed=1):
+    """
+    The text with a share rate of its words replaced, standing in for a near miss of the model.
+    """
+    rng = random.Random(seed)
+    return " ".join(rng.choice(VOCABULARY) if rng.random() < rate else word for word in text.split(" "))
+
+
+def n8n_text_response(size, seed=0):
+    """
+    An n8n webhook response whose 'text' field holds a ```json code block of about size bytes.
+    """
+    return {"text": f"```json\n{output_text(size, seed)}\n```"}
+
+
+def workflow(size, seed=0):
+    """
+    An n8n workflow of about size bytes as returned by GET /api/v1/workflows/{id}.
+    """
+    rng = random.Random(seed)
+    nodes = []
+    connections = {}
+    node_count = max(1, size // 300)
+    for index in range(node_count):
+        node = {
+            "id": f"node-{index}",
+            "name": f"Node {index}",
+            "type": "n8n-nodes-base.webhook" if index % 10 == 0 else "n8n-nodes-base.set",
+            "typeVersion": 2,
+            "position": [rng.randint(0, 2000), rng.randint(0, 2000)],
+            "parameters": {"value": words(12, seed=seed + index)},
+        }
+        if node["type"] == "n8n-nodes-base.webhook":
+            node["webhookId"] = f"webhook-{index}"
+        nodes.append(node)
+        if index:
+            connections[f"Node {index - 1}"] = {"main": [[{"node": node["name"], "type": "main", "index": 0}]]}
+    return {
+        "id": "8pwD1Tqlsbh5itS4",
+        "name": "Benchmark workflow",
+        "active": False,
+        "nodes": nodes,
+        "connections": connections,
+        "settings": {"executionOrder": "v1"},
+        "staticData": None,
+        "meta": {"templateCredsSetupCompleted": True},
+        "versionId": "00000000-0000-0000-0000-000000000000",
+    }
+
+
+def issue_text(size, seed=0):
+    """
+    A user's issue of about size bytes.
+    """
+    return words(max(1, size // 8), seed)
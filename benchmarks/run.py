@@ -0,0 +1,165 @@
+"""
+Runs the micro-benchmarks and compares them to the recorded baseline.
+
+    python -m benchmarks.run                      # run all cases, compare to benchmarks/baseline.json
+    python -m benchmarks.run --filter similarity  # only cases whose name contains "similarity"
+    python -m benchmarks.run --update-baseline    # record the results as the new baseline
+
+A case regresses if a size got slower than threshold times its baseline, or if the
+scaling exponent across sizes (the slope of log(time) over log(size): 1 is linear, 2 is
+quadratic) grew by more than SLOPE_TOLERANCE. The exponent does not depend on the speed
+of the machine, so complexity regressions show up even against a baseline recorded on
+another box. Sizes whose extrapolated time per call exceeds max_call are skipped.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+
+from benchmarks.cases import CASES
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Slowdown against the baseline that counts as a regression
+DEFAULT_THRESHOLD = float(os.getenv('BENCH_THRESHOLD', '1.5'))
+# Growth of the scaling exponent that counts as a complexity regression
+SLOPE_TOLERANCE = 0.3
+
+
+def measure(fn, min_time=0.2, repeat=5):
+    """
+    :param fn: Function to time
+    :param min_time: Seconds to spend at least, for fast functions
+    :param repeat: Number of timed rounds, fewer if a single call exceeds min_time
+    :return: Median seconds per call
+    """
+    started_at = time.perf_counter()
+    fn()
+    first = time.perf_counter() - started_at
+    if first >= min_time:
+        return first
+    number = max(1, int(min_time / repeat / max(first, 1e-9)))
+    rounds = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - started_at) / number)
+    return statistics.median(rounds)
+
+
+def slope(timings):
+    """
+    :param timings: Dict mapping sizes to seconds
+    :return: Least squares slope of log(seconds) over log(size), None with fewer than two sizes
+    """
+    points = [(math.log(int(size)), math.log(seconds)) for size, seconds in timings.items() if seconds]
+    if len(points) < 2:
+        return None
+    mean_x = statistics.fmean(x for x, _ in points)
+    mean_y = statistics.fmean(y for _, y in points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def run_case(case, max_call=5.0, max_size=None, min_time=0.2):
+    """
+    :param case: The Case to run
+    :param max_call: Skip sizes whose extrapolated seconds per call exceed this
+    :param max_size: Skip sizes above this
+    :param min_time: See measure
+    :return: Dict mapping each measured size (as str, like in the baseline) to seconds per call
+    """
+    timings = {}
+    measured = []
+    for size in case.sizes:
+        if max_size is not None and size > max_size:
+            break
+        if measured:
+            # Extrapolate with the scaling of the last two sizes, assuming at least linear
+            exponent = max(1.0, slope(dict(measured[-2:])) or 1.0)
+            predicted = measured[-1][1] * (size / int(measured[-1][0])) ** exponent
+            if predicted > max_call:
+                print(f"  {size:>9}  skipped, about {predicted:.1f}s per call")
+                break
+        seconds = measure(case.setup(size), min_time=min_time)
+        timings[str(size)] = seconds
+        measured.append((str(size), seconds))
+        print(f"  {size:>9}  {seconds * 1e3:10.3f} ms")
+    return timings
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    :param results: Dict mapping case names to timings, as returned by run_case
+    :param baseline: Same structure, recorded earlier
+    :param threshold: Slowdown that counts as a regression
+    :return: List of regression messages
+    """
+    regressions = []
+    for name, timings in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        for size, seconds in timings.items():
+            if size in expected and seconds > threshold * expected[size]:
+                regressions.append(f"{name} [{size}]: {seconds * 1e3:.3f} ms, baseline {expected[size] * 1e3:.3f} ms "
+                                   f"({seconds / expected[size]:.1f}x)")
+        common = {size: seconds for size, seconds in timings.items() if size in expected}
+        current_slope = slope(common)
+        baseline_slope = slope({size: expected[size] for size in common})
+        if current_slope is not None and baseline_slope is not None and current_slope > baseline_slope + SLOPE_TOLERANCE:
+            regressions.append(f"{name}: scales with exponent {current_slope:.2f}, baseline {baseline_slope:.2f}")
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f).get("results", {})
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, "w") as f:
+        json.dump({"machine": f"{platform.machine()} {platform.python_implementation()} {platform.python_version()}",
+                   "results": results}, f, indent=2)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the backend's pure-Python hot paths")
+    parser.add_argument("--filter", default="", help="Only cases whose name contains this text")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Slowdown counted as regression")
+    parser.add_argument("--max-call", type=float, default=5.0, help="Skip sizes slower than this many seconds per call")
+    parser.add_argument("--max-size", type=int, default=None, help="Skip sizes above this")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Record the results as the baseline")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for case in CASES:
+        if args.filter in case.name:
+            print(case.name)
+            results[case.name] = run_case(case, max_call=args.max_call, max_size=args.max_size)
+
+    if args.update_baseline:
+        baseline = load_baseline(args.baseline)
+        baseline.update(results)
+        save_baseline(baseline, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, load_baseline(args.baseline), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+Replays a corpus of SOFT issues or message arrays against an n8n webhook and reports
+latency percentiles, error rate and throughput, overall and per time interval.
+
+    python -m benchmarks.webhook_load http://localhost:5678/webhook/softvalidator --concurrency 8 --requests 200
+    python -m benchmarks.webhook_load http://localhost:5678/webhook/selectworkflow --rate 5 --duration 60 --jwt $TOKEN
+
+Requests are sent like source_to_n8n sends them, but over a session of their own: the
+circuit breakers of the shared transport would fail requests to a struggling webhook
+without sending them, and the report would measure the breaker instead of n8n. With
+--format query the messages are wrapped in {"body": messages} like query_prompt_on_n8n does.
+
+With --concurrency the given number of workers send back to back (closed loop). With --rate
+requests are started on a fixed schedule whatever the latency (open loop) and latency is
+measured from the scheduled start, so a stalled workflow shows up as queueing instead of
+silently lowering the rate.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.n8nprototype.backend.utils.transport import HTTP_DEFAULT_TIMEOUT
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "corpus", "soft_issues.jsonl")
+
+
+def load_corpus(path=DEFAULT_CORPUS):
+    """
+    Reads a corpus with one JSON value per line: a SOFT issue as string, a list of messages,
+    or a payload dict sent as is.
+
+    :return: List of message arrays or payload dicts
+    """
+    corpus = []
+    with open(path, "r", encoding="UTF-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = [{"role": "user", "content": item}]
+            corpus.append(item)
+    if not corpus:
+        raise ValueError(f"Corpus '{path}' is empty")
+    return corpus
+
+
+def percentile(values, percent):
+    """
+    :return: Nearest-rank percentile of the values, None without values
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(len(values) * percent / 100)) - 1))]
+
+
+class Result:
+    """
+    Outcome of one request, at seconds since the start of the run.
+    """
+
+    def __init__(self, started, latency, error=None):
+        self.started = started
+        self.latency = latency
+        self.error = error
+
+
+class LoadGenerator:
+    """
+    Sends a corpus to a webhook at a target rate or concurrency.
+    """
+
+    def __init__(self, webhook_url, corpus, jwt_token="", payload_format="source", concurrency=4, rate=None,
+                 timeout=HTTP_DEFAULT_TIMEOUT):
+        """
+        :param webhook_url: The URL of the n8n webhook
+        :param corpus: List of message arrays or payload dicts, sent round robin
+        :param jwt_token: Optional JWT token for authentication
+        :param payload_format: "source" sends the items as is, "query" wraps them in {"body": ...}
+        :param concurrency: Number of requests in flight at most
+        :param rate: Requests started per second, None sends back to back
+        :param timeout: Seconds a request may take
+        """
+        self.webhook_url = webhook_url
+        self.corpus = corpus
+        self.jwt_token = jwt_token
+        self.payload_format = payload_format
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json"}
+        if jwt_token:
+            self.headers["Authorization"] = f"Bearer {jwt_token}"
+        # A session without circuit breaker, with a keep-alive connection per worker
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=concurrency))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=concurrency))
+        self.results = []
+        self.elapsed = None
+        self._lock = threading.Lock()
+
+    def payload(self, index):
+        item = self.corpus[index % len(self.corpus)]
+        return {"body": item} if self.payload_format == "query" else item
+
+    def send(self, index, scheduled_at, run_started_at):
+        try:
+            response = self.session.post(self.webhook_url, json=self.payload(index), headers=self.headers,
+                                         timeout=self.timeout)
+            error = None if response.status_code == 200 else str(response.status_code)
+        except requests.RequestException:
+            error = "exception"
+        latency = time.perf_counter() - scheduled_at
+        with self._lock:
+            self.results.append(Result(scheduled_at - run_started_at, latency, error))
+
+    def run(self, requests=None, duration=None):
+        """
+        Sends until requests have been sent or duration seconds have passed.
+
+        :return: The Results, ordered by start
+        """
+        if requests is None and duration is None:
+            raise ValueError("Set requests, duration or both")
+        run_started_at = time.perf_counter()
+
+        def more(index):
+            if requests is not None and index >= requests:
+                return False
+            return duration is None or time.perf_counter() - run_started_at < duration
+
+        if self.rate:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                index = 0
+                while more(index):
+                    scheduled_at = run_started_at + index / self.rate
+                    time.sleep(max(0.0, scheduled_at - time.perf_counter()))
+                    executor.submit(self.send, index, scheduled_at, run_started_at)
+                    index += 1
+        else:
+            counter = iter(range(sys.maxsize))
+            counter_lock = threading.Lock()
+
+            def worker():
+                while True:
+                    with counter_lock:
+                        index = next(counter)
+                    if not more(index):
+                        return
+                    self.send(index, time.perf_counter(), run_started_at)
+
+            threads = [threading.Thread(target=worker) for _ in range(self.concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.elapsed = time.perf_counter() - run_started_at
+        return sorted(self.results, key=lambda result: result.started)
+
+
+def summarize(results, elapsed):
+    """
+    :param results: Results of a run
+    :param elapsed: Seconds the run took
+    :return: Dict with count, error rate, errors by status, throughput and latency percentiles
+    """
+    latencies = [result.latency for result in results if result.error is None]
+    errors = {}
+    for result in results:
+        if result.error is not None:
+            errors[result.error] = errors.get(result.error, 0) + 1
+    return {
+        "requests": len(results),
+        "error_rate": sum(errors.values()) / len(results) if results else 0.0,
+        "errors": errors,
+        "throughput": len(results) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.fmean(latencies) if latencies else None,
+    }
+
+
+def timeline(results, interval=1.0):
+    """
+    :return: One summary per interval of seconds, by the start of the requests
+    """
+    buckets = {}
+    for result in results:
+        buckets.setdefault(int(result.started // interval), []).append(result)
+    return [{"second": bucket * interval, **summarize(bucket_results, interval)}
+            for bucket, bucket_results in sorted(buckets.items())]
+
+
+def _ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1e3:.0f}"
+
+
+def print_report(summary, intervals):
+    print(f"{'second':>8} {'req':>6} {'req/s':>7} {'err%':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+    for row in intervals:
+        print(f"{row['second']:>8.0f} {row['requests']:>6} {row['throughput']:>7.1f} {row['error_rate'] * 100:>6.1f} "
+              f"{_ms(row['p50']):>8} {_ms(row['p90']):>8} {_ms(row['p99']):>8}")
+    print(f"\nRequests: {summary['requests']}, throughput: {summary['throughput']:.1f} req/s, "
+          f"errors: {summary['error_rate'] * 100:.1f}% {summary['errors'] or ''}")
+    print(f"Latency p50: {_ms(summary['p50'])} ms, p90: {_ms(summary['p90'])} ms, p99: {_ms(summary['p99'])} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for n8n webhooks")
+    parser.add_argument("webhook_url")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL file of issues, message arrays or payloads")
+    parser.add_argument("--format", choices=("source", "query"), default="source",
+                        help="query wraps each item in {\"body\": ...} like query_prompt_on_n8n")
+    parser.add_argument("--jwt", default=os.getenv("N8N_JWT_TOKEN", ""), help="JWT token (default: N8N_JWT_TOKEN)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at most")
+    parser.add_argument("--rate", type=float, default=None, help="Requests started per second (open loop)")
+    parser.add_argument("--requests", type=int, default=None, help="Number of requests to send")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to send for")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds per row of the timeline")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+    if args.requests is None and args.duration is None:
+        args.requests = 100
+
+    generator = LoadGenerator(args.webhook_url, load_corpus(args.corpus), args.jwt, args.format,
+                              args.concurrency, args.rate)
+    results = generator.run(args.requests, args.duration)
+    summary = summarize(results, generator.elapsed)
+    intervals = timeline(results, args.interval)
+    if args.json:
+        print(json.dumps({"summary": summary, "timeline": intervals}, indent=2))
+    else:
+        print_report(summary, intervals)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
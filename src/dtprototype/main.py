@@ -1,8 +1,16 @@
 # Copyright (c) 2024 Agile Athletes GmbH.
 # The source is part of the open-source project https://github.com/agile-athletes/ai-playground
 # and is distributed under the terms of the MIT licence.
+import os
+import sys
 
+# The UI shares the HTTP transport of the backend, which is imported relative to the project root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from src.n8nprototype.backend.utils import telemetry
 from ui.sample_proto import demo
 
 if __name__ == "__main__":
+    # Prometheus /metrics of the outbound calls, only if METRICS_PORT is set
+    telemetry.serve()
     demo.launch(server_name="0.0.0.0", server_port=7860, share=False)
@@ -5,25 +5,61 @@ import json
 import os
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import APIConnectionError, OpenAI
 from openai.types.chat import ChatCompletionMessage
 
+from src.n8nprototype.backend.utils import deadline, telemetry
+from src.n8nprototype.backend.utils.rate_limit import estimate_tokens, get_limiter
+from src.n8nprototype.backend.utils.singleflight import SingleFlight, fingerprint
+from src.n8nprototype.backend.utils.transport import get_transport
+
 load_dotenv()
 client = OpenAI(
     api_key=os.environ.get("OPENAI_API_KEY"),
+    http_client=get_transport().httpx_client(),
 )
 
 model = "gpt-4o-mini"
 
+# Seconds a completion may take without a request-scoped deadline
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+
+# Identical queries in flight at the same time share one completion
+flights = SingleFlight("openai")
+
 
 def query_openai(messages: json):
-    chat_completion = client.chat.completions.create(
-        messages=messages,
-        model=model,
-    )
+    return flights.do(fingerprint(model, messages), lambda: _create_completion(messages))
+
+
+def _create_completion(messages: json):
+    # The SDK sends over httpx, so the breaker of the OpenAI host is applied here instead of in the transport
+    breaker = get_transport().breaker_for(str(client.base_url))
+    timeout = deadline.timeout(OPENAI_TIMEOUT)
+    with get_limiter("openai").limit(tokens=estimate_tokens(json.dumps(messages))) as outcome, \
+            telemetry.span("openai.chat", model=model, host=breaker.name) as span:
+        try:
+            chat_completion = breaker.call(lambda: client.chat.completions.create(
+                messages=messages,
+                model=model,
+                timeout=timeout,
+            ), is_failure=_is_host_failure)
+        except Exception as e:
+            outcome.status = getattr(e, "status_code", None)
+            span.set(status=outcome.status)
+            raise
+        outcome.status = 200
+        usage = chat_completion.usage
+        span.set(status=200, prompt_tokens=usage and usage.prompt_tokens,
+                 completion_tokens=usage and usage.completion_tokens)
     return chat_completion.choices[0]
 
 
+def _is_host_failure(error):
+    # Like Transport.request: connection errors, timeouts and 5xx count, a 4xx is the request's fault
+    return isinstance(error, APIConnectionError) or (getattr(error, "status_code", None) or 0) >= 500
+
+
 def add_completion(messages: json, completion: ChatCompletionMessage):
     messages.append({
         "role": "assistant",
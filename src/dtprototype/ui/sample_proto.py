@@ -2,14 +2,23 @@
 # The source is part of the open-source project https://github.com/agile-athletes/ai-playground
 # and is distributed under the terms of the MIT licence.
 import json
+import os
 
 import gradio as gr
 from openai.types.chat import ChatCompletionMessage
 
+from src.n8nprototype.backend.utils.deadline import deadline
 from .openaiclient.query_openai import query_openai, strip_json_from_llm
 from .prompts.PromptMaker import load_markdown_file
 from .prompts.SuggestionPromptMaker import SuggestionPromptMaker
 from .prompts.json_to_markdown import JsonToMarkdownConverter
+from .semantic_cache import SemanticCache
+
+# Validations of issues that differ only slightly from an earlier one are answered from here
+validation_cache = SemanticCache(threshold=float(os.getenv("VALIDATION_CACHE_THRESHOLD", "0.8")))
+
+# Seconds a user waits for a validation before the sample validation is shown
+VALIDATION_DEADLINE = float(os.getenv("VALIDATION_DEADLINE", "45"))
 
 with gr.Blocks() as demo:
     title = gr.HTML("<H1>Long Range Planning with SOFT</H1>")
@@ -32,6 +41,9 @@ with gr.Blocks() as demo:
         prompt_maker = SuggestionPromptMaker()
         if not issue_text or len(issue_text) <= 0:
             return load_markdown_file("sample_validation.md")
+        cached = validation_cache.get(issue_text)
+        if cached is not None:
+            return cached
         try:
             prompt = prompt_maker.make_prompt(issue_text)
             messages = [
@@ -40,9 +52,12 @@ with gr.Blocks() as demo:
                     "content": prompt
                 }
             ]
-            result: ChatCompletionMessage = query_openai(messages)
+            with deadline(VALIDATION_DEADLINE):
+                result: ChatCompletionMessage = query_openai(messages)
             result_as_json = json.loads(strip_json_from_llm(result.message.content))
-            return JsonToMarkdownConverter(result_as_json).to_markdown().replace("USER_TEXT", f"your validated text in the Issue Editor")
+            markdown = JsonToMarkdownConverter(result_as_json).to_markdown().replace("USER_TEXT", f"your validated text in the Issue Editor")
+            validation_cache.set(issue_text, markdown)
+            return markdown
         except (Exception, BaseException) as e:
             return load_markdown_file("sample_validation.md")
 
@@ -0,0 +1,117 @@
+# Copyright (c) 2025 Agile Athletes GmbH.
+# The source is part of the open-source project https://github.com/agile-athletes/ai-playground
+# and is distributed under the terms of the MIT licence.
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from src.n8nprototype.backend.metaprompting.text_similarity import cosine_text_similarity
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """
+    Normalizes a text for comparison: lower case, punctuation removed, whitespace collapsed.
+
+    :param text: The text to normalize.
+    :return: The normalized text.
+    """
+    return " ".join(WORD_PATTERN.findall(text.lower()))
+
+
+class SemanticCache:
+    """
+    Caches results keyed by text and also answers lookups for near-duplicate texts.
+
+    A lookup first tries the normalized text as exact key. Otherwise an inverted index from
+    words to entries selects the few entries sharing the most words with the text, and only
+    those are scored with the TF-IDF cosine similarity of text_similarity. Only the postings
+    of the rarest words are visited, so a lookup does not scan the whole cache.
+    """
+
+    def __init__(self, threshold: float = 0.8, max_entries: int = 1000, max_candidates: int = 5):
+        """
+        :param threshold: Minimum cosine similarity for a near-duplicate hit.
+        :param max_entries: Number of entries kept before the least recently used is evicted.
+        :param max_candidates: Number of entries with the largest word overlap that are scored.
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_candidates = max_candidates
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._index: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> Optional[str]:
+        """
+        Returns the value stored for the text or for a text within the similarity threshold.
+
+        :param text: The text to look up.
+        :return: The cached value, None if there is no similar entry.
+        """
+        key = normalize(text)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            candidates = self._candidates(key)
+
+        best_key, best_score = None, self.threshold
+        for candidate in candidates:
+            score = cosine_text_similarity(key, candidate)
+            if score >= best_score:
+                best_key, best_score = candidate, score
+
+        with self._lock:
+            if best_key is not None and best_key in self._entries:
+                self._entries.move_to_end(best_key)
+                self.near_hits += 1
+                return self._entries[best_key]
+            self.misses += 1
+            return None
+
+    def set(self, text: str, value: str):
+        """
+        Stores a value for the text.
+
+        :param text: The text the value was computed for.
+        :param value: The value to cache.
+        """
+        key = normalize(text)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            for word in set(key.split()):
+                self._index.setdefault(word, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._unindex(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "near_hits": self.near_hits, "misses": self.misses,
+                    "entries": len(self._entries)}
+
+    def _candidates(self, key: str):
+        words = set(key.split())
+        # A near-duplicate shares at least half of the words, hence at least one of the
+        # len(words) // 2 + 1 rarest words: only their postings need to be visited.
+        rarest = sorted(words, key=lambda word: len(self._index.get(word, ())))[:len(words) // 2 + 1]
+        candidates = set().union(*(self._index.get(word, ()) for word in rarest))
+        overlaps = [(len(words.intersection(candidate.split())), candidate) for candidate in candidates]
+        ranked = sorted((overlap for overlap in overlaps if overlap[0] >= len(words) / 2), reverse=True)
+        return [candidate for _, candidate in ranked[:self.max_candidates]]
+
+    def _unindex(self, key: str):
+        for word in set(key.split()):
+            keys = self._index.get(word)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[word]
@@ -0,0 +1,37 @@
+# Copyright (c) 2025 Agile Athletes GmbH.
+# The source is part of the open-source project https://github.com/agile-athletes/ai-playground
+# and is distributed under the terms of the MIT licence.
+from unittest import TestCase
+
+from src.dtprototype.ui.semantic_cache import SemanticCache, normalize
+
+ISSUE = "New artificial intelligence technology is challenging our core business of on-demand translation."
+
+
+class TestSemanticCache(TestCase):
+
+    def setUp(self):
+        self.cache = SemanticCache(threshold=0.75)
+        self.cache.set(ISSUE, "# Validation")
+
+    def test_normalize_ignores_case_punctuation_and_whitespace(self):
+        self.assertEqual(normalize("  New AI,   challenging  our business!"), "new ai challenging our business")
+
+    def test_whitespace_and_punctuation_variants_hit(self):
+        self.assertEqual(self.cache.get("new artificial  intelligence technology, is challenging our core business of on demand translation"), "# Validation")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_near_duplicate_hits(self):
+        self.assertEqual(self.cache.get("New AI technology is challenging our core business of on-demand translation."), "# Validation")
+        self.assertEqual(self.cache.stats()["near_hits"], 1)
+
+    def test_different_issue_misses(self):
+        self.assertIsNone(self.cache.get("Our supply chain depends on a single vendor in one region."))
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_eviction_removes_index_entries(self):
+        cache = SemanticCache(max_entries=1)
+        cache.set(ISSUE, "first")
+        cache.set("Our supply chain depends on a single vendor.", "second")
+        self.assertIsNone(cache.get(ISSUE))
+        self.assertNotIn("translation", cache._index)
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# SQLite file of the prompt-search experiments
+EXPERIMENT_STORE_PATH = os.getenv('EXPERIMENT_STORE_PATH', 'experiments.sqlite3')
+# Texts from this many bytes on are stored zlib compressed; shorter ones would not shrink
+COMPRESS_MIN_BYTES = 512
+COMPRESS_LEVEL = 6
+
+
+def content_hash(text):
+    """
+    :param text: A prompt, input or output
+    :return: Hex SHA-256 digest of the text
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ExperimentStore:
+    """
+    Keeps the results of prompt-search runs in a SQLite file, so a run interrupted by a
+    crash resumes where it stopped instead of paying for its LLM generations again::
+
+        store = ExperimentStore()
+        run_id = store.start_run(input_text, expected_output, "qwen2.5:14b", run_id=previous_run_id)
+        done = store.completed(run_id)
+        for iteration in range(10):
+            if iteration not in done:
+                ...
+                store.record(run_id, iteration, prompt, output, similarity)
+
+    Results are only ever appended, one row per iteration of a run. Texts are stored once
+    per content hash, the long ones compressed, and results refer to them by hash: a
+    prompt or an expected output used by many runs takes its space once. best() finds the
+    best prompt for an input and model through an index, without reading the texts.
+    Iterations that reused the result of another one (duplicate_of) are kept for resuming
+    but never returned by best(): their prompt was not run.
+    """
+
+    def __init__(self, path=EXPERIMENT_STORE_PATH):
+        """
+        :param path: Path of the SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS texts ("
+                "hash TEXT PRIMARY KEY, data BLOB NOT NULL, compressed INTEGER NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "run_id TEXT PRIMARY KEY, input_hash TEXT NOT NULL, expected_hash TEXT NOT NULL, "
+                "model TEXT NOT NULL, prompt_model TEXT, created_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "run_id TEXT NOT NULL REFERENCES runs (run_id), iteration INTEGER NOT NULL, "
+                "input_hash TEXT NOT NULL, expected_hash TEXT NOT NULL, model TEXT NOT NULL, "
+                "prompt_hash TEXT NOT NULL, output_hash TEXT NOT NULL, similarity REAL NOT NULL, "
+                "timings TEXT, created_at REAL NOT NULL, duplicate_of INTEGER, PRIMARY KEY (run_id, iteration))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_best ON results (input_hash, model, similarity DESC)"
+            )
+
+    def start_run(self, input_text, expected_output, model, prompt_model=None, run_id=None):
+        """
+        Starts a run, or resumes it if run_id is already known.
+
+        :param input_text: Input of the prompts
+        :param expected_output: Output the prompts should produce
+        :param model: Model running the prompts
+        :param prompt_model: Model generating the prompts
+        :param run_id: Id of the run to resume, None starts a new run
+        :return: The run id
+        :raises ValueError: If the run to resume was started with another input, expected output or model
+        """
+        run_id = run_id or uuid.uuid4().hex
+        input_hash, expected_hash = content_hash(input_text), content_hash(expected_output)
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT input_hash, expected_hash, model FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            if row is not None:
+                if row != (input_hash, expected_hash, model):
+                    raise ValueError(f"Run {run_id} was started with another input, expected output or model")
+                return run_id
+            self._put_text(input_text)
+            self._put_text(expected_output)
+            self._connection.execute(
+                "INSERT INTO runs (run_id, input_hash, expected_hash, model, prompt_model, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, input_hash, expected_hash, model, prompt_model, time.time()),
+            )
+        return run_id
+
+    def record(self, run_id, iteration, prompt, output, similarity, timings=None, duplicate_of=None):
+        """
+        Appends the result of an iteration. Recording an iteration twice keeps the first result.
+
+        :param run_id: Id from start_run
+        :param iteration: Number of the iteration within the run
+        :param prompt: The generated prompt
+        :param output: Output of the prompt
+        :param similarity: Similarity of the output to the expected output
+        :param timings: Optional dict of seconds per stage
+        :param duplicate_of: Iteration whose output and similarity were reused because the prompt
+                             is a near-duplicate of its prompt
+        :return: True if the result was added
+        """
+        with self._lock, self._connection:
+            run = self._connection.execute(
+                "SELECT input_hash, expected_hash, model FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            if run is None:
+                raise KeyError(f"Unknown run {run_id}")
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO results (run_id, iteration, input_hash, expected_hash, model, prompt_hash, "
+                "output_hash, similarity, timings, created_at, duplicate_of) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, iteration, *run, self._put_text(prompt), self._put_text(output), similarity,
+                 json.dumps(timings) if timings else None, time.time(), duplicate_of),
+            )
+        return cursor.rowcount == 1
+
+    def completed(self, run_id):
+        """
+        :return: Dict of iteration -> result (see results) of the iterations recorded for the run
+        """
+        return {result["iteration"]: result for result in self.results(run_id)}
+
+    def results(self, run_id):
+        """
+        :return: List of dicts with iteration, prompt, output, similarity, timings and duplicate_of,
+                 by iteration
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT iteration, prompt_hash, output_hash, similarity, timings, duplicate_of FROM results "
+                "WHERE run_id = ? ORDER BY iteration", (run_id,)
+            ).fetchall()
+            return [self._result(*row) for row in rows]
+
+    def best(self, input_text, model, limit=1):
+        """
+        The best prompts recorded for an input and model over all runs, leaving out
+        near-duplicates that were not run.
+
+        :param input_text: Input of the prompts
+        :param model: Model running the prompts
+        :param limit: Number of results
+        :return: List of dicts like results, with run_id, highest similarity first
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT run_id, iteration, prompt_hash, output_hash, similarity, timings, duplicate_of FROM results "
+                "WHERE input_hash = ? AND model = ? AND duplicate_of IS NULL ORDER BY similarity DESC LIMIT ?",
+                (content_hash(input_text), model, limit),
+            ).fetchall()
+            return [{"run_id": row[0], **self._result(*row[1:])} for row in rows]
+
+    def text(self, digest):
+        """
+        :param digest: Content hash of a stored text
+        :return: The text, None if it is not stored
+        """
+        with self._lock:
+            return self._get_text(digest)
+
+    def stats(self):
+        """
+        :return: Counts of runs, results and texts, and the raw and stored bytes of the texts
+        """
+        with self._lock:
+            runs = self._connection.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+            results = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            texts, raw, stored = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM texts"
+            ).fetchone()
+        return {"runs": runs, "results": results, "texts": texts, "raw_bytes": raw, "stored_bytes": stored}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _result(self, iteration, prompt_hash, output_hash, similarity, timings, duplicate_of):
+        return {
+            "iteration": iteration,
+            "prompt": self._get_text(prompt_hash),
+            "output": self._get_text(output_hash),
+            "similarity": similarity,
+            "timings": json.loads(timings) if timings else {},
+            "duplicate_of": duplicate_of,
+        }
+
+    def _put_text(self, text):
+        digest = content_hash(text)
+        data = text.encode('utf-8')
+        compressed = len(data) >= COMPRESS_MIN_BYTES
+        self._connection.execute(
+            "INSERT OR IGNORE INTO texts (hash, data, compressed, size) VALUES (?, ?, ?, ?)",
+            (digest, zlib.compress(data, COMPRESS_LEVEL) if compressed else data, int(compressed), len(data)),
+        )
+        return digest
+
+    def _get_text(self, digest):
+        row = self._connection.execute("SELECT data, compressed FROM texts WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        data, compressed = row
+        return (zlib.decompress(data) if compressed else bytes(data)).decode('utf-8')
@@ -0,0 +1,275 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def split_tokens(text):
+    """
+    Splits a text into tokens as the fake server counts them: words with their trailing
+    whitespace, so that joining the tokens gives back the text.
+    """
+    return re.findall(r"\s*\S+\s*", text) if text.strip() else []
+
+
+class FakeLLMServer:
+    """
+    Local stand-in for an Ollama server and the OpenAI chat completions API, for tests and
+    for benchmarks that must not depend on a GPU host or on OpenAI.
+
+    Speaks Ollama /api/generate and /api/chat (streaming and non-streaming) and /api/ps,
+    and OpenAI /v1/chat/completions (streaming as server-sent events and non-streaming).
+    Latency is injected per request: time_to_first_token before the first token, then one
+    token every 1/tokens_per_second seconds. A non-streaming request answers after the
+    whole generation time.
+
+    Like Ollama it holds one model in memory at a time and sleeps load_delay seconds
+    whenever a request needs a different model, and it keeps the tokens (here: words) of
+    the last prompt and only evaluates what follows the common prefix, reported as
+    prompt_eval_count. A share error_rate of the requests fails with error_status, and
+    setting available to False fails all of them with 503::
+
+        with FakeLLMServer(time_to_first_token=0.2, tokens_per_second=30, response=sample) as fake:
+            client = LLMClient()
+            client.ollama_base_url = fake.base_url
+            ...
+    """
+
+    def __init__(self, response="ok", time_to_first_token=0.0, tokens_per_second=None, load_delay=0.0,
+                 error_rate=0.0, error_status=503, seed=None, host="127.0.0.1", port=0):
+        """
+        :param response: Canned output, or a function mapping the prompt text to the output
+        :param time_to_first_token: Seconds until the first token of a generation
+        :param tokens_per_second: Generation speed, None generates all tokens at once
+        :param load_delay: Seconds to load a model that is not in memory (Ollama only)
+        :param error_rate: Share of requests between 0 and 1 answered with error_status
+        :param error_status: HTTP status of the injected errors
+        :param seed: Seed of the error injection, for reproducible runs
+        :param host: Interface to listen on
+        :param port: Port to listen on, 0 picks a free one
+        """
+        self.response = response
+        self.time_to_first_token = time_to_first_token
+        self.tokens_per_second = tokens_per_second
+        self.load_delay = load_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.available = True
+        self.loaded_model = None
+        self.cached_tokens = []
+        self.loads = []
+        self.requests = []
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_address[1]}"
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """
+        Serves requests from a background thread.
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05},
+                                        name="fake-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def output_for(self, prompt):
+        return self.response(prompt) if callable(self.response) else self.response
+
+    def token_delay(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _fail(self):
+        with self._lock:
+            if not self.available:
+                return 503
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                return self.error_status
+        return None
+
+    def _load(self, model, tokens):
+        """
+        Loads the model if needed and counts the prompt tokens after the cached prefix.
+
+        :return: (load_duration in ns, prompt_eval_count)
+        """
+        started_at = time.perf_counter()
+        with self._lock:
+            if self.loaded_model != model:
+                time.sleep(self.load_delay)
+                self.loaded_model = model
+                self.loads.append(model)
+                self.cached_tokens = []
+            load_duration = int((time.perf_counter() - started_at) * 1e9)
+            reused = 0
+            while reused < min(len(tokens), len(self.cached_tokens)) and tokens[reused] == self.cached_tokens[reused]:
+                reused += 1
+            self.cached_tokens = tokens
+        return load_duration, len(tokens) - reused
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if not fake.available:
+                    self._reply({"error": "unavailable"}, 503)
+                elif self.path == "/api/ps":
+                    models = [{"name": fake.loaded_model}] if fake.loaded_model else []
+                    self._reply({"models": models})
+                else:
+                    self._reply({"error": "not found"}, 404)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status = fake._fail()
+                if status is not None:
+                    self._reply({"error": "injected failure"}, status)
+                    return
+                fake.requests.append(body)
+                if self.path == "/api/generate":
+                    self._ollama(body, body.get("prompt", ""), chat=False)
+                elif self.path == "/api/chat":
+                    self._ollama(body, " ".join(message["content"] for message in body["messages"]), chat=True)
+                elif self.path == "/v1/chat/completions":
+                    self._openai(body)
+                else:
+                    self._reply({"error": "not found"}, 404)
+
+            def _ollama(self, body, prompt, chat):
+                started_at = time.perf_counter()
+                words = prompt.split()
+                load_duration, prompt_eval_count = fake._load(body["model"], words)
+                # A generate request without prompt only loads the model
+                tokens = split_tokens(fake.output_for(prompt)) if words or chat else []
+
+                def chunk(text, done):
+                    if chat:
+                        return {"model": body["model"], "message": {"role": "assistant", "content": text}, "done": done}
+                    return {"model": body["model"], "response": text, "done": done}
+
+                def final(text):
+                    result = chunk(text, True)
+                    result.update({
+                        "load_duration": load_duration,
+                        "prompt_eval_count": prompt_eval_count,
+                        "eval_count": len(tokens),
+                        "eval_duration": int(len(tokens) * fake.token_delay() * 1e9) or 1_000_000,
+                        "total_duration": int((time.perf_counter() - started_at) * 1e9),
+                    })
+                    return result
+
+                if body.get("stream", True):
+                    self._start_stream("application/x-ndjson")
+                    for token in self._generate(tokens):
+                        self._write(json.dumps(chunk(token, False)) + "\n")
+                    self._write(json.dumps(final("")) + "\n")
+                else:
+                    self._reply(final("".join(self._generate(tokens))))
+
+            def _openai(self, body):
+                prompt = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+                tokens = split_tokens(fake.output_for(prompt))
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(tokens),
+                         "total_tokens": len(prompt.split()) + len(tokens)}
+
+                def completion(obj, choice):
+                    return {"id": completion_id, "object": obj, "created": int(time.time()),
+                            "model": body.get("model", ""), "choices": [{"index": 0, **choice}]}
+
+                if body.get("stream"):
+                    self._start_stream("text/event-stream")
+                    for token in self._generate(tokens):
+                        data = completion("chat.completion.chunk", {"delta": {"content": token}, "finish_reason": None})
+                        self._write(f"data: {json.dumps(data)}\n\n")
+                    data = completion("chat.completion.chunk", {"delta": {}, "finish_reason": "stop"})
+                    self._write(f"data: {json.dumps(data)}\n\ndata: [DONE]\n\n")
+                else:
+                    content = "".join(self._generate(tokens))
+                    result = completion("chat.completion", {
+                        "message": {"role": "assistant", "content": content}, "finish_reason": "stop"})
+                    result["usage"] = usage
+                    self._reply(result)
+
+            def _generate(self, tokens):
+                time.sleep(fake.time_to_first_token)
+                for index, token in enumerate(tokens):
+                    if index:
+                        time.sleep(fake.token_delay())
+                    yield token
+
+            def _start_stream(self, content_type):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+            def _write(self, text):
+                self.wfile.write(text.encode("utf-8"))
+                self.wfile.flush()
+
+            def _reply(self, payload, status=200):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Ollama and OpenAI server with injected latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--response", default="ok", help="Canned output of every generation")
+    parser.add_argument("--response-file", help="File with the canned output, overrides --response")
+    parser.add_argument("--ttft", type=float, default=0.0, help="Seconds to the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--load-delay", type=float, default=0.0, help="Seconds to load another model")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    response = args.response
+    if args.response_file:
+        with open(args.response_file, "r") as f:
+            response = f.read()
+    fake = FakeLLMServer(response=response, time_to_first_token=args.ttft, tokens_per_second=args.tokens_per_second,
+                         load_delay=args.load_delay, error_rate=args.error_rate, error_status=args.error_status,
+                         seed=args.seed, host=args.host, port=args.port)
+    print(f"Fake LLM server listening on {fake.base_url} (Ollama: /api/*, OpenAI: /v1/chat/completions)")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
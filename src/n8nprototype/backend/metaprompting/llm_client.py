@@ -1,65 +1,456 @@
+import asyncio
 import os
-import requests
 import json
+import time
 from dotenv import load_dotenv
 
+from src.n8nprototype.backend.metaprompting.response_cache import is_deterministic, make_key
+from src.n8nprototype.backend.utils import telemetry, transport
+from src.n8nprototype.backend.utils.rate_limit import RateLimited, estimate_tokens, get_limiter, raise_if_rate_limited
+from src.n8nprototype.backend.utils.retry import RetryPolicy
+from src.n8nprototype.backend.utils.singleflight import SingleFlight
+
 # Load environment variables
 load_dotenv()
 
+# Sampling settings of the prompt generator, overridable per call
+OPENAI_GENERATION_OPTIONS = {"temperature": 0.7, "max_tokens": 500}
+
+# Concurrent identical deterministic calls of all clients share one upstream request
+flights = SingleFlight("llm")
+
+# Seconds to connect and to wait for the next bytes of a response; bounds stuck generations
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '10'))
+LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', '300'))
+# Total attempts per request, 1 disables retries
+LLM_RETRY_ATTEMPTS = int(os.getenv('LLM_RETRY_ATTEMPTS', '3'))
+
+
+class PromptStream:
+    """
+    Iterates over the tokens of a streamed Ollama generation as the JSONL chunks arrive.
+
+    Timing figures are filled in while iterating: time_to_first_token as soon as the first
+    token arrives, the eval counters once the final chunk (done=true) has been read.
+    """
+
+    def __init__(self, response, started_at):
+        """
+        :param response: The streaming requests.Response of /api/generate
+        :param started_at: time.perf_counter() value taken before the request was sent
+        """
+        self.response = response
+        self.started_at = started_at
+        self.time_to_first_token = None
+        self.eval_count = None
+        self.eval_duration = None
+        self.prompt_eval_count = None
+        self.prompt_eval_duration = None
+        self.total_duration = None
+        self.load_duration = None
+        self.done = False
+
+    @property
+    def tokens_per_second(self):
+        """
+        Generation speed reported by Ollama in the final chunk, None until it has arrived.
+        """
+        if not self.eval_count or not self.eval_duration:
+            return None
+        return self.eval_count / (self.eval_duration / 1e9)
+
+    def __iter__(self):
+        try:
+            for line in self.response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    chunk = json.loads(line.decode('utf-8'))
+                except json.JSONDecodeError:
+                    print(f"Failed to decode JSON: {line}")
+                    continue
+                token = chunk.get("response", "")
+                if token:
+                    if self.time_to_first_token is None:
+                        self.time_to_first_token = time.perf_counter() - self.started_at
+                    yield token
+                if chunk.get("done"):
+                    self.done = True
+                    self.eval_count = chunk.get("eval_count")
+                    self.eval_duration = chunk.get("eval_duration")
+                    self.prompt_eval_count = chunk.get("prompt_eval_count")
+                    self.prompt_eval_duration = chunk.get("prompt_eval_duration")
+                    self.total_duration = chunk.get("total_duration")
+                    self.load_duration = chunk.get("load_duration")
+                    break
+        finally:
+            self.response.close()
+
+
+class OllamaSession:
+    """
+    Runs one static prompt against many inputs through Ollama's /api/chat.
+
+    The prompt is sent as the system message and every input as a user message, so each
+    request starts with the same token prefix. Ollama keeps the evaluated prefix of the
+    loaded model and only evaluates the new input, instead of re-encoding the whole prompt
+    as the joined /api/generate request of run_prompt does. With keep_history the session
+    becomes a multi-turn conversation; the history only grows at the end, so the prefix
+    is reused as well.
+    """
+
+    def __init__(self, client, prompt, model="qwen2.5:14b", options=None, keep_history=False):
+        """
+        :param client: The LLMClient sending the requests
+        :param prompt: The static system prompt
+        :param model: The name of the model on Ollama server
+        :param options: Optional Ollama generation options
+        :param keep_history: Append every exchange to the conversation
+        """
+        self.client = client
+        self.prompt = prompt
+        self.model = model
+        self.options = options
+        self.keep_history = keep_history
+        self.messages = [{"role": "system", "content": prompt}]
+        self.last_result = {}
+
+    @property
+    def prompt_eval_count(self):
+        """
+        Number of prompt tokens Ollama evaluated for the last request. When the prefix was
+        reused this only counts the tokens of the new input.
+        """
+        return self.last_result.get("prompt_eval_count")
+
+    def run(self, input_text):
+        """
+        Run the session prompt with the given input.
+
+        :param input_text: The input text to process
+        :return: The model's response
+        :raises RateLimited: If Ollama still answers 429 after the retries
+        """
+        if self.keep_history:
+            return self._chat(input_text)
+        return self.client._cached_call(
+            ("chat", self.model, self.prompt, input_text), self.options,
+            lambda: self._chat(input_text),
+            lambda: self.client._process_default(self.prompt, input_text),
+        )
+
+    async def arun(self, input_text):
+        """
+        Asyncio variant of run. The blocking HTTP call runs in a worker thread.
+        """
+        return await asyncio.to_thread(self.run, input_text)
+
+    def _chat(self, input_text):
+        message = {"role": "user", "content": f"Input: {input_text}"}
+        data = {
+            "model": self.model,
+            "messages": self.messages + [message],
+            "stream": False
+        }
+        if self.options:
+            data["options"] = self.options
+        self.client._add_keep_alive(data)
+        try:
+            with telemetry.span("ollama.chat", model=self.model) as span:
+                response = self.client._post_ollama("/api/chat", self.model, json=data)
+                raise_if_rate_limited(response, "Ollama")
+                response.raise_for_status()
+                result = response.json()
+                span.set(prompt_tokens=result.get("prompt_eval_count"), completion_tokens=result.get("eval_count"))
+        except RateLimited:
+            raise
+        except Exception as e:
+            print(f"Error running session prompt with Ollama: {e}")
+            return self.client._process_default(self.prompt, input_text)
+        self.last_result = result
+        if self.client.residency is not None:
+            self.client.residency.observe(self.model, result)
+        content = result.get("message", {}).get("content", "")
+        if self.keep_history:
+            self.messages += [message, {"role": "assistant", "content": content}]
+        return content
+
+
 class LLMClient:
     """
     Client for interacting with LLM models.
     Supports o3-mini on OpenAI and Qwen on Ollama server.
+
+    The model is passed per call, so one client can be shared between threads
+    and asyncio tasks. ``model_name`` is only the default for generate_prompt.
+
+    With a cache (see response_cache.ResponseCache) identical deterministic calls, i.e. with
+    temperature 0 or a seed in their options, are answered without contacting OpenAI or
+    Ollama. With a residency manager (see ollama_residency.ModelResidencyManager) Ollama
+    requests carry keep_alive and batches are ordered to avoid model swaps. With a pool (see ollama_pool.OllamaPool) Ollama
+    requests are spread over several hosts instead of going to OLLAMA_BASE_URL.
+
+    Requests time out (LLM_CONNECT_TIMEOUT / LLM_READ_TIMEOUT) and are retried with jittered
+    backoff. With a hedge policy (see retry.HedgePolicy) a duplicate Ollama request is sent
+    when the first one is slower than the recent p95 of its path and model; with a pool the
+    duplicate goes to another host.
     """
     
-    def __init__(self, model_name="o3-mini"):
+    def __init__(self, model_name="o3-mini", cache=None, residency=None, pool=None, retry=None, hedge=None):
         """
         Initialize the LLM client with the specified model.
         
         :param model_name: Name of the model to use
+        :param cache: Optional response cache with get(key) and set(key, value)
+        :param residency: Optional ModelResidencyManager for the Ollama models
+        :param pool: Optional OllamaPool routing the Ollama requests
+        :param retry: RetryPolicy (default: LLM_RETRY_ATTEMPTS attempts)
+        :param hedge: Optional HedgePolicy for the Ollama requests
         """
         self.model_name = model_name
+        self.cache = cache
+        self.residency = residency
+        self.pool = pool
+        self.retry = retry or RetryPolicy(attempts=LLM_RETRY_ATTEMPTS)
+        self.hedge = hedge
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
         self.ollama_base_url = os.getenv('OLLAMA_BASE_URL', 'http://100.118.216.99:11434')
         
         if not self.openai_api_key and model_name == "o3-mini":
             print("WARNING: OPENAI_API_KEY not found in environment variables. Please set it in your .env file.")
     
-    def generate_prompt(self, input_text, expected_output):
+    def generate_prompt(self, input_text, expected_output, model=None, options=None):
         """
         Generate a prompt using the specified model.
         
         :param input_text: Input for the prompt
         :param expected_output: Expected output from the prompt
+        :param model: The model to use (default: the client's model_name)
+        :param options: Generation options overriding OPENAI_GENERATION_OPTIONS
         :return: Generated prompt text
+        :raises RateLimited: If OpenAI still answers 429 after the retries
         """
-        if self.model_name == "o3-mini":
-            return self._generate_with_openai(input_text, expected_output)
+        model = model or self.model_name
+        if model == "o3-mini":
+            options = {**OPENAI_GENERATION_OPTIONS, **(options or {})}
+            return self._cached_call(
+                ("generate", model, input_text, expected_output), options,
+                lambda: self._generate_with_openai(input_text, expected_output, options),
+                lambda: self._generate_default_prompt(input_text, expected_output),
+            )
         else:
             # Default fallback for other models
             return self._generate_default_prompt(input_text, expected_output)
     
-    def run_prompt(self, prompt, input_text, model="qwen2.5:14b"):
+    def run_prompt(self, prompt, input_text, model="qwen2.5:14b", options=None):
         """
         Run a prompt with the specified model.
         
         :param prompt: The prompt to run
         :param input_text: The input text to process
         :param model: The model to use (default: qwen on Ollama)
+        :param options: Optional Ollama generation options, e.g. {"temperature": 0}
         :return: The model's response
+        :raises RateLimited: If Ollama still answers 429 after the retries
         """
         if model.startswith("qwen"):
-            return self._run_with_ollama(prompt, input_text, model)
+            return self._cached_call(
+                ("run", model, prompt, input_text), options,
+                lambda: self._run_with_ollama(prompt, input_text, model, options),
+                lambda: self._process_default(prompt, input_text),
+            )
         else:
             # Fallback to default processing
             return self._process_default(prompt, input_text)
+
+    def stream_prompt(self, prompt, input_text, model="qwen2.5:14b", options=None):
+        """
+        Run a prompt on Ollama and stream the response token by token.
+
+        Usage::
+
+            stream = client.stream_prompt(prompt, input_text)
+            for token in stream:
+                render(token)
+            print(stream.time_to_first_token, stream.tokens_per_second)
+
+        :param prompt: The prompt to run
+        :param input_text: The input text to process
+        :param model: The name of the model on Ollama server
+        :param options: Optional Ollama generation options
+        :return: A PromptStream yielding the tokens
+        :raises requests.RequestException: If the request fails or Ollama answers with an error status
+        """
+        data = {
+            "model": model,
+            "prompt": f"{prompt}\n\nInput: {input_text}",
+            "stream": True
+        }
+        if options:
+            data["options"] = options
+        self._add_keep_alive(data)
+        started_at = time.perf_counter()
+        response = self._post_ollama("/api/generate", model, json=data, stream=True)
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+        return PromptStream(response, started_at)
+
+    def session(self, prompt, model="qwen2.5:14b", options=None, keep_history=False):
+        """
+        Open a session that evaluates the static prompt once and reuses it for many inputs.
+
+        :param prompt: The static system prompt
+        :param model: The name of the model on Ollama server
+        :param options: Optional Ollama generation options
+        :param keep_history: Keep the exchanges as a multi-turn conversation
+        :return: An OllamaSession
+        """
+        return OllamaSession(self, prompt, model, options, keep_history)
+
+    async def agenerate_prompt(self, input_text, expected_output, model=None, options=None):
+        """
+        Asyncio variant of generate_prompt. The blocking HTTP call runs in a worker thread.
+
+        :param input_text: Input for the prompt
+        :param expected_output: Expected output from the prompt
+        :param model: The model to use (default: the client's model_name)
+        :param options: Generation options overriding OPENAI_GENERATION_OPTIONS
+        :return: Generated prompt text
+        """
+        return await asyncio.to_thread(self.generate_prompt, input_text, expected_output, model, options)
+
+    async def arun_prompt(self, prompt, input_text, model="qwen2.5:14b", options=None):
+        """
+        Asyncio variant of run_prompt. The blocking HTTP call runs in a worker thread.
+
+        :param prompt: The prompt to run
+        :param input_text: The input text to process
+        :param model: The model to use (default: qwen on Ollama)
+        :param options: Optional Ollama generation options
+        :return: The model's response
+        """
+        # run_prompt coalesces identical calls, of threads and tasks alike
+        return await asyncio.to_thread(self.run_prompt, prompt, input_text, model, options)
+
+    async def run_prompt_many(self, items, max_concurrency=4):
+        """
+        Run a batch of prompts concurrently, with at most max_concurrency requests in flight.
+
+        Each item is either a tuple ``(prompt, input_text[, model])`` or a dict with the
+        keyword arguments of run_prompt. With a residency manager the items are started
+        grouped by model.
+
+        :param items: Iterable of prompt runs
+        :param max_concurrency: Upper bound of simultaneous requests
+        :return: List of responses in the order of items
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(item):
+            async with semaphore:
+                if isinstance(item, dict):
+                    return await self.arun_prompt(**item)
+                return await self.arun_prompt(*item)
+
+        items = list(items)
+        order = range(len(items))
+        if self.residency is not None:
+            order = self.residency.schedule([self._model_of(item) for item in items])
+        tasks = {index: asyncio.ensure_future(run_one(items[index])) for index in order}
+        await asyncio.gather(*tasks.values())
+        return [tasks[index].result() for index in range(len(items))]
+
+    @staticmethod
+    def _model_of(item):
+        if isinstance(item, dict):
+            return item.get("model", "qwen2.5:14b")
+        return item[2] if len(item) > 2 else "qwen2.5:14b"
+
+    def _post_ollama(self, path, model, **kwargs):
+        """
+        POSTs to the Ollama API with timeouts, retries and the optional hedge.
+
+        :param path: API path, e.g. "/api/generate"
+        :param model: The model of the request
+        :return: The requests.Response
+        """
+        kwargs.setdefault("timeout", (LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT))
+        if self.hedge is None:
+            return self.retry.call(lambda: self._send_ollama(path, model, **kwargs))
+
+        # Streams are timed to their headers, so they are hedged apart from complete responses
+        key = (path, model, bool(kwargs.get("stream")))
+
+        def hedged():
+            # Backends of this attempt, so the duplicate avoids the host of the first request
+            backends = []
+            send = lambda: self._send_ollama(path, model, backends, **kwargs)
+            return self.hedge.call(send, key=key)
+
+        return self.retry.call(hedged)
+
+    def _send_ollama(self, path, model, backends=None, **kwargs):
+        """
+        Sends one request to the Ollama API, on a backend of the pool if the client has one.
+        Each Ollama host has its own rate limits; a streamed response holds its slot until
+        it is closed or read to the end.
+
+        :param backends: Optional list of pool backends to avoid, the chosen one is appended
+        """
+        if self.pool is not None:
+            return self.pool.post(path, model, backends, **kwargs)
+        tokens = estimate_tokens(json.dumps(kwargs.get("json", "")))
+        return get_limiter("ollama", self.ollama_base_url).send(
+            lambda: transport.post(f"{self.ollama_base_url}{path}", **kwargs), tokens, kwargs.get("stream", False))
+
+    def _add_keep_alive(self, data):
+        if self.residency is not None:
+            keep_alive = self.residency.keep_alive_for(data["model"])
+            if keep_alive is not None:
+                data["keep_alive"] = keep_alive
+
+    def _cached_call(self, parts, options, call, fallback):
+        """
+        Answers a call from the cache if possible, otherwise runs it and stores the result.
+        Concurrent identical calls to the same Ollama host or pool are coalesced into one
+        upstream request. Calls requesting non-deterministic sampling bypass both, and
+        fallback answers are never stored.
+
+        :param parts: Parts identifying the call, e.g. kind, model, prompt and input
+        :param options: Generation options of the call
+        :param call: Function running the call
+        :param fallback: Function producing the fallback answer of the call
+        :return: The response
+        """
+        if not is_deterministic(options):
+            return call()
+        key = make_key(*parts, options=options)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        def call_and_store():
+            result = call()
+            if self.cache is not None and result != fallback():
+                self.cache.set(key, result)
+            return result
+
+        # Clients of different hosts must not share an answer in flight
+        return flights.do((repr(self.pool) if self.pool is not None else self.ollama_base_url, key), call_and_store)
     
-    def _generate_with_openai(self, input_text, expected_output):
+    def _generate_with_openai(self, input_text, expected_output, options=None):
         """
         Generate a prompt using OpenAI API (o3-mini).
         
         :param input_text: Input for the prompt
         :param expected_output: Expected output from the prompt
+        :param options: Generation options (default: OPENAI_GENERATION_OPTIONS)
         :return: Generated prompt text
         """
         if not self.openai_api_key:
@@ -91,35 +482,51 @@ class LLMClient:
                         """
                     }
                 ],
-                "temperature": 0.7,
-                "max_tokens": 500
+                **(options or OPENAI_GENERATION_OPTIONS)
             }
             
-            response = requests.post(url, headers=headers, data=json.dumps(data))
-            response.raise_for_status()
-            
-            result = response.json()
+            body = json.dumps(data)
+            tokens = estimate_tokens(body) + data.get("max_tokens", 0)
+            with telemetry.span("openai.chat", model=data["model"]) as span:
+                response = self.retry.call(lambda: self._send_openai(url, headers, body, tokens))
+                raise_if_rate_limited(response, "OpenAI")
+                response.raise_for_status()
+                
+                result = response.json()
+                usage = result.get("usage") or {}
+                span.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
             if "choices" in result and len(result["choices"]) > 0:
                 return result["choices"][0]["message"]["content"].strip()
             
             return self._generate_default_prompt(input_text, expected_output)
             
+        except RateLimited:
+            raise
         except Exception as e:
             print(f"Error generating prompt with OpenAI: {e}")
             return self._generate_default_prompt(input_text, expected_output)
     
-    def _run_with_ollama(self, prompt, input_text, model_name="qwen2.5:14b"):
+    def _send_openai(self, url, headers, body, tokens):
+        """
+        Sends one request to the OpenAI API within the OpenAI rate limits.
+        """
+        with get_limiter("openai").limit(tokens=tokens) as outcome:
+            response = transport.post(url, headers=headers, data=body,
+                                      timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT))
+            outcome.status = response.status_code
+            return response
+    
+    def _run_with_ollama(self, prompt, input_text, model_name="qwen2.5:14b", options=None):
         """
         Run a prompt using Ollama API.
         
         :param prompt: The prompt to run
         :param input_text: The input text to process
         :param model_name: The name of the model on Ollama server
+        :param options: Optional Ollama generation options
         :return: The model's response
         """
         try:
-            url = f"{self.ollama_base_url}/api/generate"
-            
             # Combine the prompt and input
             full_prompt = f"{prompt}\n\nInput: {input_text}"
             
@@ -128,46 +535,41 @@ class LLMClient:
                 "prompt": full_prompt,
                 "stream": False
             }
+            if options:
+                data["options"] = options
+            self._add_keep_alive(data)
             
-            print(f"Sending request to Ollama API: {url}")
-            print(f"Using model: {model_name}")
-            print(f"Request data: {json.dumps(data)}")
+            telemetry.log_payload(f"Request to Ollama API {self.pool or self.ollama_base_url}", data)
             
-            response = requests.post(url, json=data)
-            
-            # Print response status for debugging
-            print(f"Response status code: {response.status_code}")
+            with telemetry.span("ollama.generate", model=model_name) as span:
+                response = self._post_ollama("/api/generate", model_name, json=data)
+                if response.status_code == 200:
+                    result = response.json()
+                    span.set(prompt_tokens=result.get("prompt_eval_count"), completion_tokens=result.get("eval_count"))
+                else:
+                    span.set(status=response.status_code, message=response.text)
             
+            raise_if_rate_limited(response, "Ollama")
             if response.status_code != 200:
-                print(f"Error response: {response.text}")
-                
                 # Try with stream=true to see if that works
-                print("Retrying with stream=true...")
                 data["stream"] = True
-                
-                response = requests.post(url, json=data)
-                if response.status_code == 200:
-                    # Handle streaming response
-                    full_response = ""
-                    for line in response.iter_lines():
-                        if line:
-                            try:
-                                json_line = json.loads(line.decode('utf-8'))
-                                if 'response' in json_line:
-                                    full_response += json_line['response']
-                            except json.JSONDecodeError:
-                                print(f"Failed to decode JSON: {line}")
-                    
-                    print(f"Streaming response received, length: {len(full_response)}")
-                    return full_response
-                else:
-                    print(f"Retry failed with status code: {response.status_code}")
-                    return self._process_default(prompt, input_text)
+                with telemetry.span("ollama.generate", model=model_name, stream_fallback=True) as span:
+                    response = self._post_ollama("/api/generate", model_name, json=data, stream=True)
+                    if response.status_code == 200:
+                        # Handle streaming response
+                        return "".join(PromptStream(response, time.perf_counter()))
+                    span.set(status=response.status_code)
+                raise_if_rate_limited(response, "Ollama")
+                response.close()
+                return self._process_default(prompt, input_text)
             
             # Handle non-streaming response
-            result = response.json()
+            if self.residency is not None:
+                self.residency.observe(model_name, result)
             return result.get("response", "")
             
+        except RateLimited:
+            raise
         except Exception as e:
             print(f"Error running prompt with Ollama: {e}")
             return self._process_default(prompt, input_text)
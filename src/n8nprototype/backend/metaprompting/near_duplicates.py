@@ -0,0 +1,260 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from src.n8nprototype.backend.metaprompting.text_similarity import _analyze
+
+# Number of hash functions of a signature; the similarity estimate has a standard error of about 1 / sqrt(NUM_PERM)
+NUM_PERM = 128
+# Words per shingle; consecutive word triples make reordered texts differ, single words would not
+SHINGLE_SIZE = 3
+# Estimated Jaccard similarity of the shingles from which two texts count as near-duplicates
+DUPLICATE_THRESHOLD = 0.8
+# Candidates are checked against the threshold anyway, so a missed duplicate costs more than a false candidate
+FALSE_NEGATIVE_WEIGHT = 0.9
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    Splits a text into word n-grams, tokenized like cosine_text_similarity.
+
+    :param text: Text to split
+    :param size: Words per shingle; texts with fewer words give one shingle of all their words
+    :return: Set of shingles as strings, empty for a text without words
+    """
+    words = _analyze(text)
+    if not words:
+        return set()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[index:index + size]) for index in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures: for each of num_perm hash functions the smallest hash of
+    the shingles of a text. The share of positions at which two signatures agree estimates
+    the Jaccard similarity of the shingle sets.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, seed=1):
+        """
+        :param num_perm: Number of hash functions
+        :param shingle_size: Words per shingle
+        :param seed: Seed of the hash functions; only signatures of the same seed are comparable
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        generator = np.random.RandomState(seed)
+        # Multiply-shift hash functions: the high 32 bits of (a * x + b) mod 2**64, with odd a
+        self._a = generator.randint(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = generator.randint(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        """
+        :param text: Text to sign
+        :return: NumPy uint32 array of num_perm minimum hashes, None for a text without words
+        """
+        text_shingles = shingles(text, self.shingle_size)
+        if not text_shingles:
+            return None
+        hashes = np.array([int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+                           for shingle in text_shingles], dtype=np.uint64)
+        # uint64 arithmetic wraps around, which is the mod 2**64 of the hash functions
+        return ((np.outer(hashes, self._a) + self._b) >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+
+def estimate_similarity(signature1, signature2):
+    """
+    :return: Estimated Jaccard similarity of the shingles behind two signatures, between 0.0 and 1.0
+    """
+    return float(np.mean(signature1 == signature2))
+
+
+def optimal_bands(threshold, num_perm, false_negative_weight=FALSE_NEGATIVE_WEIGHT):
+    """
+    Splits a signature into bands for LSH. Two texts become candidates when all rows of
+    any band agree, which for a similarity s happens with probability 1 - (1 - s**rows)**bands.
+    The banding minimizes the weighted areas under that S-curve below the threshold (false
+    positives) and above 1 minus it above the threshold (false negatives).
+
+    :param threshold: Similarity from which texts should become candidates
+    :param num_perm: Signature length
+    :param false_negative_weight: Weight of missed duplicates between 0 and 1
+    :return: (bands, rows) with bands * rows <= num_perm
+    """
+    similarities = np.linspace(0.0, 1.0, 1001)
+    below = similarities < threshold
+
+    def error(banding):
+        bands, rows = banding
+        probabilities = 1.0 - (1.0 - similarities ** rows) ** bands
+        false_positives = probabilities[below].sum() if below.any() else 0.0
+        false_negatives = (1.0 - probabilities[~below]).sum()
+        return ((1.0 - false_negative_weight) * false_positives + false_negative_weight * false_negatives) \
+            / len(similarities)
+
+    return min(((num_perm // rows, rows) for rows in range(1, num_perm + 1)), key=error)
+
+
+class NearDuplicateIndex:
+    """
+    Finds near-duplicate texts, e.g. candidate prompts or outputs of a prompt search, in
+    sublinear time with MinHash signatures and locality sensitive hashing.
+
+    Each signature is cut into bands and every band is hashed into a bucket; a query only
+    compares its signature to the texts sharing at least one bucket with it, instead of to
+    every text inserted so far. A value can be stored with each text, so the score of a
+    duplicate candidate can be reused instead of paying for another LLM call::
+
+        duplicates = NearDuplicateIndex("prompts.sqlite3")
+        match = duplicates.find(prompt)
+        if match is not None:
+            similarity = match[2]
+        else:
+            similarity = score(run(prompt))
+            duplicates.insert(prompt_hash, prompt, similarity)
+
+    With a path, every insert is written to a SQLite file at once and the index is rebuilt
+    from it when opened again.
+    """
+
+    def __init__(self, path=None, threshold=DUPLICATE_THRESHOLD, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE,
+                 seed=1):
+        """
+        :param path: Path of the SQLite file, None keeps the index in memory only
+        :param threshold: Estimated Jaccard similarity from which texts count as near-duplicates
+        :param num_perm: Number of hash functions per signature
+        :param shingle_size: Words per shingle
+        :param seed: Seed of the hash functions
+        """
+        self.path = path
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        self.queries = 0
+        self.comparisons = 0
+        self._signatures = {}
+        self._values = {}
+        self._buckets = [defaultdict(set) for _ in range(self.bands)]
+        self._lock = threading.Lock()
+        self._connection = None
+        if path:
+            self._open(path)
+
+    def _open(self, path):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS signatures (key TEXT PRIMARY KEY, signature BLOB NOT NULL, value TEXT)"
+            )
+            settings = {"num_perm": self.hasher.num_perm, "shingle_size": self.hasher.shingle_size,
+                        "seed": self.hasher.seed}
+            for name, value in settings.items():
+                self._connection.execute("INSERT OR IGNORE INTO settings (name, value) VALUES (?, ?)",
+                                         (name, str(value)))
+            stored = dict(self._connection.execute("SELECT name, value FROM settings"))
+        if any(stored[name] != str(value) for name, value in settings.items()):
+            raise ValueError(f"Index {path} was built with {stored}, not {settings}")
+        for key, signature, value in self._connection.execute("SELECT key, signature, value FROM signatures"):
+            self._add(key, np.frombuffer(signature, dtype=np.uint32), json.loads(value) if value is not None else None)
+
+    def insert(self, key, text, value=None):
+        """
+        Adds a text to the index, replacing an earlier text of the same key. A text without
+        words, e.g. an empty or failed output, is not added: it has nothing to compare.
+
+        :param key: Identifier of the text, e.g. a content hash
+        :param text: The text
+        :param value: JSON serializable value returned with matches, e.g. a cached score
+        :return: The signature of the text, None if it has no words
+        """
+        signature = self.hasher.signature(text)
+        with self._lock:
+            if key in self._signatures:
+                self._remove(key)
+            if signature is None:
+                if self._connection is not None:
+                    with self._connection:
+                        self._connection.execute("DELETE FROM signatures WHERE key = ?", (key,))
+                return None
+            self._add(key, signature, value)
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO signatures (key, signature, value) VALUES (?, ?, ?)",
+                        (key, signature.tobytes(), json.dumps(value) if value is not None else None),
+                    )
+        return signature
+
+    def query(self, text, threshold=None):
+        """
+        :param text: Text to look up
+        :param threshold: Minimum estimated similarity (default: the threshold of the index)
+        :return: List of (key, estimated similarity, value), most similar first; empty for a text
+                 without words
+        """
+        threshold = self.threshold if threshold is None else threshold
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return []
+        with self._lock:
+            self.queries += 1
+            candidates = set()
+            for band, bucket in zip(self._bands(signature), self._buckets):
+                candidates |= bucket.get(band, set())
+            self.comparisons += len(candidates)
+            matches = [(key, estimate_similarity(signature, self._signatures[key]), self._values[key])
+                       for key in candidates]
+        matches = [match for match in matches if match[1] >= threshold]
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+    def find(self, text, threshold=None):
+        """
+        :return: The most similar (key, estimated similarity, value), None without a near-duplicate
+        """
+        matches = self.query(text, threshold)
+        return matches[0] if matches else None
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._signatures
+
+    def __len__(self):
+        with self._lock:
+            return len(self._signatures)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._signatures), "bands": self.bands, "rows": self.rows,
+                    "queries": self.queries, "comparisons": self.comparisons}
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _bands(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _add(self, key, signature, value):
+        self._signatures[key] = signature
+        self._values[key] = value
+        for band, bucket in zip(self._bands(signature), self._buckets):
+            bucket[band].add(key)
+
+    def _remove(self, key):
+        for band, bucket in zip(self._bands(self._signatures.pop(key)), self._buckets):
+            bucket[band].discard(key)
+            if not bucket[band]:
+                del bucket[band]
+        del self._values[key]
@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+
+import requests
+from dotenv import load_dotenv
+
+from src.n8nprototype.backend.utils import deadline, telemetry, transport
+from src.n8nprototype.backend.utils.circuit_breaker import CircuitOpenError
+from src.n8nprototype.backend.utils.rate_limit import estimate_tokens, get_limiter
+
+# Load environment variables
+load_dotenv()
+
+# Comma separated Ollama endpoints, e.g. "http://gpu-1:11434,http://gpu-2:11434"
+OLLAMA_BASE_URLS = os.getenv('OLLAMA_BASE_URLS', '')
+
+
+class OllamaBackend:
+    """
+    State of one Ollama endpoint as seen by the pool.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.healthy = True
+        self.outstanding = 0
+        self.loaded_models = set()
+        self.requests = 0
+        self.failures = 0
+
+    def __repr__(self):
+        return f"OllamaBackend({self.base_url!r}, healthy={self.healthy}, outstanding={self.outstanding})"
+
+
+class OllamaPool:
+    """
+    Spreads Ollama requests over several endpoints.
+
+    A request goes to the healthy backend with the fewest outstanding requests, preferring
+    backends that already have the requested model loaded. A backend that fails a request or
+    a health check leaves the rotation until a later health check succeeds. Health checks
+    call /api/ps, which also tells the pool which models each backend has loaded.
+
+    Every backend has its own rate limiter (see rate_limit.get_limiter), so an overloaded
+    host only slows down the requests sent to it.
+    """
+
+    def __init__(self, base_urls=None, health_interval=10.0, health_timeout=5.0):
+        """
+        :param base_urls: Ollama endpoints (default: OLLAMA_BASE_URLS)
+        :param health_interval: Seconds between background health checks
+        :param health_timeout: Seconds a health check may take
+        """
+        if base_urls is None:
+            base_urls = [url.strip() for url in OLLAMA_BASE_URLS.split(',') if url.strip()]
+        if not base_urls:
+            raise ValueError("OllamaPool needs at least one Ollama endpoint")
+        self.backends = [OllamaBackend(url) for url in base_urls]
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return f"OllamaPool({[backend.base_url for backend in self.backends]!r})"
+
+    def acquire(self, model=None, exclude=()):
+        """
+        Picks a backend for a request and counts the request as outstanding on it.
+        When no backend is healthy all of them are tried, so a recovered host is found
+        even before the next health check.
+
+        :param model: The model of the request
+        :param exclude: Backends to avoid, e.g. the host of a request being hedged; used only
+                        when there is no other backend
+        :return: The chosen OllamaBackend, to be passed to release()
+        """
+        with self._lock:
+            others = [backend for backend in self.backends if backend not in exclude] or self.backends
+            candidates = [backend for backend in others if backend.healthy] or others
+            backend = min(
+                candidates,
+                key=lambda backend: (model not in backend.loaded_models, backend.outstanding),
+            )
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend, ok=True, model=None):
+        """
+        Finishes a request acquired from the pool.
+
+        :param backend: The backend returned by acquire()
+        :param ok: False takes the backend out of rotation until its next successful health check
+        :param model: The model of a successful request, now known to be loaded on the backend
+        """
+        with self._lock:
+            backend.outstanding -= 1
+            if ok:
+                if model:
+                    backend.loaded_models.add(model)
+            else:
+                backend.failures += 1
+                backend.healthy = False
+
+    def post(self, path, model=None, exclude=None, **kwargs):
+        """
+        POSTs to the Ollama API on the best backend for the model, within the rate limits of
+        that backend. A streamed response counts as outstanding and holds its rate limiter
+        slot until it is closed or read to the end.
+
+        :param path: API path, e.g. "/api/generate"
+        :param model: The model of the request
+        :param exclude: Optional list of backends to avoid; the chosen backend is appended, so
+                        a duplicate request passing the same list goes to another host
+        :return: The requests.Response
+        """
+        backend = self.acquire(model, exclude or ())
+        if exclude is not None:
+            exclude.append(backend)
+        tokens = estimate_tokens(json.dumps(kwargs.get("json", "")))
+        try:
+            response = get_limiter("ollama", backend.base_url).send(
+                lambda: transport.post(f"{backend.base_url}{path}", **kwargs), tokens, kwargs.get("stream", False))
+        except Exception as e:
+            self.release(backend, ok=not _host_failed(e))
+            raise
+        ok = response.status_code < 500
+        release = lambda: self.release(backend, ok=ok, model=model if ok else None)
+        if kwargs.get("stream"):
+            # A stream keeps the backend busy until it is closed or read to the end
+            transport.on_close(response, release)
+        else:
+            release()
+        return response
+
+    def check_health(self):
+        """
+        Checks every backend once and updates its health and loaded models.
+        """
+        for backend in self.backends:
+            try:
+                response = transport.get(f"{backend.base_url}/api/ps", timeout=self.health_timeout)
+                response.raise_for_status()
+                loaded = {model["name"] for model in response.json().get("models", [])}
+                healthy = True
+            except Exception as e:
+                telemetry.health_check_failures.inc(host=backend.base_url)
+                error = e
+                loaded = set()
+                healthy = False
+            with self._lock:
+                was_healthy = backend.healthy
+                backend.healthy = healthy
+                backend.loaded_models = loaded
+            # Log transitions only, a host that stays down is counted in the metrics
+            if was_healthy and not healthy:
+                telemetry.logger.warning("Ollama backend %s is unhealthy: %s", backend.base_url, error)
+            elif healthy and not was_healthy:
+                telemetry.logger.info("Ollama backend %s is healthy again", backend.base_url)
+
+    def start(self):
+        """
+        Starts the background health checks.
+        """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run_health_checks, name="ollama-pool-health", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the background health checks.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run_health_checks(self):
+        while not self._stop.is_set():
+            self.check_health()
+            self._stop.wait(self.health_interval)
+
+    def stats(self):
+        """
+        :return: List with health, load and loaded models of every backend
+        """
+        with self._lock:
+            return [
+                {
+                    "base_url": backend.base_url,
+                    "healthy": backend.healthy,
+                    "outstanding": backend.outstanding,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "loaded_models": sorted(backend.loaded_models),
+                }
+                for backend in self.backends
+            ]
+
+
+def _host_failed(error):
+    """
+    :param error: The exception raised while POSTing to a backend
+    :return: Whether it says the backend is unhealthy, rather than the caller's budget ran out
+    """
+    if isinstance(error, (deadline.DeadlineExceeded, CircuitOpenError)):
+        return False
+    if isinstance(error, requests.Timeout):
+        # A timeout that the caller's deadline cut short says nothing about the host
+        return deadline.remaining() != 0
+    return isinstance(error, requests.RequestException)
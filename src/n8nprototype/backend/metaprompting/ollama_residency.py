@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from src.n8nprototype.backend.utils import transport
+
+# Load environment variables
+load_dotenv()
+
+# Comma separated models loaded at startup, e.g. "qwen2.5:14b,deepseek-r1:32b"
+OLLAMA_WARMUP_MODELS = os.getenv('OLLAMA_WARMUP_MODELS', '')
+# How long Ollama keeps a hot model in memory after the last request; "-1" pins it
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+
+
+class ModelResidencyManager:
+    """
+    Keeps the models we use resident on the Ollama server.
+
+    - warm_up() loads the configured models with an empty generate call, so the first real
+      request does not pay the model load.
+    - keep_alive_for() tells LLMClient which keep_alive to send, pinning hot models.
+    - schedule() orders queued work by model, so the server swaps models as rarely as possible.
+    - load_times collects the load_duration Ollama reports for every observed response.
+    """
+
+    def __init__(self, base_url=None, models=None, keep_alive=OLLAMA_KEEP_ALIVE, cold_keep_alive=None):
+        """
+        :param base_url: Base URL of the Ollama server (default: OLLAMA_BASE_URL)
+        :param models: Hot models to warm up and pin (default: OLLAMA_WARMUP_MODELS)
+        :param keep_alive: keep_alive sent for hot models
+        :param cold_keep_alive: keep_alive sent for other models, None leaves Ollama's default
+        """
+        self.base_url = base_url or os.getenv('OLLAMA_BASE_URL', 'http://100.118.216.99:11434')
+        if models is None:
+            models = [model.strip() for model in OLLAMA_WARMUP_MODELS.split(',') if model.strip()]
+        self.models = list(models)
+        self.keep_alive = keep_alive
+        self.cold_keep_alive = cold_keep_alive
+        self.load_times = {}
+        self.last_model = None
+        self._lock = threading.Lock()
+
+    def warm_up(self, models=None, timeout=600):
+        """
+        Loads models into memory by sending a generate request without a prompt.
+
+        :param models: Models to load (default: the hot models)
+        :param timeout: Seconds to wait for one model to load
+        :return: Dict mapping each model to the seconds its warm-up took, None if it failed
+        """
+        durations = {}
+        for model in models or self.models:
+            started_at = time.perf_counter()
+            try:
+                response = transport.post(
+                    f"{self.base_url}/api/generate",
+                    json={"model": model, "keep_alive": self.keep_alive_for(model), "stream": False},
+                    timeout=timeout,
+                )
+                response.raise_for_status()
+                self.observe(model, response.json())
+                durations[model] = time.perf_counter() - started_at
+            except Exception as e:
+                print(f"Error warming up model {model}: {e}")
+                durations[model] = None
+        return durations
+
+    def loaded_models(self):
+        """
+        Asks Ollama which models are currently in memory.
+
+        :return: List of model names, empty if the server cannot be reached
+        """
+        try:
+            response = transport.get(f"{self.base_url}/api/ps", timeout=10)
+            response.raise_for_status()
+            return [model["name"] for model in response.json().get("models", [])]
+        except Exception as e:
+            print(f"Error listing loaded models: {e}")
+            return []
+
+    def keep_alive_for(self, model):
+        """
+        :param model: The model of a request
+        :return: The keep_alive to send with the request, None to send none
+        """
+        return self.keep_alive if model in self.models else self.cold_keep_alive
+
+    def observe(self, model, result):
+        """
+        Records the load time reported in an Ollama response.
+
+        :param model: The model of the request
+        :param result: The decoded JSON response (or the final chunk of a stream)
+        """
+        load_duration = result.get("load_duration")
+        with self._lock:
+            self.last_model = model
+            if load_duration is not None:
+                self.load_times.setdefault(model, []).append(load_duration / 1e9)
+
+    def schedule(self, models):
+        """
+        Orders queued work so that requests for the same model run back to back, starting
+        with the model used last, then the hot models, then the rest in order of arrival.
+
+        :param models: The model of each queued item
+        :return: Indices into models in the order the items should run
+        """
+        first_seen = {}
+        for index, model in enumerate(models):
+            first_seen.setdefault(model, index)
+
+        def rank(model):
+            if model == self.last_model:
+                return 0, 0
+            if model in self.models:
+                return 1, self.models.index(model)
+            return 2, first_seen[model]
+
+        return sorted(range(len(models)), key=lambda index: (rank(models[index]), index))
+
+    def report(self):
+        """
+        :return: Dict mapping each model to count, mean and max of the observed load times
+        """
+        with self._lock:
+            return {
+                model: {"count": len(times), "mean": sum(times) / len(times), "max": max(times)}
+                for model, times in self.load_times.items() if times
+            }
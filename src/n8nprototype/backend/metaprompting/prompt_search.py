@@ -0,0 +1,277 @@
+import asyncio
+import os
+import time
+
+from dotenv import load_dotenv
+
+from src.n8nprototype.backend.metaprompting.near_duplicates import NearDuplicateIndex
+from src.n8nprototype.backend.metaprompting.text_similarity import json_similarity
+
+# Load environment variables
+load_dotenv()
+
+# Candidate pipelines running at the same time
+PROMPT_SEARCH_CONCURRENCY = int(os.getenv('PROMPT_SEARCH_CONCURRENCY', '10'))
+
+
+class Candidate:
+    """
+    One generate -> run -> score pipeline of a prompt search.
+
+    timings holds the seconds spent in each stage that ran ("generate", "run", "score").
+    A candidate whose prompt is a near-duplicate of an earlier one is not run; it takes
+    output and similarity of that candidate and names it in duplicate_of. A resumed
+    candidate was read from the experiment store instead of being run.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.prompt = None
+        self.output = None
+        self.similarity = None
+        self.duplicate_of = None
+        self.resumed = False
+        self.error = None
+        self.timings = {}
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        :param record: A result of ExperimentStore.results
+        """
+        candidate = cls(record["iteration"])
+        candidate.prompt = record["prompt"]
+        candidate.output = record["output"]
+        candidate.similarity = record["similarity"]
+        candidate.timings = record["timings"]
+        candidate.duplicate_of = record.get("duplicate_of")
+        candidate.resumed = True
+        return candidate
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "prompt": self.prompt,
+            "output": self.output,
+            "similarity": self.similarity,
+            "duplicate_of": self.duplicate_of,
+            "resumed": self.resumed,
+            "error": repr(self.error) if self.error else None,
+            "timings": dict(self.timings),
+        }
+
+
+class SearchResult:
+    """
+    The finished candidates of a prompt search, best first. A near-duplicate ranks after
+    the candidate it copies, so best is always a prompt that was actually run.
+    """
+
+    def __init__(self, candidates, cancelled, stopped_early, elapsed, run_id=None):
+        """
+        :param candidates: Finished candidates, failed ones included
+        :param cancelled: Number of candidates cancelled after the target was reached
+        :param stopped_early: True if a candidate reached the target similarity
+        :param elapsed: Seconds the search took
+        :param run_id: Id of the run in the experiment store, None without a store
+        """
+        self.candidates = sorted(candidates, key=lambda candidate: (
+            candidate.similarity is None, -(candidate.similarity or 0.0), candidate.duplicate_of is not None,
+            candidate.index))
+        self.cancelled = cancelled
+        self.stopped_early = stopped_early
+        self.elapsed = elapsed
+        self.run_id = run_id
+
+    @property
+    def best(self):
+        """
+        :return: The candidate with the highest similarity, None if every candidate failed
+        """
+        if not self.candidates or self.candidates[0].similarity is None:
+            return None
+        return self.candidates[0]
+
+    def stage_totals(self):
+        """
+        :return: Seconds spent per stage, summed over the candidates
+        """
+        totals = {}
+        for candidate in self.candidates:
+            for stage, seconds in candidate.timings.items():
+                totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+
+class PromptSearch:
+    """
+    Searches for the prompt whose output comes closest to an expected output, running the
+    generate -> run -> score pipelines of the candidates concurrently instead of one after
+    the other (the loop of design.md)::
+
+        search = PromptSearch(client, prompt_model="o3-mini", target_model="qwen2.5:14b")
+        result = search.search(input_text, expected_output, candidates=10)
+        print(result.best.similarity, result.best.prompt)
+
+    At most concurrency pipelines are in flight. As soon as a candidate reaches
+    target_similarity the outstanding pipelines are cancelled: those waiting for a slot
+    never start, and no further stage of the running ones is started (an LLM request
+    already sent finishes in its worker thread, its result is dropped). Near-duplicate
+    prompts (see near_duplicates.NearDuplicateIndex) are not run again but wait for the
+    result of the candidate they duplicate.
+
+    Scoring runs in a worker thread, or in the worker processes of a ScoringExecutor if
+    one is given, so the event loop keeps the LLM calls going while a candidate is scored.
+
+    With an experiment store (see experiment_store.ExperimentStore) every finished candidate
+    is recorded at once, and searching again with the run_id of an interrupted search only
+    runs the candidates it has not finished.
+    """
+
+    def __init__(self, client, prompt_model=None, target_model="qwen2.5:14b", concurrency=PROMPT_SEARCH_CONCURRENCY,
+                 target_similarity=None, scorer=json_similarity, scoring=None, deduplicate=True, store=None,
+                 options=None):
+        """
+        :param client: LLMClient, or any object with agenerate_prompt and arun_prompt
+        :param prompt_model: Model generating the prompts (default: the client's model_name)
+        :param target_model: Model running the prompts
+        :param concurrency: Upper bound of pipelines in flight
+        :param target_similarity: Similarity that ends the search, None runs every candidate
+        :param scorer: Function (output, reference) -> float; module level if scoring is given
+        :param scoring: Optional ScoringExecutor running scorer in its worker processes
+        :param deduplicate: Reuse the result of a candidate for near-duplicates of its prompt
+        :param store: Optional ExperimentStore recording the candidates
+        :param options: Generation options of the prompt runs; deterministic ones, e.g.
+                        {"temperature": 0}, let a client with a cache answer repeated runs
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.client = client
+        self.prompt_model = prompt_model
+        self.target_model = target_model
+        self.concurrency = concurrency
+        self.target_similarity = target_similarity
+        self.scorer = scorer
+        self.scoring = scoring
+        self.deduplicate = deduplicate
+        self.store = store
+        self.options = options
+
+    def search(self, input_text, expected_output, candidates=10, reference=None, run_id=None):
+        """
+        Blocking variant of asearch, for callers without an event loop.
+        """
+        # Unlike asyncio.run, closing the loop does not wait for the worker threads of
+        # cancelled candidates, so an early stop returns at once
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.asearch(input_text, expected_output, candidates, reference, run_id))
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    async def asearch(self, input_text, expected_output, candidates=10, reference=None, run_id=None):
+        """
+        Runs the candidate pipelines.
+
+        :param input_text: Input of the prompts
+        :param expected_output: Output the prompts should produce
+        :param candidates: Number of candidate prompts to generate
+        :param reference: What the outputs are scored against (default: expected_output), e.g.
+                          the expected JSON parsed once
+        :param run_id: Run of the experiment store to resume, None starts a new one
+        :return: SearchResult
+        """
+        started_at = time.perf_counter()
+        reference = expected_output if reference is None else reference
+        duplicates = NearDuplicateIndex() if self.deduplicate else None
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = {}
+        finished = []
+        reached = asyncio.Event()
+
+        done = {}
+        if self.store is not None:
+            run_id = self.store.start_run(input_text, expected_output, self.target_model, self.prompt_model, run_id)
+            done = {index: record for index, record in self.store.completed(run_id).items() if index < candidates}
+        for record in done.values():
+            candidate = Candidate.from_record(record)
+            results[candidate.index] = asyncio.get_running_loop().create_future()
+            results[candidate.index].set_result((candidate.output, candidate.similarity))
+            if duplicates is not None and candidate.duplicate_of is None:
+                duplicates.insert(str(candidate.index), candidate.prompt)
+            finished.append(candidate)
+            if self._reached(candidate):
+                reached.set()
+
+        async def pipeline(candidate):
+            async with semaphore:
+                if reached.is_set():
+                    return
+                await self._run_candidate(candidate, input_text, expected_output, reference, duplicates, results)
+            finished.append(candidate)
+            if self.store is not None and candidate.error is None:
+                await asyncio.to_thread(self.store.record, run_id, candidate.index, candidate.prompt, candidate.output,
+                                        candidate.similarity, candidate.timings, candidate.duplicate_of)
+            if self._reached(candidate):
+                reached.set()
+
+        tasks = [asyncio.ensure_future(pipeline(Candidate(index))) for index in range(candidates) if index not in done]
+        waiter = asyncio.ensure_future(reached.wait())
+        while not reached.is_set() and not all(task.done() for task in tasks):
+            await asyncio.wait([task for task in tasks if not task.done()] + [waiter],
+                               return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, waiter, return_exceptions=True)
+
+        return SearchResult(finished, candidates - len(finished), reached.is_set(), time.perf_counter() - started_at,
+                            run_id if self.store is not None else None)
+
+    async def _run_candidate(self, candidate, input_text, expected_output, reference, duplicates, results):
+        """
+        Runs the stages of one candidate, recording its timings. Errors are kept on the
+        candidate instead of ending the search.
+        """
+        results[candidate.index] = asyncio.get_running_loop().create_future()
+        try:
+            started_at = time.perf_counter()
+            candidate.prompt = await self.client.agenerate_prompt(input_text, expected_output, self.prompt_model)
+            candidate.timings["generate"] = time.perf_counter() - started_at
+
+            match = duplicates.find(candidate.prompt) if duplicates is not None else None
+            if match is not None:
+                candidate.duplicate_of = int(match[0])
+                candidate.output, candidate.similarity = await asyncio.shield(results[candidate.duplicate_of])
+            else:
+                if duplicates is not None:
+                    duplicates.insert(str(candidate.index), candidate.prompt)
+                started_at = time.perf_counter()
+                candidate.output = await self.client.arun_prompt(candidate.prompt, input_text, self.target_model,
+                                                             self.options)
+                candidate.timings["run"] = time.perf_counter() - started_at
+
+                started_at = time.perf_counter()
+                candidate.similarity = await self._score(candidate.output, reference)
+                candidate.timings["score"] = time.perf_counter() - started_at
+        except asyncio.CancelledError:
+            results[candidate.index].cancel()
+            raise
+        except Exception as e:
+            print(f"Candidate {candidate.index} failed: {e}")
+            candidate.error = e
+            results[candidate.index].set_exception(e)
+            # Nobody may wait for this future, so the exception must not be reported as unretrieved
+            results[candidate.index].exception()
+            return
+        results[candidate.index].set_result((candidate.output, candidate.similarity))
+
+    async def _score(self, output, reference):
+        if self.scoring is not None:
+            return await self.scoring.ascore(output, reference, self.scorer)
+        return await asyncio.to_thread(self.scorer, output, reference)
+
+    def _reached(self, candidate):
+        return self.target_similarity is not None and candidate.similarity is not None \
+            and candidate.similarity >= self.target_similarity
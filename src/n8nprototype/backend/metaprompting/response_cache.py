@@ -0,0 +1,210 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_key(*parts, options=None):
+    """
+    Builds a cache key from the parts of a request, e.g. kind, model, prompt and input.
+
+    :param parts: JSON serializable parts identifying the request
+    :param options: Generation options sent with the request
+    :return: Hex digest of the request
+    """
+    payload = json.dumps({"parts": parts, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_deterministic(options):
+    """
+    Tells whether a request with the given generation options can be answered from a cache.
+
+    Only an explicit temperature of 0 or a fixed seed makes a response reproducible. Without
+    them the server samples with its default temperature (Ollama: 0.8), so requests without
+    options are not deterministic.
+
+    :param options: Generation options, may be None
+    :return: True if the response may be cached
+    """
+    if not options:
+        return False
+    if options.get("temperature") == 0:
+        return True
+    return options.get("seed") is not None
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache with least-recently-used eviction and an optional TTL.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        """
+        :param max_entries: Number of entries kept before the least recently used is evicted
+        :param ttl: Seconds an entry stays valid, None for no expiry
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class SQLiteCache:
+    """
+    Thread-safe on-disk cache in a SQLite file, surviving process restarts.
+    """
+
+    def __init__(self, path, max_entries=100_000, ttl=None):
+        """
+        :param path: Path of the SQLite database file
+        :param max_entries: Number of entries kept before the least recently used are evicted
+        :param ttl: Seconds an entry stays valid, None for no expiry
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+            )
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                value, created_at = row
+                if self.ttl is None or created_at + self.ttl > now:
+                    self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                    self.hits += 1
+                    return value
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: an in-memory LRU in front of an optional SQLite store.
+
+    Hits on the store are promoted into the LRU. Any object with get/set/stats can be
+    used in place of this class by LLMClient.
+    """
+
+    def __init__(self, path=None, memory_entries=1024, disk_entries=100_000, ttl=None):
+        """
+        :param path: Path of the SQLite file, None keeps the cache in memory only
+        :param memory_entries: Size of the in-memory LRU
+        :param disk_entries: Size of the SQLite store
+        :param ttl: Seconds an entry stays valid, None for no expiry
+        """
+        self.memory = LRUCache(max_entries=memory_entries, ttl=ttl)
+        self.disk = SQLiteCache(path, max_entries=disk_entries, ttl=ttl) if path else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses}
+        stats["memory"] = self.memory.stats()
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,157 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+from src.n8nprototype.backend.metaprompting.text_similarity import combined_similarity
+
+# Load environment variables
+load_dotenv()
+
+# Worker processes scoring similarities, 0 means one per CPU
+SCORING_WORKERS = int(os.getenv('SCORING_WORKERS', '0'))
+# Text pairs sent to a worker in one job
+SCORING_CHUNK_SIZE = int(os.getenv('SCORING_CHUNK_SIZE', '4'))
+# How workers are started; "spawn" is safe in processes that already run threads
+SCORING_START_METHOD = os.getenv('SCORING_START_METHOD', 'spawn')
+
+
+def _score_chunk(scorer, pairs):
+    return [scorer(text1, text2) for text1, text2 in pairs]
+
+
+class ScoringExecutor:
+    """
+    Scores text similarities in a pool of worker processes.
+
+    combined_similarity is CPU bound (SequenceMatcher plus a TF-IDF fit per call), so scoring
+    on the calling thread holds the GIL and stalls the LLM calls running in other threads or
+    on the event loop. In worker processes the scoring of one candidate overlaps with the
+    generation of the next::
+
+        with ScoringExecutor() as scoring:
+            futures = [scoring.submit(client.run_prompt(prompt, input_text), expected)
+                       for prompt in prompts]
+            scores = [future.result() for future in futures]
+
+    Pairs passed to score_many are sent in chunks of chunk_size, so the pickling and IPC
+    overhead is paid per chunk instead of per pair.
+    """
+
+    def __init__(self, max_workers=None, chunk_size=SCORING_CHUNK_SIZE, scorer=combined_similarity,
+                 start_method=SCORING_START_METHOD):
+        """
+        :param max_workers: Number of worker processes (default: SCORING_WORKERS or one per CPU)
+        :param chunk_size: Pairs per job in score_many
+        :param scorer: Module level function (text1, text2) -> float, it is pickled to the workers
+        :param start_method: multiprocessing start method of the workers
+        """
+        self.max_workers = max_workers or SCORING_WORKERS or os.cpu_count() or 1
+        self.chunk_size = max(1, chunk_size)
+        self.scorer = scorer
+        self.start_method = start_method
+        self.jobs = 0
+        self.pairs = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    @property
+    def pool(self):
+        """
+        The process pool, started on first use.
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+            return self._pool
+
+    def submit(self, text1, text2, scorer=None):
+        """
+        Scores one pair in a worker process.
+
+        :param scorer: Module level function scoring this pair instead of the executor's scorer
+        :return: concurrent.futures.Future of the similarity
+        """
+        return self._unwrap(self._submit_chunk([(text1, text2)], scorer))
+
+    def submit_many(self, pairs):
+        """
+        Scores pairs in chunks of chunk_size.
+
+        :param pairs: Iterable of (text1, text2)
+        :return: One concurrent.futures.Future per pair, in the order of the pairs
+        """
+        pairs = list(pairs)
+        futures = []
+        for start in range(0, len(pairs), self.chunk_size):
+            chunk = pairs[start:start + self.chunk_size]
+            future = self._submit_chunk(chunk)
+            futures += [self._unwrap(future, index) for index in range(len(chunk))]
+        return futures
+
+    def score_many(self, pairs):
+        """
+        :param pairs: Iterable of (text1, text2)
+        :return: List of similarities in the order of the pairs
+        """
+        return [future.result() for future in self.submit_many(pairs)]
+
+    async def ascore(self, text1, text2, scorer=None):
+        """
+        Asyncio variant of submit; the event loop keeps running while a worker scores.
+        """
+        return await asyncio.wrap_future(self.submit(text1, text2, scorer))
+
+    async def ascore_many(self, pairs):
+        """
+        Asyncio variant of score_many.
+        """
+        return list(await asyncio.gather(*(asyncio.wrap_future(future) for future in self.submit_many(pairs))))
+
+    def shutdown(self, wait=True):
+        """
+        Stops the worker processes. The executor can be used again afterwards.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=not wait)
+
+    def stats(self):
+        return {"workers": self.max_workers, "jobs": self.jobs, "pairs": self.pairs}
+
+    def _submit_chunk(self, pairs, scorer=None):
+        with self._lock:
+            self.jobs += 1
+            self.pairs += len(pairs)
+        return self.pool.submit(_score_chunk, scorer or self.scorer, pairs)
+
+    @staticmethod
+    def _unwrap(chunk, index=0):
+        """
+        :return: Future of the result at index of a chunk future
+        """
+        future = Future()
+
+        def done(chunk):
+            if chunk.cancelled():
+                future.cancel()
+            elif chunk.exception() is not None:
+                future.set_exception(chunk.exception())
+            else:
+                future.set_result(chunk.result()[index])
+
+        chunk.add_done_callback(done)
+        return future
@@ -1,17 +1,82 @@
+import copy
+import json
+import math
+import re
+from collections import Counter
 from difflib import SequenceMatcher
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
-def simple_similarity(text1, text2):
+from src.n8nprototype.backend.utils import telemetry
+
+# IDF a TfidfVectorizer fitted on two texts gives a word found in only one of them
+# (smooth_idf: ln(3 / 2) + 1); a word found in both gets 1
+PAIR_IDF = np.log(1.5) + 1.0
+
+# Splits texts into words exactly like the TfidfVectorizer of cosine_text_similarity
+_analyze = CountVectorizer().build_analyzer()
+
+# Feature count of the hashing mode; memory per text is bounded by its words, not by a vocabulary
+HASHING_FEATURES = 2 ** 20
+# Texts vectorized at once by the hashing mode
+HASHING_CHUNK_SIZE = 256
+
+# Stateless word counter of the hashing mode, tokenizing like the TfidfVectorizer
+_hasher = HashingVectorizer(n_features=HASHING_FEATURES, alternate_sign=False, norm=None, dtype=np.float32)
+# Characters that may continue a word across two chunks of a streamed text
+_WORD_TAIL = re.compile(r"\w+$")
+
+# Weights of the SequenceMatcher ratio and the cosine similarity in combined_similarity
+SIMPLE_WEIGHT = 0.4
+COSINE_WEIGHT = 0.6
+
+# A ```json fenced block in a model output
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+# Keys aligning the elements of two JSON lists, tried in this order before falling back to the position
+ALIGNMENT_KEYS = (("id", "name"), ("name",), ("id",))
+
+rejections = telemetry.registry.counter(
+    "similarity_rejections_total",
+    "Comparisons stopped early because the score could not reach min_score, by the bound that showed it")
+full_comparisons = telemetry.registry.counter(
+    "similarity_full_comparisons_total", "Comparisons that computed the full SequenceMatcher ratio")
+
+
+def bounded_ratio(matcher, min_score=None, weight=1.0, rest=0.0):
+    """
+    The ratio of a SequenceMatcher, unless its cheap upper bounds already show that
+    weight * ratio + rest stays below min_score. SequenceMatcher.ratio() is quadratic in the
+    worst case, real_quick_ratio() is constant and quick_ratio() linear in the text length.
+
+    :param matcher: SequenceMatcher with both texts set
+    :param min_score: Score the caller needs, None always computes the ratio
+    :param weight: Weight of the ratio in the caller's score
+    :param rest: The rest of the caller's score
+    :return: The ratio, or an upper bound of it if the score cannot reach min_score
+    """
+    if min_score is not None:
+        for stage, bound in (("real_quick_ratio", matcher.real_quick_ratio), ("quick_ratio", matcher.quick_ratio)):
+            upper = bound()
+            if weight * upper + rest < min_score:
+                rejections.inc(stage=stage)
+                return upper
+    full_comparisons.inc()
+    return matcher.ratio()
+
+def simple_similarity(text1, text2, min_score=None):
     """
     Calculate the similarity between two texts using SequenceMatcher.
     
     :param text1: First text to compare
     :param text2: Second text to compare
+    :param min_score: Optional score the caller needs, e.g. the best score so far. If the
+                      similarity is certainly below it, an upper bound below min_score is
+                      returned instead, without the expensive comparison.
     :return: Float value between 0.0 and 1.0 representing similarity
     """
-    return SequenceMatcher(None, text1, text2).ratio()
+    return bounded_ratio(SequenceMatcher(None, text1, text2), min_score)
 
 def cosine_text_similarity(text1, text2):
     """
@@ -36,21 +101,408 @@ def cosine_text_similarity(text1, text2):
         # Fallback to simple similarity
         return simple_similarity(text1, text2)
 
-def combined_similarity(text1, text2):
+def combined_similarity(text1, text2, min_score=None):
     """
     Calculate a combined similarity score using multiple methods.
     
     :param text1: First text to compare
     :param text2: Second text to compare
+    :param min_score: Optional score the caller needs, e.g. the best score so far. If the
+                      similarity is certainly below it, an upper bound below min_score is
+                      returned instead, without the expensive comparison.
     :return: Float value between 0.0 and 1.0 representing similarity
     """
+    if min_score is not None:
+        matcher = SequenceMatcher(None, text1, text2)
+        return _bounded_combined(matcher, lambda: cosine_text_similarity(text1, text2), min_score)
+
     # Calculate similarity using different methods
     simple_sim = simple_similarity(text1, text2)
     
     try:
         cosine_sim = cosine_text_similarity(text1, text2)
         # Combine the scores (weighted average)
-        return (0.4 * simple_sim) + (0.6 * cosine_sim)
+        return (SIMPLE_WEIGHT * simple_sim) + (COSINE_WEIGHT * cosine_sim)
     except:
         # If cosine similarity fails, return simple similarity
         return simple_sim
+
+def _bounded_combined(matcher, cosine, min_score):
+    """
+    Combined similarity with early exits: the length bound of the ratio assuming a perfect
+    cosine first, then the cosine similarity as pre-filter, then the bounds of the ratio.
+
+    :param matcher: SequenceMatcher with both texts set
+    :param cosine: Function computing the cosine similarity, or the cosine similarity
+    """
+    if SIMPLE_WEIGHT * matcher.real_quick_ratio() + COSINE_WEIGHT < min_score:
+        rejections.inc(stage="real_quick_ratio")
+        return SIMPLE_WEIGHT * matcher.real_quick_ratio() + COSINE_WEIGHT
+    cosine_sim = cosine() if callable(cosine) else cosine
+    if SIMPLE_WEIGHT + COSINE_WEIGHT * cosine_sim < min_score:
+        rejections.inc(stage="cosine")
+        return SIMPLE_WEIGHT + COSINE_WEIGHT * cosine_sim
+    simple_sim = bounded_ratio(matcher, min_score, SIMPLE_WEIGHT, COSINE_WEIGHT * cosine_sim)
+    return (SIMPLE_WEIGHT * simple_sim) + (COSINE_WEIGHT * cosine_sim)
+
+def cosine_text_similarity_many(reference, candidates):
+    """
+    Calculate the TF-IDF cosine similarity of each candidate to the reference, with the
+    same results as cosine_text_similarity(candidate, reference) for every candidate.
+
+    A TF-IDF fit on two texts only knows two IDF values, 1 for the words of both texts and
+    PAIR_IDF for the others. So the vocabulary is counted once for all texts and the scores
+    of all pairs follow from a few sparse matrix products.
+
+    :param reference: The text to compare against, e.g. the expected output
+    :param candidates: The texts to compare, e.g. the outputs of several prompts
+    :return: NumPy array of floats between 0.0 and 1.0, one per candidate
+    """
+    candidates = list(candidates)
+    if not candidates:
+        return np.zeros(0)
+    try:
+        counts = CountVectorizer().fit_transform([reference] + candidates).astype(np.float64).tocsr()
+    except ValueError:
+        # No text has a word, cosine_text_similarity falls back to simple similarity
+        return np.array([simple_similarity(candidate, reference) for candidate in candidates])
+
+    scores, empty = _pair_cosines(counts[0], counts[1:])
+    for index in np.flatnonzero(empty):
+        # Pairs without any word, like cosine_text_similarity
+        scores[index] = simple_similarity(candidates[index], reference)
+    return scores
+
+def _pair_cosines(reference_counts, candidate_counts):
+    """
+    TF-IDF cosine similarities of word counts, with the IDF of a fit on each pair alone.
+
+    :param reference_counts: Sparse 1 x features matrix with the word counts of the reference
+    :param candidate_counts: Sparse candidates x features matrix with the word counts of the candidates
+    :return: Array of similarities and boolean array marking pairs without any word
+    """
+    dtype = candidate_counts.dtype
+    idf_squared = PAIR_IDF ** 2
+
+    # Shared words have an IDF of 1 on both sides, so the dot product only needs the raw counts
+    dot = (candidate_counts @ reference_counts.T).toarray().ravel()
+
+    # Squared norms: every word weighted with PAIR_IDF, minus the difference for the shared words
+    reference_squared = reference_counts.multiply(reference_counts)
+    candidate_present = (candidate_counts > 0).astype(dtype)
+    reference_norms = idf_squared * reference_squared.sum() \
+        - (idf_squared - 1.0) * (candidate_present @ reference_squared.T).toarray().ravel()
+    candidate_squared = candidate_counts.multiply(candidate_counts).tocsr()
+    reference_present = (reference_counts > 0).astype(dtype)
+    candidate_norms = idf_squared * np.asarray(candidate_squared.sum(axis=1)).ravel() \
+        - (idf_squared - 1.0) * (candidate_squared @ reference_present.T).toarray().ravel()
+
+    norms = np.sqrt(np.maximum(reference_norms, 0.0) * np.maximum(candidate_norms, 0.0)).astype(dtype)
+    scores = np.divide(dot, norms, out=np.zeros_like(dot), where=norms > 0)
+    return np.clip(scores, 0.0, 1.0), (reference_norms <= 0) & (candidate_norms <= 0)
+
+def combined_similarity_many(reference, candidates, min_score=None):
+    """
+    Calculate the combined similarity of each candidate to the reference, with the same
+    results as combined_similarity(candidate, reference) for every candidate.
+
+    The TF-IDF vocabulary is built once for all texts (see cosine_text_similarity_many) and
+    the SequenceMatcher indexes the reference once instead of once per candidate.
+
+    :param reference: The text to compare against, e.g. the expected output
+    :param candidates: The texts to compare, e.g. the outputs of several prompts
+    :param min_score: Optional score the caller needs, see combined_similarity
+    :return: NumPy array of floats between 0.0 and 1.0, one per candidate
+    """
+    candidates = list(candidates)
+    cosine = cosine_text_similarity_many(reference, candidates)
+    matcher = SequenceMatcher(None)
+    matcher.set_seq2(reference)
+    scores = np.empty(len(candidates))
+    for index, candidate in enumerate(candidates):
+        matcher.set_seq1(candidate)
+        if min_score is None:
+            scores[index] = (SIMPLE_WEIGHT * matcher.ratio()) + (COSINE_WEIGHT * cosine[index])
+        else:
+            scores[index] = _bounded_combined(matcher, cosine[index], min_score)
+    return scores
+
+class SimilarityReference:
+    """
+    An expected output prepared once for scoring many candidates against it.
+
+    Tokens, word counts and the SequenceMatcher index (set_seq2) of the expected text are
+    computed in the constructor, so scoring a candidate only processes the candidate. The
+    scores equal those of the pairwise functions with the candidate as first text::
+
+        reference = SimilarityReference(expected_output)
+        for prompt in prompts:
+            similarity = reference.score(run(prompt))  # == combined_similarity(output, expected_output)
+
+    Instances can be shared between threads.
+    """
+
+    def __init__(self, text):
+        """
+        :param text: The expected text
+        """
+        self.text = text
+        self.counts = Counter(_analyze(text))
+        self.squared = sum(count * count for count in self.counts.values())
+        self._matcher = SequenceMatcher(None)
+        self._matcher.set_seq2(text)
+
+    def matcher(self, candidate):
+        """
+        :return: A SequenceMatcher of the candidate against the text, sharing the index of the text
+        """
+        matcher = copy.copy(self._matcher)
+        matcher.set_seq1(candidate)
+        return matcher
+
+    def simple(self, candidate, min_score=None):
+        """
+        :return: simple_similarity(candidate, text, min_score)
+        """
+        return bounded_ratio(self.matcher(candidate), min_score)
+
+    def cosine(self, candidate):
+        """
+        :return: cosine_text_similarity(candidate, text)
+        """
+        counts = Counter(_analyze(candidate))
+        if not counts and not self.counts:
+            # No word in either text, like cosine_text_similarity
+            return self.simple(candidate)
+        dot = shared_reference = shared_candidate = 0.0
+        for word, count in counts.items():
+            reference_count = self.counts.get(word)
+            if reference_count:
+                dot += count * reference_count
+                shared_reference += reference_count * reference_count
+                shared_candidate += count * count
+        idf_squared = PAIR_IDF ** 2
+        reference_norm = idf_squared * self.squared - (idf_squared - 1.0) * shared_reference
+        candidate_norm = idf_squared * sum(count * count for count in counts.values()) \
+            - (idf_squared - 1.0) * shared_candidate
+        if reference_norm <= 0 or candidate_norm <= 0:
+            return 0.0
+        return min(1.0, dot / math.sqrt(reference_norm * candidate_norm))
+
+    def score(self, candidate, min_score=None):
+        """
+        :return: combined_similarity(candidate, text, min_score)
+        """
+        if min_score is not None:
+            return _bounded_combined(self.matcher(candidate), lambda: self.cosine(candidate), min_score)
+        return (SIMPLE_WEIGHT * self.simple(candidate)) + (COSINE_WEIGHT * self.cosine(candidate))
+
+    def score_many(self, candidates, min_score=None):
+        """
+        :return: NumPy array with the combined similarity of each candidate
+        """
+        return np.array([self.score(candidate, min_score) for candidate in candidates], dtype=np.float64)
+
+
+def parse_json_output(text):
+    """
+    Parses a model output as JSON, tolerating ```json fences and text around the JSON.
+
+    :param text: The output, or an already parsed dict or list
+    :return: The parsed dict or list, None if the text holds no JSON object or array
+    """
+    if isinstance(text, (dict, list)):
+        return text
+    if not isinstance(text, str):
+        return None
+    match = _JSON_FENCE.search(text)
+    if match:
+        text = match.group(1)
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+        if not starts:
+            return None
+        try:
+            value, _ = json.JSONDecoder().raw_decode(text, min(starts))
+        except json.JSONDecodeError:
+            return None
+    return value if isinstance(value, (dict, list)) else None
+
+def json_similarity(text1, text2):
+    """
+    Calculate the similarity of two JSON outputs by their structure.
+
+    Both sides are parsed once. Objects are compared key by key, the elements of lists are
+    aligned by id and name (see ALIGNMENT_KEYS) before they are compared, numbers (also
+    numbers in strings, like the weights of SOFT outputs) by their relative difference.
+    Only string leaves are compared as text, with combined_similarity. Whitespace and key
+    order do not matter, missing and extra keys or elements count as 0.
+
+    If a side holds no JSON, the whole texts are compared with combined_similarity.
+
+    :param text1: First output to compare, a string or an already parsed dict or list
+    :param text2: Second output to compare, typically the expected output
+    :return: Float value between 0.0 and 1.0 representing similarity
+    """
+    value1 = parse_json_output(text1)
+    value2 = parse_json_output(text2)
+    if value1 is None or value2 is None:
+        return combined_similarity(_as_text(text1), _as_text(text2))
+    return _value_similarity(value1, value2)
+
+def _as_text(value):
+    return value if isinstance(value, str) else json.dumps(value, indent=2)
+
+def _value_similarity(value1, value2):
+    if isinstance(value1, dict) and isinstance(value2, dict):
+        keys = value1.keys() | value2.keys()
+        if not keys:
+            return 1.0
+        return sum(_value_similarity(value1[key], value2[key]) for key in keys
+                   if key in value1 and key in value2) / len(keys)
+    if isinstance(value1, list) and isinstance(value2, list):
+        if not value1 and not value2:
+            return 1.0
+        return sum(_value_similarity(element1, element2) for element1, element2 in _align(value1, value2)) \
+            / max(len(value1), len(value2))
+    if isinstance(value1, (dict, list)) or isinstance(value2, (dict, list)):
+        # An object where a leaf is expected or the other way round
+        return 0.0
+    return _leaf_similarity(value1, value2)
+
+def _align(list1, list2):
+    """
+    :return: Pairs of elements of the two lists, matched by ALIGNMENT_KEYS, then by position
+    """
+    pairs = []
+    unmatched1 = list(range(len(list1)))
+    unmatched2 = list(range(len(list2)))
+    for keys in ALIGNMENT_KEYS:
+        index = {}
+        for position in unmatched2:
+            key = _alignment_key(list2[position], keys)
+            if key is not None:
+                index.setdefault(key, position)
+        remaining = []
+        matched = set()
+        for position in unmatched1:
+            key = _alignment_key(list1[position], keys)
+            match = index.pop(key, None) if key is not None else None
+            if match is None:
+                remaining.append(position)
+            else:
+                pairs.append((list1[position], list2[match]))
+                matched.add(match)
+        unmatched1 = remaining
+        unmatched2 = [position for position in unmatched2 if position not in matched]
+    pairs += [(list1[position1], list2[position2]) for position1, position2 in zip(unmatched1, unmatched2)]
+    return pairs
+
+def _alignment_key(element, keys):
+    if not isinstance(element, dict) or any(key not in element for key in keys):
+        return None
+    return json.dumps([element[key] for key in keys], sort_keys=True, default=str)
+
+def _leaf_similarity(value1, value2):
+    if value1 == value2 and type(value1) is type(value2):
+        return 1.0
+    number1, number2 = _number(value1), _number(value2)
+    if number1 is not None and number2 is not None:
+        if number1 == number2:
+            return 1.0
+        return max(0.0, 1.0 - abs(number1 - number2) / max(abs(number1), abs(number2)))
+    if value1 is None or value2 is None or isinstance(value1, bool) or isinstance(value2, bool):
+        return 0.0
+    return SimilarityReference(str(value2)).score(str(value1))
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return None
+        return number if math.isfinite(number) else None
+    return None
+
+def hashed_counts(text):
+    """
+    Word counts of a text in the fixed feature space of the hashing mode.
+
+    :param text: A string, or an iterable of string chunks such as the tokens of a streamed
+                 generation; words split between two chunks are counted once
+    :return: Sparse float32 1 x HASHING_FEATURES matrix
+    """
+    if isinstance(text, str):
+        return _hasher.transform([text])
+    counts = None
+    tail = ""
+    for chunk in text:
+        chunk = tail + chunk
+        match = _WORD_TAIL.search(chunk)
+        # Hold back a word that may continue in the next chunk
+        tail = match.group(0) if match else ""
+        head = chunk[:len(chunk) - len(tail)]
+        if head:
+            chunk_counts = _hasher.transform([head])
+            counts = chunk_counts if counts is None else counts + chunk_counts
+    last = _hasher.transform([tail])
+    return last if counts is None else counts + last
+
+def hashed_cosine_similarity(text1, text2):
+    """
+    Calculate the cosine similarity between two texts like cosine_text_similarity, with word
+    counts hashed into HASHING_FEATURES features instead of a fitted vocabulary. The result
+    only differs where two words share a hash bucket. Pairs without any word fall back to
+    simple_similarity if both texts are strings and score 0.0 otherwise.
+
+    :param text1: First text to compare, a string or an iterable of chunks
+    :param text2: Second text to compare, a string or an iterable of chunks
+    :return: Float value between 0.0 and 1.0 representing similarity
+    """
+    scores, empty = _pair_cosines(hashed_counts(text2), hashed_counts(text1))
+    if empty[0]:
+        return simple_similarity(text1, text2) if isinstance(text1, str) and isinstance(text2, str) else 0.0
+    return float(scores[0])
+
+def iter_hashed_cosine_similarity(reference, candidates, chunk_size=HASHING_CHUNK_SIZE):
+    """
+    Streams the hashed cosine similarity of each candidate to the reference. Candidates are
+    read and vectorized chunk_size at a time and nothing is kept between chunks, so memory
+    stays flat however many candidates are scored.
+
+    :param reference: The text to compare against, a string or an iterable of chunks
+    :param candidates: Iterable of texts, e.g. outputs read one by one from an experiment store
+    :param chunk_size: Candidates vectorized at once
+    :return: Generator of floats, one per candidate
+    """
+    reference_counts = hashed_counts(reference)
+    chunk = []
+    for candidate in candidates:
+        chunk.append(candidate)
+        if len(chunk) >= chunk_size:
+            yield from _hashed_chunk(reference, reference_counts, chunk)
+            chunk = []
+    if chunk:
+        yield from _hashed_chunk(reference, reference_counts, chunk)
+
+def hashed_cosine_similarity_many(reference, candidates, chunk_size=HASHING_CHUNK_SIZE):
+    """
+    Like cosine_text_similarity_many, in the hashing mode (see iter_hashed_cosine_similarity).
+
+    :return: NumPy float32 array, one similarity per candidate
+    """
+    return np.fromiter(iter_hashed_cosine_similarity(reference, candidates, chunk_size), dtype=np.float32)
+
+def _hashed_chunk(reference, reference_counts, candidates):
+    scores, empty = _pair_cosines(reference_counts, _hasher.transform(candidates))
+    scores = scores.tolist()
+    for index in np.flatnonzero(empty):
+        # Pairs without any word, like hashed_cosine_similarity
+        scores[index] = simple_similarity(candidates[index], reference) if isinstance(reference, str) else 0.0
+    return scores
@@ -3,6 +3,8 @@ import json
 
 import requests
 
+from src.n8nprototype.backend.utils import deadline, telemetry, transport
+
 def get_workflow_by_id(workflow_id, api_key):
     """
     Retrieves a specific workflow by ID from the n8n API.
@@ -17,7 +19,7 @@ def get_workflow_by_id(workflow_id, api_key):
         "X-N8N-API-KEY": api_key
     }
     try:
-        response = requests.get(url, headers=headers)
+        response = transport.get(url, headers=headers)
         response.raise_for_status()  # Raise an exception for HTTP errors.
         return response.json()
     except requests.RequestException as e:
@@ -76,22 +78,13 @@ def update_workflow_by_id(workflow_id, workflow_json, api_key):
     }
 
     try:
-        # Print the JSON payload for debugging
-        print(f"Sending workflow update request to: {url}")
         json_data = json.dumps(workflow_json)
         
-        response = requests.put(url, headers=headers, data=json_data)
-        
-        # Print detailed response information for debugging
-        print(f"Response status code: {response.status_code}")
-        print(f"Response headers: {response.headers}")
+        with telemetry.span("n8n.update_workflow", workflow_id=workflow_id):
+            response = transport.put(url, headers=headers, data=json_data)
         
-        # Try to parse the response body as JSON for more detailed error information
-        try:
-            response_body = response.json()
-            print(f"Response body: {json.dumps(response_body, indent=2)}")
-        except ValueError:
-            print(f"Response body (text): {response.text}")
+        # The response body holds the detailed error information, serialized only with debug logging enabled
+        telemetry.log_payload(f"Response body of {url}", response.text)
         
         response.raise_for_status()  # Raise exception for HTTP errors.
         return response.json()
@@ -109,7 +102,7 @@ def activate_workflow(workflow_id, api_key):
     }
 
     try:
-        response = requests.post(url, headers=headers, data="")
+        response = transport.post(url, headers=headers, data="")
         response.raise_for_status()  # Raise exception for HTTP errors.
         return response.json()
     except requests.RequestException as e:
@@ -126,7 +119,7 @@ def create_workflow(workflow_json, api_key):
     }
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(workflow_json))
+        response = transport.post(url, headers=headers, data=json.dumps(workflow_json))
         response.raise_for_status()  # Raise exception for HTTP errors.
         return response.json()
     except requests.RequestException as e:
@@ -143,7 +136,7 @@ def delete_workflow(workflow_id, api_key):
     }
 
     try:
-        response = requests.delete(url, headers=headers)
+        response = transport.delete(url, headers=headers)
         response.raise_for_status()  # Raise exception for HTTP errors.
         return response.json()
     except requests.RequestException as e:
@@ -161,7 +154,8 @@ def query_prompt_on_n8n(messages, webhook_url):
     """
     headers = {
         "accept": "application/json",
-        "Content-Type": "application/json"
+        "Content-Type": "application/json",
+        **deadline.headers()
     }
     
     # Format the payload according to what the webhook expects
@@ -169,21 +163,12 @@ def query_prompt_on_n8n(messages, webhook_url):
     payload = {"body": messages}
     
     try:
-        print(f"Sending request to webhook URL: {webhook_url}")
-        print(f"Request payload: {json.dumps(payload)}")
-        
-        response = requests.post(webhook_url, data=json.dumps(payload), headers=headers)
+        telemetry.log_payload(f"Payload to {webhook_url}", payload)
         
-        # Print detailed response information for debugging
-        print(f"Response status code: {response.status_code}")
-        print(f"Response headers: {response.headers}")
+        with telemetry.span("n8n.webhook", webhook_url=webhook_url):
+            response = transport.post(webhook_url, data=json.dumps(payload), headers=headers)
         
-        # Try to parse the response body as JSON for more detailed error information
-        try:
-            response_body = response.json()
-            print(f"Response body: {json.dumps(response_body, indent=2)}")
-        except ValueError:
-            print(f"Response body (text): {response.text}")
+        telemetry.log_payload(f"Response body of {webhook_url}", response.text)
         
         response.raise_for_status()  # Raises an HTTPError for bad responses
         return response.json()
@@ -191,12 +176,7 @@ def query_prompt_on_n8n(messages, webhook_url):
     except requests.exceptions.RequestException as e:
         print(f"Error sending data to n8n: {e}")
         if hasattr(e, 'response') and e.response is not None:
-            print(f"Error response status code: {e.response.status_code}")
-            print(f"Error response headers: {e.response.headers}")
-            try:
-                print(f"Error response body: {e.response.json()}")
-            except ValueError:
-                print(f"Error response body (text): {e.response.text}")
+            print(f"Error response body ({e.response.status_code}): {e.response.text}")
         return None
 
 """
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import requests
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    Raised instead of sending a request while the circuit of the target is open.
+    It is a requests.ConnectionError, so existing RequestException handlers cover it.
+    """
+
+
+class CircuitBreaker:
+    """
+    Fails fast while a dependency is unhealthy.
+
+    closed:    requests pass; failure_threshold consecutive failures open the circuit.
+    open:      requests fail immediately with CircuitOpenError for reset_timeout seconds.
+    half_open: a single probe request passes; its success closes the circuit, its failure
+               opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        """
+        :param name: Name of the dependency, e.g. "http://localhost:5678"
+        :param failure_threshold: Consecutive failures that open the circuit
+        :param reset_timeout: Seconds the circuit stays open before a probe is let through
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before(self):
+        """
+        Call before sending a request.
+
+        :raises CircuitOpenError: If the circuit does not let the request through
+        """
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            if self.state != self.CLOSED:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit for {self.name} is {self.state}")
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opens += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def call(self, fn, is_failure=None):
+        """
+        Runs fn through the breaker.
+
+        :param fn: Function sending the request
+        :param is_failure: Function telling whether an exception is a failure of the dependency,
+                           e.g. not for a rejected request; None counts every exception
+        :return: The result of fn
+        """
+        self.before()
+        try:
+            result = fn()
+        except Exception as e:
+            if is_failure is None or is_failure(e):
+                self.record_failure()
+            else:
+                # The dependency answered, the request was at fault
+                self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "opens": self.opens, "rejected": self.rejected}
@@ -0,0 +1,81 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+import requests
+
+# Header carrying the deadline to n8n webhooks, as Unix time in milliseconds
+DEADLINE_HEADER = "X-Request-Deadline"
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(requests.Timeout):
+    """
+    Raised instead of sending a request when the request-scoped deadline has passed.
+    It is a requests.Timeout, so existing RequestException handlers cover it.
+    """
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Sets a deadline for every outbound call made inside the block, including calls in
+    asyncio tasks and worker threads started with asyncio.to_thread. A nested deadline
+    never extends the enclosing one::
+
+        with deadline(20):
+            workflow = get_workflow_by_id(workflow_id, api_key)
+            result = query_prompt_on_n8n(messages, webhook_url)
+
+    :param seconds: Time budget of the block
+    """
+    expires_at = time.time() + seconds
+    current = _deadline.get()
+    if current is not None:
+        expires_at = min(expires_at, current)
+    token = _deadline.set(expires_at)
+    try:
+        yield expires_at
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """
+    :return: Seconds left until the current deadline, None without a deadline
+    """
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return max(0.0, expires_at - time.time())
+
+
+def timeout(default):
+    """
+    Shortens a requests timeout to the time left until the current deadline.
+
+    :param default: Timeout without deadline: seconds, a (connect, read) tuple or None
+    :return: The timeout to pass to requests
+    :raises DeadlineExceeded: If the deadline has passed
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    if default is None:
+        return left
+    if isinstance(default, tuple):
+        return tuple(left if part is None else min(part, left) for part in default)
+    return min(default, left)
+
+
+def headers():
+    """
+    :return: Headers announcing the current deadline to the receiver, empty without a deadline
+    """
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return {}
+    return {DEADLINE_HEADER: str(int(expires_at * 1000))}
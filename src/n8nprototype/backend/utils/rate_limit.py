@@ -0,0 +1,352 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from dotenv import load_dotenv
+
+from src.n8nprototype.backend.utils import deadline, telemetry, transport
+
+# Load environment variables
+load_dotenv()
+
+# Defaults per backend, each overridable by <NAME>_REQUESTS_PER_MINUTE, <NAME>_TOKENS_PER_MINUTE,
+# <NAME>_INITIAL_CONCURRENCY and <NAME>_MAX_CONCURRENCY. None means unlimited. The limits of
+# "ollama" hold per Ollama host.
+DEFAULT_LIMITS = {
+    "openai": {"requests_per_minute": 500, "tokens_per_minute": 200_000,
+               "initial_concurrency": 8, "max_concurrency": 64},
+    "ollama": {"requests_per_minute": None, "tokens_per_minute": None,
+               "initial_concurrency": int(os.getenv('OLLAMA_NUM_PARALLEL', '4')), "max_concurrency": 16},
+}
+
+# Status codes telling us the backend is overloaded
+OVERLOAD_STATUS_CODES = (429, 503)
+
+
+class RateLimited(requests.HTTPError):
+    """
+    Raised when a backend still answers 429 Too Many Requests after the retries, instead of
+    falling back to a default answer that would hide the overload.
+    """
+
+
+def raise_if_rate_limited(response, backend):
+    """
+    :param response: The last response of a request, after the retries
+    :param backend: Name of the backend for the error message, e.g. "OpenAI"
+    :raises RateLimited: If the response is a 429 Too Many Requests
+    """
+    if response.status_code == 429:
+        response.close()
+        raise RateLimited(f"{backend} rate limit exceeded after retries", response=response)
+
+
+def estimate_tokens(text):
+    """
+    Rough token count of a text, about four characters per token.
+    """
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at a rate per minute.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        """
+        :param per_minute: Refill rate in tokens per minute
+        :param capacity: Burst size (default: one minute worth of tokens)
+        """
+        self.per_minute = per_minute
+        self.capacity = capacity or per_minute
+        self.tokens = float(self.capacity)
+        self.waited = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """
+        Takes tokens from the bucket, blocking until enough have been refilled.
+        Requests larger than the capacity take the whole bucket.
+
+        :param amount: Number of tokens
+        :return: Seconds spent waiting
+        :raises deadline.DeadlineExceeded: If the tokens are not refilled before the current deadline
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    self.waited += waited
+                    return waited
+                delay = (amount - self.tokens) * 60.0 / self.per_minute
+            left = deadline.remaining()
+            if left is not None and delay > left:
+                raise deadline.DeadlineExceeded("Request deadline exceeded while waiting for the rate limit")
+            time.sleep(delay)
+            waited += delay
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+
+class AIMDController:
+    """
+    Concurrency limit adjusted by additive increase / multiplicative decrease.
+
+    Every successful request raises the limit by 1/limit, i.e. by one per round of requests.
+    A 429/503 or a latency well above the long-run average multiplies it by backoff, at most
+    once per cooldown so a burst of failures of the same round counts once.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=64, backoff=0.5, latency_factor=2.0, cooldown=1.0):
+        """
+        :param initial: Starting limit
+        :param minimum: Lowest limit
+        :param maximum: Highest limit
+        :param backoff: Factor applied to the limit on overload
+        :param latency_factor: Recent latency above this multiple of the long-run latency counts as overload
+        :param cooldown: Seconds after a decrease during which further overload signals are ignored
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.decreases = 0
+        self.recent_latency = None
+        self.baseline_latency = None
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Blocks until the number of requests in flight is below the current limit.
+
+        :raises deadline.DeadlineExceeded: If no slot frees up before the current deadline
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                left = deadline.remaining()
+                if left == 0:
+                    raise deadline.DeadlineExceeded("Request deadline exceeded while waiting for a concurrency slot")
+                self._condition.wait(left)
+            self.in_flight += 1
+
+    def release(self, status=None, latency=None):
+        """
+        Ends a request and adjusts the limit to its outcome.
+
+        :param status: HTTP status of the request, None if unknown (e.g. connection error)
+        :param latency: Seconds the request took
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if status in OVERLOAD_STATUS_CODES or self._latency_rising(status, latency):
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self.decreases += 1
+                    self._last_decrease = now
+            elif status is not None and status < 400:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+    def _latency_rising(self, status, latency):
+        if latency is None or status is None or status >= 400:
+            return False
+        if self.baseline_latency is None:
+            self.recent_latency = self.baseline_latency = latency
+            return False
+        self.recent_latency = 0.7 * self.recent_latency + 0.3 * latency
+        self.baseline_latency = 0.98 * self.baseline_latency + 0.02 * latency
+        return self.recent_latency > self.latency_factor * self.baseline_latency
+
+
+class Outcome:
+    """
+    Filled in by the caller of RateLimiter.limit() with the HTTP status of the request.
+    latency can be set as well, e.g. to the time until the headers of a streamed response;
+    otherwise the request lasts until its slot is released.
+    """
+
+    def __init__(self):
+        self.status = None
+        self.latency = None
+        self.started_at = time.perf_counter()
+
+
+class RateLimiter:
+    """
+    Limits of one backend: requests per minute, tokens per minute and adaptive concurrency.
+    """
+
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None,
+                 initial_concurrency=4, max_concurrency=64):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AIMDController(initial=initial_concurrency, maximum=max_concurrency)
+        self.throttled = 0
+
+    @contextmanager
+    def limit(self, tokens=0):
+        """
+        Waits for capacity, then runs the block as one request. Set the yielded
+        Outcome's status so the concurrency limit can adapt::
+
+            with get_limiter("openai").limit(tokens=estimate_tokens(prompt)) as outcome:
+                response = transport.post(url, json=data)
+                outcome.status = response.status_code
+
+        :param tokens: Estimated tokens of the request (prompt and completion)
+        """
+        outcome = self.acquire(tokens)
+        try:
+            yield outcome
+        finally:
+            self.release(outcome)
+
+    def acquire(self, tokens=0):
+        """
+        Waits for capacity and takes a concurrency slot, for requests outliving a block,
+        e.g. streams. Every acquire needs a release.
+
+        :param tokens: Estimated tokens of the request (prompt and completion)
+        :return: The Outcome of the request
+        :raises deadline.DeadlineExceeded: If there is no capacity before the current deadline
+        """
+        waited = 0.0
+        if self.requests is not None:
+            waited += self.requests.acquire()
+        if self.tokens is not None and tokens:
+            waited += self.tokens.acquire(tokens)
+        if waited:
+            self.throttled += 1
+        self.concurrency.acquire()
+        return Outcome()
+
+    def release(self, outcome):
+        """
+        Frees the concurrency slot of a request and adapts the limit to its outcome.
+
+        :param outcome: The Outcome returned by acquire
+        """
+        latency = outcome.latency if outcome.latency is not None else time.perf_counter() - outcome.started_at
+        self.concurrency.release(outcome.status, latency)
+
+    def send(self, request, tokens=0, stream=False):
+        """
+        Sends a request within the limits. A streamed response holds its concurrency slot
+        until it is closed or read to the end; its latency is the time to the headers.
+
+        :param request: Function sending the request and returning a requests.Response
+        :param tokens: Estimated tokens of the request (prompt and completion)
+        :param stream: True if the request was sent with stream=True
+        :return: The requests.Response
+        """
+        outcome = self.acquire(tokens)
+        try:
+            response = request()
+        except BaseException:
+            self.release(outcome)
+            raise
+        outcome.status = response.status_code
+        if stream:
+            outcome.latency = time.perf_counter() - outcome.started_at
+            transport.on_close(response, lambda: self.release(outcome))
+        else:
+            self.release(outcome)
+        return response
+
+    def metrics(self):
+        """
+        :return: Dict with the current limits and their state
+        """
+        return {
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "concurrency_decreases": self.concurrency.decreases,
+            "requests_per_minute": self.requests.per_minute if self.requests else None,
+            "requests_available": self.requests.available() if self.requests else None,
+            "tokens_per_minute": self.tokens.per_minute if self.tokens else None,
+            "tokens_available": self.tokens.available() if self.tokens else None,
+            "throttled": self.throttled,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _env_limit(name, key, default):
+    value = os.getenv(f"{name.upper()}_{key.upper()}")
+    if value is None:
+        return default
+    return int(value) if value.lower() not in ('', 'none', 'unlimited') else None
+
+
+def get_limiter(name, host=None):
+    """
+    Returns the process wide limiter of a backend, e.g. "openai" or "ollama", and host.
+
+    :param name: Backend whose defaults and environment variables apply
+    :param host: Optional base URL, for backends limited per host like Ollama
+    """
+    key = f"{name} {host}" if host else name
+    with _limiters_lock:
+        if key not in _limiters:
+            defaults = DEFAULT_LIMITS.get(name, DEFAULT_LIMITS["ollama"])
+            _limiters[key] = RateLimiter(key, **{limit: _env_limit(name, limit, value)
+                                                 for limit, value in defaults.items()})
+        return _limiters[key]
+
+
+def metrics():
+    """
+    :return: Dict mapping each backend to the metrics of its limiter
+    """
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.metrics() for limiter in limiters}
+
+
+def _collect(metric):
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [({"limiter": limiter.name}, metric(limiter)) for limiter in limiters]
+
+
+telemetry.registry.collector(
+    "rate_limit_concurrency_limit", "Current adaptive concurrency limit by limiter",
+    lambda: _collect(lambda limiter: int(limiter.concurrency.limit)))
+telemetry.registry.collector(
+    "rate_limit_in_flight", "Requests holding a concurrency slot by limiter",
+    lambda: _collect(lambda limiter: limiter.concurrency.in_flight))
+telemetry.registry.collector(
+    "rate_limit_concurrency_decreases_total", "Decreases of the concurrency limit on overload by limiter",
+    lambda: _collect(lambda limiter: limiter.concurrency.decreases), kind="counter")
+telemetry.registry.collector(
+    "rate_limit_throttled_total", "Requests that waited for the requests or tokens per minute by limiter",
+    lambda: _collect(lambda limiter: limiter.throttled), kind="counter")
+telemetry.registry.collector(
+    "rate_limit_requests_available", "Requests left in the per minute bucket by limiter",
+    lambda: _collect(lambda limiter: limiter.requests.available() if limiter.requests else None))
+telemetry.registry.collector(
+    "rate_limit_tokens_available", "Tokens left in the per minute bucket by limiter",
+    lambda: _collect(lambda limiter: limiter.tokens.available() if limiter.tokens else None))
@@ -0,0 +1,235 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from src.n8nprototype.backend.utils import deadline, telemetry
+from src.n8nprototype.backend.utils.circuit_breaker import CircuitOpenError
+
+# Status codes worth another attempt
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Threads running hedged requests
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+
+class RetryPolicy:
+    """
+    Retries failed requests with jittered exponential backoff.
+
+    A call is retried when it raises a connection error or timeout, or returns a response
+    with a status in retry_statuses. After the last attempt the response is returned or the
+    exception raised as is. A Retry-After header extends the delay up to max_delay.
+    Open circuits and exceeded deadlines are not retried, and no delay outlasts the deadline.
+    """
+
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=8.0, retry_statuses=RETRY_STATUS_CODES):
+        """
+        :param attempts: Total number of attempts, 1 disables retries
+        :param base_delay: Upper bound of the first delay in seconds, doubled per attempt
+        :param max_delay: Upper bound of any delay in seconds
+        :param retry_statuses: HTTP status codes that are retried
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+        self.retries = 0
+
+    def delay(self, attempt, response=None):
+        """
+        :param attempt: Number of the failed attempt, starting at 0
+        :param response: The failed response, if any
+        :return: Seconds to wait before the next attempt ("full jitter")
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(self.max_delay, float(retry_after)))
+        left = deadline.remaining()
+        return delay if left is None else min(delay, left)
+
+    def call(self, fn):
+        """
+        Calls fn until it succeeds or the attempts are used up.
+
+        :param fn: Function sending the request and returning a requests.Response
+        :return: The last response
+        """
+        for attempt in range(self.attempts):
+            last_attempt = attempt == self.attempts - 1
+            try:
+                response = fn()
+            except (CircuitOpenError, deadline.DeadlineExceeded):
+                raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt:
+                    raise
+                self._count(type(e).__name__, attempt)
+                time.sleep(self.delay(attempt))
+                continue
+            if last_attempt or getattr(response, "status_code", None) not in self.retry_statuses:
+                return response
+            self._count(response.status_code, attempt)
+            time.sleep(self.delay(attempt, response))
+            response.close()
+
+    def _count(self, reason, attempt):
+        """
+        Counts a retry in the metrics and on the current span.
+        """
+        self.retries += 1
+        telemetry.retries_total.inc(reason=reason)
+        current = telemetry.current_span()
+        if current is not None:
+            current.set(retries=attempt + 1, retry_reason=reason)
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent request latencies.
+    """
+
+    def __init__(self, window=200):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, percent):
+        """
+        :param percent: Percentile between 0 and 100
+        :return: Latency in seconds, None without samples
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percent / 100))
+        return latencies[index]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._latencies)
+
+
+class HedgePolicy:
+    """
+    Sends a duplicate request when the first one is slower than the recent p95.
+
+    Latencies are tracked per kind of request, e.g. per API path and model, so a slow
+    model does not delay the hedges of a fast one. The first response that would not be
+    retried (see RetryPolicy) wins; a failed response is only returned when every request
+    failed, and only winners are recorded as latencies. The loser runs to completion in
+    the background and its response is closed. hedge_fn can send the duplicate elsewhere,
+    e.g. to another backend of a pool.
+    """
+
+    def __init__(self, percentile=95, min_samples=20, min_delay=0.0, retry_statuses=RETRY_STATUS_CODES):
+        """
+        :param percentile: Percentile of recent latencies after which the hedge is sent
+        :param min_samples: Number of latencies to observe before hedging starts
+        :param min_delay: Lower bound of the hedge delay in seconds
+        :param retry_statuses: HTTP status codes of failed responses, which never win
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.retry_statuses = retry_statuses
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def latencies(self, key=None):
+        """
+        :param key: Kind of request, e.g. (path, model)
+        :return: The LatencyTracker of the kind of request
+        """
+        with self._lock:
+            return self._latencies.setdefault(key, LatencyTracker())
+
+    def hedge_delay(self, key=None):
+        """
+        :param key: Kind of request, e.g. (path, model)
+        :return: Seconds to wait before hedging, None while there are too few samples
+        """
+        latencies = self.latencies(key)
+        if len(latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, latencies.percentile(self.percentile))
+
+    def call(self, fn, hedge_fn=None, key=None):
+        """
+        Calls fn and, if it has not returned within the hedge delay, also hedge_fn.
+
+        :param fn: Function sending the request
+        :param hedge_fn: Function sending the duplicate (default: fn), e.g. to another backend
+        :param key: Kind of request whose latencies set the hedge delay, e.g. (path, model)
+        :return: The first successful result, else the last failed response
+        """
+        started_at = time.perf_counter()
+        delay = self.hedge_delay(key)
+        if delay is None:
+            result = fn()
+            if self._succeeded(result):
+                self.latencies(key).record(time.perf_counter() - started_at)
+            return result
+
+        # The worker threads run in a copy of the caller's context, so the deadline holds there too
+        primary = _executor.submit(contextvars.copy_context().run, fn)
+        done, _ = wait([primary], timeout=delay)
+        if not done:
+            self.hedged += 1
+            futures = [primary, _executor.submit(contextvars.copy_context().run, hedge_fn or fn)]
+        else:
+            futures = [primary]
+
+        error = None
+        failed = None
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if not self._succeeded(future.result()):
+                    if failed is not None:
+                        _close_result(failed)
+                    failed = future
+                    continue
+                if future is not primary:
+                    self.hedge_wins += 1
+                self.latencies(key).record(time.perf_counter() - started_at)
+                for loser in futures:
+                    loser.add_done_callback(_close_result)
+                if failed is not None:
+                    _close_result(failed)
+                return future.result()
+        if failed is not None:
+            return failed.result()
+        raise error
+
+    def stats(self):
+        with self._lock:
+            keys = list(self._latencies)
+        return {
+            "hedge_delays": {key: self.hedge_delay(key) for key in keys},
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
+
+    def _succeeded(self, result):
+        return getattr(result, "status_code", None) not in self.retry_statuses
+
+
+def _close_result(future):
+    if future.exception() is None and hasattr(future.result(), "close"):
+        future.result().close()
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import json
+import threading
+
+from src.n8nprototype.backend.utils import deadline, telemetry
+
+
+def fingerprint(*parts):
+    """
+    Builds a key identifying a request from its parts, e.g. URL, payload and headers.
+
+    :param parts: JSON serializable parts of the request
+    :return: Hex digest of the request
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical requests: while a request with a given key is in flight,
+    further callers with the same key wait for it and share its result (or its exception)
+    instead of sending their own. Callers receive the same result object.
+
+    do() serves threads, ado() serves coroutines of an event loop. A waiting caller keeps
+    its own deadline (see deadline.deadline) and raises DeadlineExceeded when it passes.
+    """
+
+    def __init__(self, name=None):
+        """
+        :param name: Exports the stats as metrics labelled with this name, e.g. "llm"
+        """
+        self.name = name
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        if name is not None:
+            with _flights_lock:
+                _flights[name] = self
+
+    def do(self, key, fn):
+        """
+        Runs fn unless a call with the same key is already in flight.
+
+        :param key: Fingerprint of the request
+        :param fn: Function sending the request
+        :return: The result of fn, possibly from another thread's call
+        :raises DeadlineExceeded: If the deadline of the caller passes while it waits for another thread's call
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.event.wait(deadline.remaining()):
+                raise deadline.DeadlineExceeded("Request deadline exceeded while waiting for a coalesced call")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def ado(self, key, fn):
+        """
+        Awaits fn() unless a call with the same key is already in flight on this event loop.
+
+        :param key: Fingerprint of the request
+        :param fn: Function returning the awaitable that sends the request
+        :return: The result of the awaitable, possibly from another task's call
+        :raises DeadlineExceeded: If the deadline of the caller passes while it waits for another task's call
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        with self._lock:
+            self.calls += 1
+        waited = False
+        while True:
+            with self._lock:
+                future = self._async_calls.get(flight_key)
+                leader = future is None
+                if leader:
+                    future = loop.create_future()
+                    self._async_calls[flight_key] = future
+                    self.executions += 1
+                    if waited:
+                        # A follower of a cancelled leader sends the request after all
+                        self.coalesced -= 1
+                elif not waited:
+                    self.coalesced += 1
+                    waited = True
+
+            if leader:
+                return await self._lead(flight_key, future, fn)
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), deadline.remaining())
+            except TimeoutError:
+                raise deadline.DeadlineExceeded("Request deadline exceeded while waiting for a coalesced call")
+            except asyncio.CancelledError:
+                # Only the leader was cancelled, not this task: send the request itself
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+
+    async def _lead(self, flight_key, future, fn):
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved, the leader raises it anyway
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._async_calls[flight_key]
+
+    def stats(self):
+        """
+        :return: Dict with the number of calls, upstream executions, coalesced calls and
+                 requests currently in flight
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._async_calls),
+            }
+
+
+def _collect(field):
+    with _flights_lock:
+        flights = list(_flights.values())
+    return [({"flight": flight.name}, flight.stats()[field]) for flight in flights]
+
+
+telemetry.registry.collector(
+    "singleflight_calls_total", "Calls of each named SingleFlight",
+    lambda: _collect("calls"), kind="counter")
+telemetry.registry.collector(
+    "singleflight_executions_total", "Upstream executions of each named SingleFlight",
+    lambda: _collect("executions"), kind="counter")
+telemetry.registry.collector(
+    "singleflight_coalesced_total", "Calls that shared another call's result by SingleFlight",
+    lambda: _collect("coalesced"), kind="counter")
+telemetry.registry.collector(
+    "singleflight_in_flight", "Distinct requests currently in flight by SingleFlight",
+    lambda: _collect("in_flight"))
@@ -1,8 +1,14 @@
 import requests
 import json
 
+from src.n8nprototype.backend.utils import deadline, telemetry, transport
+from src.n8nprototype.backend.utils.singleflight import SingleFlight, fingerprint
+
+# Identical webhook calls in flight that opted in with coalesce share one request to n8n
+flights = SingleFlight("n8n_webhook")
+
 # Function to source text to n8n
-def source_to_n8n(payload, webhook_url, jwt_token="", headers=None):
+def source_to_n8n(payload, webhook_url, jwt_token="", headers=None, coalesce=False):
     """
     Sends payload data to n8n via a webhook.
 
@@ -10,8 +16,17 @@ def source_to_n8n(payload, webhook_url, jwt_token="", headers=None):
     :param webhook_url: The URL of the n8n webhook
     :param jwt_token: Optional JWT token for authentication
     :param headers: Optional additional headers to include in the request
+    :param coalesce: Share the response with identical calls in flight; only for idempotent
+                     webhooks, a workflow with side effects must run once per call
     :return: The response from the n8n webhook
     """
+    if coalesce:
+        key = fingerprint(webhook_url, payload, jwt_token, headers)
+        return flights.do(key, lambda: _post_to_n8n(payload, webhook_url, jwt_token, headers))
+    return _post_to_n8n(payload, webhook_url, jwt_token, headers)
+
+
+def _post_to_n8n(payload, webhook_url, jwt_token, headers):
     # Set up default headers
     request_headers = {"Content-Type": "application/json"}
     
@@ -23,21 +38,20 @@ def source_to_n8n(payload, webhook_url, jwt_token="", headers=None):
     if headers and isinstance(headers, dict):
         request_headers.update(headers)
 
+    # Tell n8n until when the caller waits for the answer
+    request_headers.update(deadline.headers())
+
     try:
-        print(f"Sending request to: {webhook_url}")
-        print(f"Headers: {request_headers}")
-        print(f"Payload: {json.dumps(payload, indent=2)}")
-        
-        # Make the request with increased timeout and full response capture
-        response = requests.post(webhook_url, json=payload, headers=request_headers, timeout=30)
-        
-        # Print response details for debugging
-        print(f"Response status code: {response.status_code}")
-        print(f"Response headers: {response.headers}")
+        # Serialized only with debug logging enabled
+        telemetry.log_payload(f"Payload to {webhook_url}", payload)
+
+        # Make the request with full response capture, the transport sets the timeout
+        with telemetry.span("n8n.webhook", webhook_url=webhook_url):
+            response = transport.post(webhook_url, json=payload, headers=request_headers)
         
         # For non-200 responses, print the response text
         if response.status_code != 200:
-            print(f"Error response: {response.text}")
+            print(f"Error response from n8n ({response.status_code}): {response.text}")
             
             # Check for CORS issues in the response
             if 'Access-Control-Allow-Origin' not in response.headers:
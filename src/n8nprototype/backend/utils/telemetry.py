@@ -0,0 +1,377 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger("n8nprototype")
+
+# Upper bounds of the latency buckets in seconds, LLM generations take up to minutes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Number of finished spans kept for recent_spans()
+SPAN_BUFFER = int(os.getenv('TELEMETRY_SPAN_BUFFER', '1000'))
+# Port of the /metrics endpoint started by serve(), unset disables it
+METRICS_PORT = os.getenv('METRICS_PORT')
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """
+    Monotonic counter with one value per label set.
+    """
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets and one series per label set.
+    """
+
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def snapshot(self, **labels):
+        """
+        :return: Dict with count, sum and per-bucket counts of a label set, None without samples
+        """
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            if series is None:
+                return None
+            return {"count": series["count"], "sum": series["sum"], "counts": list(series["counts"])}
+
+    def percentile(self, percent, **labels):
+        """
+        :param percent: Percentile between 0 and 100
+        :return: Upper bound of the bucket holding the percentile, None without samples
+        """
+        snapshot = self.snapshot(**labels)
+        if snapshot is None:
+            return None
+        rank = snapshot["count"] * percent / 100
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), snapshot["counts"]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series["counts"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Collector:
+    """
+    Gauge or counter whose values are read from a function at exposition time, for state
+    that lives elsewhere, e.g. the limits of the rate limiters or the circuit breakers.
+    """
+
+    def __init__(self, name, description, collect, kind="gauge"):
+        """
+        :param name: Name of the metric
+        :param description: Help text of the metric
+        :param collect: Function returning a list of (labels dict, value) pairs; None values are skipped
+        :param kind: "gauge" or "counter"
+        """
+        self.name = name
+        self.description = description
+        self.collect = collect
+        self.kind = kind
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        samples = [(_label_key(labels), value) for labels, value in self.collect() if value is not None]
+        for key, value in sorted(samples):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+    def clear(self):
+        pass
+
+
+class Registry:
+    """
+    The metrics of the process, rendered in the Prometheus text format by exposition().
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, description):
+        return self._register(Counter(name, description))
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, description, buckets))
+
+    def collector(self, name, description, collect, kind="gauge"):
+        return self._register(Collector(name, description, collect, kind))
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def exposition(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.exposition()) + "\n"
+
+    def clear(self):
+        """
+        Resets all values, e.g. between tests.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "outbound_request_duration_seconds", "Latency of outbound calls by span, host and status")
+requests_total = registry.counter(
+    "outbound_requests_total", "Outbound calls by span, host and status")
+bytes_sent = registry.counter(
+    "outbound_request_bytes_total", "Bytes of request bodies sent by span and host")
+bytes_received = registry.counter(
+    "outbound_response_bytes_total", "Bytes of response bodies received by span and host")
+llm_tokens = registry.counter(
+    "llm_tokens_total", "Tokens processed by LLM calls by model and kind (prompt or completion)")
+retries_total = registry.counter(
+    "outbound_retries_total", "Retried outbound calls by reason (status code or exception)")
+health_check_failures = registry.counter(
+    "health_check_failures_total", "Failed health checks of pooled backends by host")
+
+
+class Span:
+    """
+    One timed operation, e.g. an outbound HTTP call or an LLM generation.
+
+    Attributes with a meaning for the metrics: host, status, bytes_sent, bytes_received,
+    model, prompt_tokens and completion_tokens. Any other attribute is only logged.
+    """
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.started_at = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        """
+        Adds attributes to the span, ignoring None values.
+        """
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def record_response(self, response, stream=False):
+        """
+        Takes status and body sizes from a requests.Response. Streamed bodies are not read;
+        their size is taken from the Content-Length header if present.
+        """
+        body = response.request.body if response.request is not None else None
+        if stream:
+            received = response.headers.get("Content-Length")
+            received = int(received) if received and received.isdigit() else None
+        else:
+            received = len(response.content or b"")
+        self.set(status=response.status_code, bytes_sent=len(body) if body else 0, bytes_received=received)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started_at
+        attributes = self.attributes
+        status = attributes.get("status", "error" if self.error else "ok")
+        labels = {"span": self.name, "host": attributes.get("host", "")}
+        request_duration.observe(self.duration, status=status, **labels)
+        requests_total.inc(status=status, **labels)
+        if attributes.get("bytes_sent"):
+            bytes_sent.inc(attributes["bytes_sent"], **labels)
+        if attributes.get("bytes_received"):
+            bytes_received.inc(attributes["bytes_received"], **labels)
+        for kind in ("prompt", "completion"):
+            if attributes.get(f"{kind}_tokens"):
+                llm_tokens.inc(attributes[f"{kind}_tokens"], model=attributes.get("model", ""), kind=kind)
+        _finished.append(self)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span %s %.3fs %s%s", self.name, self.duration, attributes,
+                         f" error={self.error!r}" if self.error else "")
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "parent": self.parent.name if self.parent else None,
+            "duration": self.duration,
+            "error": repr(self.error) if self.error else None,
+            **self.attributes,
+        }
+
+
+_current = contextvars.ContextVar("span", default=None)
+_finished = deque(maxlen=SPAN_BUFFER)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times the block as a span and records it in the metrics when it ends::
+
+        with telemetry.span("ollama.generate", model=model) as current:
+            result = post(...).json()
+            current.set(prompt_tokens=result.get("prompt_eval_count"))
+
+    Spans opened inside the block, also in worker threads started with a copy of the
+    context, get it as their parent.
+
+    :param name: Name of the operation
+    :param attributes: Initial attributes, see Span
+    """
+    current = Span(name, parent=_current.get(), **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = e
+        raise
+    finally:
+        _current.reset(token)
+        current.finish()
+
+
+def current_span():
+    """
+    :return: The innermost open span, None outside of any span
+    """
+    return _current.get()
+
+
+def recent_spans(name=None):
+    """
+    :param name: Only spans of this name
+    :return: The most recently finished spans as dicts, oldest first
+    """
+    return [finished.to_dict() for finished in list(_finished) if name is None or finished.name == name]
+
+
+def log_payload(label, payload):
+    """
+    Logs a payload at debug level. It is only serialized if debug logging is enabled,
+    so calling this on the hot path costs next to nothing otherwise.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        if not isinstance(payload, str):
+            payload = json.dumps(payload, indent=2, default=str)
+        logger.debug("%s: %s", label, payload)
+
+
+def exposition():
+    """
+    :return: All metrics in the Prometheus text exposition format
+    """
+    return registry.exposition()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.rstrip('/') != "/metrics":
+            self.send_error(404)
+            return
+        body = exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=None, host="0.0.0.0"):
+    """
+    Serves the metrics on http://host:port/metrics from a background thread.
+
+    :param port: Port to listen on (default: METRICS_PORT)
+    :return: The server, stop it with shutdown(); None if no port is configured
+    """
+    port = port if port is not None else METRICS_PORT
+    if port is None:
+        return None
+    server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,279 @@
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from src.n8nprototype.backend.utils import deadline, telemetry
+from src.n8nprototype.backend.utils.circuit_breaker import CircuitBreaker
+
+# Load environment variables
+load_dotenv()
+
+# Number of per-host connection pools kept alive by the shared session
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+# Number of keep-alive connections kept per host
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '16'))
+# HTTP/2 is only available for the httpx based client (OpenAI SDK) and needs the h2 package
+HTTP2 = os.getenv('HTTP2', 'false').lower() in ('1', 'true', 'yes')
+# Timeout in seconds of requests that do not set one
+HTTP_DEFAULT_TIMEOUT = float(os.getenv('HTTP_DEFAULT_TIMEOUT', '30'))
+# Consecutive failures of a host that open its circuit, and seconds until it is probed again
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+
+
+class Transport:
+    """
+    Shared HTTP transport with a keep-alive connection pool per host.
+
+    All outbound calls of the backend (n8n API, n8n webhooks, Ollama, OpenAI) and the UI
+    go through one instance, so TCP and TLS handshakes are paid once per connection
+    instead of once per request.
+
+    Every request gets a timeout, shortened to the request-scoped deadline (see deadline.py),
+    and passes the circuit breaker of its host, which fails fast while the host is unhealthy.
+    """
+
+    def __init__(self, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                 host_limits=None, http2=HTTP2, default_timeout=HTTP_DEFAULT_TIMEOUT,
+                 failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        """
+        Initialize the transport.
+
+        :param pool_connections: Number of per-host pools to keep
+        :param pool_maxsize: Number of keep-alive connections per host
+        :param host_limits: Optional dict mapping a base URL (e.g. "http://localhost:5678") to a
+                            hard limit of simultaneous connections to that host
+        :param http2: Negotiate HTTP/2 on the httpx client if the h2 package is installed
+        :param default_timeout: Timeout of requests that do not set one
+        :param failure_threshold: Consecutive failures of a host that open its circuit
+        :param reset_timeout: Seconds an open circuit waits before letting a probe through
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.host_limits = {}
+        self.http2 = http2
+        self.default_timeout = default_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self._httpx_client = None
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        default_adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", default_adapter)
+        self.session.mount("https://", default_adapter)
+        for base_url, limit in (host_limits or {}).items():
+            self.set_host_limit(base_url, limit)
+
+    def set_host_limit(self, base_url, limit):
+        """
+        Limit the number of simultaneous connections to one host. Callers beyond the limit
+        wait for a free connection instead of opening a new one.
+
+        :param base_url: Scheme and host of the target, e.g. "http://localhost:5678"
+        :param limit: Maximum number of connections to the host
+        """
+        parts = urlsplit(base_url)
+        prefix = f"{parts.scheme}://{parts.netloc}"
+        self.host_limits[prefix] = limit
+        self.session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=limit, pool_block=True))
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request over the pooled session. Accepts the keyword arguments of requests.
+        Connection errors, timeouts and 5xx responses count as failures of the host.
+        The call is recorded as an "http" span (see telemetry.py).
+
+        :return: The requests.Response
+        :raises deadline.DeadlineExceeded: If the request-scoped deadline has passed
+        :raises circuit_breaker.CircuitOpenError: If the circuit of the host is open
+        """
+        kwargs["timeout"] = deadline.timeout(kwargs.get("timeout", self.default_timeout))
+        breaker = self.breaker_for(url)
+        breaker.before()
+        with telemetry.span("http", host=breaker.name, method=method.upper()) as span:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException:
+                breaker.record_failure()
+                raise
+            span.record_response(response, stream=kwargs.get("stream", False))
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    def breaker_for(self, url):
+        """
+        :param url: Any URL of the host
+        :return: The CircuitBreaker of the host
+        """
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+            return self.breakers[host]
+
+    def breaker_states(self):
+        """
+        :return: Dict mapping each host to the state of its circuit breaker
+        """
+        with self._lock:
+            breakers = list(self.breakers.values())
+        return {breaker.name: breaker.stats() for breaker in breakers}
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def httpx_client(self):
+        """
+        Returns the pooled httpx client used by SDKs that require httpx, e.g. openai.OpenAI.
+
+        :return: A shared httpx.Client
+        """
+        with self._lock:
+            if self._httpx_client is None:
+                import httpx
+
+                http2 = self.http2
+                if http2:
+                    try:
+                        import h2  # noqa: F401
+                    except ImportError:
+                        print("WARNING: HTTP2 requested but the h2 package is not installed. Using HTTP/1.1.")
+                        http2 = False
+                limits = httpx.Limits(
+                    max_connections=self.pool_connections * self.pool_maxsize,
+                    max_keepalive_connections=self.pool_maxsize,
+                )
+                self._httpx_client = httpx.Client(limits=limits, http2=http2)
+            return self._httpx_client
+
+    def close(self):
+        """
+        Closes all pooled connections.
+        """
+        self.session.close()
+        with self._lock:
+            if self._httpx_client is not None:
+                self._httpx_client.close()
+                self._httpx_client = None
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    Returns the process wide transport, creating it on first use.
+    """
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport()
+        return _transport
+
+
+def configure(**kwargs):
+    """
+    Replaces the process wide transport with one built from the given Transport arguments.
+    Call it at startup, before SDK clients such as the OpenAI client of the UI are created.
+
+    :return: The new transport
+    """
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.close()
+        _transport = Transport(**kwargs)
+        return _transport
+
+
+def _collect_breakers(metric):
+    with _transport_lock:
+        current = _transport
+    states = current.breaker_states() if current is not None else {}
+    return [sample for host, stats in states.items() for sample in metric(host, stats)]
+
+
+telemetry.registry.collector(
+    "circuit_breaker_state", "Circuit breaker state by host, 1 for the current state",
+    lambda: _collect_breakers(lambda host, stats: [
+        ({"host": host, "state": state}, int(stats["state"] == state))
+        for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)]))
+telemetry.registry.collector(
+    "circuit_breaker_opens_total", "Times the circuit of a host opened",
+    lambda: _collect_breakers(lambda host, stats: [({"host": host}, stats["opens"])]), kind="counter")
+telemetry.registry.collector(
+    "circuit_breaker_rejected_total", "Requests failed fast by an open circuit by host",
+    lambda: _collect_breakers(lambda host, stats: [({"host": host}, stats["rejected"])]), kind="counter")
+
+
+def request(method, url, **kwargs):
+    return get_transport().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return get_transport().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_transport().post(url, **kwargs)
+
+
+def put(url, **kwargs):
+    return get_transport().put(url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return get_transport().delete(url, **kwargs)
+
+
+def on_close(response, callback):
+    """
+    Calls callback once, when a streamed response is closed or its body has been read to
+    the end, e.g. to hold a concurrency slot for as long as the stream is open.
+
+    :param response: A requests.Response sent with stream=True
+    :param callback: Function without arguments
+    :return: The response
+    """
+    once = threading.Lock()
+    close, iter_content = response.close, response.iter_content
+
+    def finish():
+        if once.acquire(blocking=False):
+            callback()
+
+    def closing():
+        try:
+            close()
+        finally:
+            finish()
+
+    def reading(*args, **kwargs):
+        try:
+            yield from iter_content(*args, **kwargs)
+        finally:
+            finish()
+
+    response.close = closing
+    response.iter_content = reading
+    return response
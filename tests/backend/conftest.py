@@ -0,0 +1,10 @@
+import pytest
+
+from src.n8nprototype.backend.utils import transport
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    # The shared transport keeps a breaker per host, failures of one test must not open it for the next
+    transport.get_transport().breakers.clear()
+    yield
@@ -0,0 +1,79 @@
+import pytest
+
+from benchmarks import inputs
+from src.n8nprototype.backend.metaprompting.experiment_store import ExperimentStore, content_hash
+
+INPUT = "As a manager of an organisation, I want to validate my issue against the rules of the SOFT framework."
+MODEL = "qwen2.5:14b"
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "experiments.sqlite3")
+
+
+def test_run_resumes_after_a_restart(path):
+    expected = inputs.output_text(2_000)
+    store = ExperimentStore(path)
+    run_id = store.start_run(INPUT, expected, MODEL, prompt_model="o3-mini")
+    for iteration in range(8):
+        store.record(run_id, iteration, f"prompt {iteration}", inputs.output_text(2_000, seed=iteration),
+                     iteration / 10, timings={"run": 1.5})
+    store.close()
+
+    reopened = ExperimentStore(path)
+    assert reopened.start_run(INPUT, expected, MODEL, run_id=run_id) == run_id
+    done = reopened.completed(run_id)
+
+    assert sorted(done) == list(range(8))
+    assert done[3] == {"iteration": 3, "prompt": "prompt 3", "output": inputs.output_text(2_000, seed=3),
+                       "similarity": 0.3, "timings": {"run": 1.5}, "duplicate_of": None}
+    with pytest.raises(ValueError):
+        reopened.start_run(INPUT, expected, "qwen2.5:7b", run_id=run_id)
+    reopened.close()
+
+
+def test_results_are_append_only(path):
+    store = ExperimentStore(path)
+    run_id = store.start_run(INPUT, "expected", MODEL)
+
+    assert store.record(run_id, 0, "first prompt", "output", 0.5)
+    assert not store.record(run_id, 0, "second prompt", "output", 0.9)
+    assert store.results(run_id)[0]["prompt"] == "first prompt"
+    with pytest.raises(KeyError):
+        store.record("unknown", 0, "prompt", "output", 0.5)
+
+
+def test_best_prompt_per_input_and_model_over_all_runs(path):
+    store = ExperimentStore(path)
+    for run, similarities in enumerate([(0.2, 0.6), (0.9, 0.4)]):
+        run_id = store.start_run(INPUT, "expected", MODEL, run_id=f"run-{run}")
+        for iteration, similarity in enumerate(similarities):
+            store.record(run_id, iteration, f"prompt {run}.{iteration}", "output", similarity)
+    # A near-duplicate that reused the result of iteration 0 of run-1 was never run itself
+    store.record("run-1", 2, "prompt 1.0, reworded", "output", 0.9, duplicate_of=0)
+    other = store.start_run(INPUT, "expected", "qwen2.5:7b")
+    store.record(other, 0, "prompt of another model", "output", 1.0)
+
+    best = store.best(INPUT, MODEL, limit=2)
+
+    assert [(result["run_id"], result["prompt"]) for result in best] == [("run-1", "prompt 1.0"), ("run-0", "prompt 0.1")]
+    assert store.best("another input", MODEL) == []
+    assert store.completed("run-1")[2]["duplicate_of"] == 0
+
+
+def test_texts_are_stored_once_and_compressed(path):
+    store = ExperimentStore(path)
+    expected = inputs.output_text(20_000)
+    for run in range(3):
+        run_id = store.start_run(INPUT, expected, MODEL)
+        # The same prompt and output in every run
+        store.record(run_id, 0, "prompt", expected, 1.0)
+
+    stats = store.stats()
+
+    assert stats["runs"] == 3 and stats["results"] == 3
+    # Input, expected output (also the output) and prompt
+    assert stats["texts"] == 3
+    assert stats["stored_bytes"] < stats["raw_bytes"] / 3
+    assert store.text(content_hash(expected)) == expected
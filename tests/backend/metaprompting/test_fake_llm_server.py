@@ -0,0 +1,71 @@
+import time
+
+import requests
+from openai import OpenAI
+
+from src.n8nprototype.backend.metaprompting.fake_llm_server import FakeLLMServer, split_tokens
+from src.n8nprototype.backend.metaprompting.llm_client import LLMClient
+from src.n8nprototype.backend.utils.retry import RetryPolicy
+
+RESPONSE = "The capital of France is Paris."
+
+
+def test_split_tokens_keeps_the_text():
+    assert "".join(split_tokens(RESPONSE)) == RESPONSE
+    assert len(split_tokens(RESPONSE)) == 6
+    assert split_tokens("  ") == []
+
+
+def test_streamed_generation_has_the_configured_latency(monkeypatch):
+    with FakeLLMServer(response=RESPONSE, time_to_first_token=0.2, tokens_per_second=50) as fake:
+        monkeypatch.setenv("OLLAMA_BASE_URL", fake.base_url)
+        stream = LLMClient().stream_prompt("Answer briefly.", "Capital of France?")
+
+        assert "".join(stream) == RESPONSE
+        assert 0.2 <= stream.time_to_first_token < 0.4
+        assert stream.eval_count == 6
+        assert 40 <= stream.tokens_per_second <= 60
+
+
+def test_non_streaming_generate_and_chat(monkeypatch):
+    with FakeLLMServer(response=lambda prompt: prompt.split("Input: ")[-1].upper()) as fake:
+        monkeypatch.setenv("OLLAMA_BASE_URL", fake.base_url)
+        client = LLMClient()
+
+        assert client.run_prompt("Shout.", "hello", options={"temperature": 0}) == "HELLO"
+        assert client.session("Shout.").run("again") == "AGAIN"
+        assert fake.loads == ["qwen2.5:14b"]
+
+
+def test_openai_chat_completions_with_the_sdk():
+    with FakeLLMServer(response=RESPONSE, tokens_per_second=1000) as fake:
+        client = OpenAI(api_key="test", base_url=f"{fake.base_url}/v1")
+        messages = [{"role": "user", "content": "Capital of France?"}]
+
+        completion = client.chat.completions.create(model="gpt-4o-mini", messages=messages)
+        assert completion.choices[0].message.content == RESPONSE
+        assert completion.usage.completion_tokens == 6
+
+        chunks = client.chat.completions.create(model="gpt-4o-mini", messages=messages, stream=True)
+        assert "".join(chunk.choices[0].delta.content or "" for chunk in chunks) == RESPONSE
+
+
+def test_errors_are_injected_at_the_configured_rate():
+    with FakeLLMServer(error_rate=0.5, seed=1) as fake:
+        statuses = [requests.post(f"{fake.base_url}/api/generate",
+                                  json={"model": "m", "prompt": "hi", "stream": False}).status_code
+                    for _ in range(40)]
+    assert statuses.count(503) == fake.errors
+    assert 10 <= fake.errors <= 30
+
+
+def test_client_retries_injected_errors(monkeypatch):
+    with FakeLLMServer(error_rate=0.3, seed=7) as fake:
+        monkeypatch.setenv("OLLAMA_BASE_URL", fake.base_url)
+        client = LLMClient(retry=RetryPolicy(attempts=5, base_delay=0.001))
+        started_at = time.perf_counter()
+        answers = [client.run_prompt("p", f"input {i}") for i in range(10)]
+
+    assert answers == ["ok"] * 10
+    assert client.retry.retries == fake.errors
+    assert time.perf_counter() - started_at < 5
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+import requests
+import requests_mock
+
+from src.n8nprototype.backend.metaprompting.llm_client import LLMClient
+
+OLLAMA_URL = "http://ollama.test:11434"
+
+
+def test_arun_prompt_passes_model_per_call(monkeypatch):
+    monkeypatch.setenv("OLLAMA_BASE_URL", OLLAMA_URL)
+    client = LLMClient()
+
+    with requests_mock.Mocker() as mock:
+        mock.post(f"{OLLAMA_URL}/api/generate", json={"response": "Paris"})
+
+        result = asyncio.run(client.arun_prompt("Answer briefly.", "Capital of France?", "qwen2.5:7b"))
+
+        assert result == "Paris"
+        assert mock.last_request.json()["model"] == "qwen2.5:7b"
+        assert client.model_name == "o3-mini"
+
+
+def test_run_prompt_many_keeps_order_and_caps_concurrency(monkeypatch):
+    client = LLMClient()
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def fake_run_prompt(prompt, input_text, model="qwen2.5:14b", options=None):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.02)
+        with lock:
+            in_flight -= 1
+        return f"{model}:{input_text}"
+
+    monkeypatch.setattr(client, "run_prompt", fake_run_prompt)
+    items = [("prompt", f"input-{i}") for i in range(8)] + [
+        {"prompt": "prompt", "input_text": "input-8", "model": "qwen2.5:7b"}
+    ]
+
+    results = asyncio.run(client.run_prompt_many(items, max_concurrency=3))
+
+    assert results[:8] == [f"qwen2.5:14b:input-{i}" for i in range(8)]
+    assert results[8] == "qwen2.5:7b:input-8"
+    assert 1 < peak <= 3
+
+
+def test_stream_prompt_yields_tokens_and_reports_speed(monkeypatch):
+    monkeypatch.setenv("OLLAMA_BASE_URL", OLLAMA_URL)
+    client = LLMClient()
+    chunks = [
+        {"model": "qwen2.5:14b", "response": "Par", "done": False},
+        {"model": "qwen2.5:14b", "response": "is", "done": False},
+        {"model": "qwen2.5:14b", "response": "", "done": True,
+         "eval_count": 20, "eval_duration": 500_000_000, "prompt_eval_count": 12},
+    ]
+    body = b"\n".join(json.dumps(chunk).encode("utf-8") for chunk in chunks)
+
+    with requests_mock.Mocker() as mock:
+        mock.post(f"{OLLAMA_URL}/api/generate", content=body)
+
+        stream = client.stream_prompt("Answer briefly.", "Capital of France?")
+        tokens = list(stream)
+
+        assert mock.last_request.json()["stream"] is True
+    assert tokens == ["Par", "is"]
+    assert stream.done
+    assert stream.time_to_first_token is not None
+    assert stream.tokens_per_second == 40.0
+    assert stream.prompt_eval_count == 12
+
+
+def test_stream_prompt_raises_on_error_status(monkeypatch):
+    monkeypatch.setenv("OLLAMA_BASE_URL", OLLAMA_URL)
+    client = LLMClient()
+
+    with requests_mock.Mocker() as mock:
+        mock.post(f"{OLLAMA_URL}/api/generate", status_code=404, text="model not found")
+
+        with pytest.raises(requests.HTTPError):
+            client.stream_prompt("Answer briefly.", "Capital of France?")
+
+
+def test_identical_concurrent_runs_share_one_request(monkeypatch):
+    client = LLMClient()
+    calls = []
+
+    def slow_ollama(prompt, input_text, model_name="qwen2.5:14b", options=None):
+        calls.append(input_text)
+        time.sleep(0.05)
+        return "Paris"
+
+    monkeypatch.setattr(client, "_run_with_ollama", slow_ollama)
+    greedy = {"temperature": 0}
+    items = [{"prompt": "Answer briefly.", "input_text": "Capital of France?", "options": greedy}] * 4 \
+        + [{"prompt": "Answer briefly.", "input_text": "Capital of Italy?", "options": greedy}]
+
+    results = asyncio.run(client.run_prompt_many(items, max_concurrency=5))
+
+    assert results == ["Paris"] * 5
+    assert sorted(calls) == ["Capital of France?", "Capital of Italy?"]
+
+
+def test_clients_of_different_hosts_do_not_share_requests(monkeypatch):
+    clients = [LLMClient(), LLMClient()]
+    clients[1].ollama_base_url = "http://other-ollama.test:11434"
+    calls = []
+
+    def slow_ollama(client):
+        def run(prompt, input_text, model_name="qwen2.5:14b", options=None):
+            calls.append(client.ollama_base_url)
+            time.sleep(0.05)
+            return client.ollama_base_url
+        return run
+
+    for client in clients:
+        monkeypatch.setattr(client, "_run_with_ollama", slow_ollama(client))
+
+    async def main():
+        return await asyncio.gather(*(client.arun_prompt("Answer briefly.", "Capital of France?",
+                                                         options={"temperature": 0}) for client in clients))
+
+    assert asyncio.run(main()) == [client.ollama_base_url for client in clients]
+    assert len(calls) == 2
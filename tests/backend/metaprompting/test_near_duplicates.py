@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from benchmarks import inputs
+from src.n8nprototype.backend.metaprompting.near_duplicates import (
+    MinHasher,
+    NearDuplicateIndex,
+    estimate_similarity,
+    optimal_bands,
+    shingles,
+)
+
+PROMPT = ("You are an assistant validating issues against the rules of the SOFT framework. "
+          "Read the issue of the manager carefully and check it against the strengths, opportunities, "
+          "failures and threats of the organisation. Every attention names the rule it is based on "
+          "and explains in a few sentences why the issue does or does not follow that rule. "
+          "Answer with a JSON object listing every attention with its name, value and reasoning. "
+          "Do not add any text before or after the JSON object.")
+
+
+def jaccard(text1, text2):
+    shingles1, shingles2 = shingles(text1), shingles(text2)
+    return len(shingles1 & shingles2) / len(shingles1 | shingles2)
+
+
+def test_signatures_estimate_the_jaccard_similarity():
+    hasher = MinHasher(num_perm=256)
+    text1 = inputs.output_text(3_000, seed=1)
+    text2 = inputs.mutate(text1, rate=0.1, seed=2)
+
+    estimate = estimate_similarity(hasher.signature(text1), hasher.signature(text2))
+
+    assert hasher.signature(text1).dtype == np.uint32
+    assert estimate == pytest.approx(jaccard(text1, text2), abs=0.1)
+    assert estimate_similarity(hasher.signature(text1), hasher.signature(text1.upper())) == 1.0
+
+
+def test_bands_favour_finding_duplicates():
+    for threshold in (0.5, 0.8, 0.9):
+        bands, rows = optimal_bands(threshold, 128)
+        assert bands * rows <= 128
+        # Chance that a pair at the threshold becomes a candidate, and one far below it
+        assert 1 - (1 - threshold ** rows) ** bands > 0.8
+        assert 1 - (1 - (threshold - 0.3) ** rows) ** bands < 0.2
+
+
+def test_index_finds_near_duplicates_only():
+    index = NearDuplicateIndex()
+    index.insert("original", PROMPT, value=0.42)
+
+    # The prompt generator rewording a single sentence
+    reworded = PROMPT.replace("listing every attention", "listing each attention")
+    assert index.find(PROMPT) == ("original", 1.0, 0.42)
+    assert index.find(reworded)[0] == "original"
+    assert index.find("Summarize the issue in one sentence.") is None
+
+
+def test_texts_without_words_are_no_duplicates():
+    index = NearDuplicateIndex()
+    assert index.insert("empty", "") is None
+    index.insert("prompt", PROMPT)
+    index.insert("prompt", "!!!")
+
+    assert shingles("?") == set()
+    assert index.find("?") is None
+    assert index.find("") is None
+    assert len(index) == 0
+
+
+def test_index_compares_only_candidates_sharing_a_bucket():
+    index = NearDuplicateIndex()
+    texts = [inputs.output_text(500, seed=seed) + f" run {seed} of the campaign" for seed in range(200)]
+    for seed, text in enumerate(texts):
+        index.insert(str(seed), text)
+
+    for seed, text in enumerate(texts[:20]):
+        assert index.find(text)[0] == str(seed)
+
+    assert index.stats()["comparisons"] < 20 * 5
+
+
+def test_insert_replaces_the_text_of_a_key():
+    index = NearDuplicateIndex()
+    index.insert("prompt", PROMPT)
+    index.insert("prompt", "Summarize the issue in one sentence.")
+
+    assert len(index) == 1
+    assert index.find(PROMPT) is None
+
+
+def test_index_survives_a_restart(tmp_path):
+    path = str(tmp_path / "prompts.sqlite3")
+    index = NearDuplicateIndex(path)
+    index.insert("original", PROMPT, value={"similarity": 0.42})
+    index.close()
+
+    reopened = NearDuplicateIndex(path)
+    reopened.insert("other", "Summarize the issue in one sentence.")
+
+    assert "original" in reopened
+    assert reopened.find(PROMPT) == ("original", 1.0, {"similarity": 0.42})
+    reopened.close()
+
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(path, num_perm=64)
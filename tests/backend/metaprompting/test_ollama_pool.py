@@ -0,0 +1,135 @@
+import asyncio
+import time
+from contextlib import ExitStack
+
+import pytest
+import requests
+
+from src.n8nprototype.backend.metaprompting.llm_client import LLMClient
+from src.n8nprototype.backend.metaprompting.ollama_pool import OllamaPool
+from src.n8nprototype.backend.metaprompting.fake_llm_server import FakeLLMServer
+from src.n8nprototype.backend.utils import deadline, telemetry
+
+
+@pytest.fixture
+def ollamas():
+    with ExitStack() as stack:
+        yield [stack.enter_context(FakeLLMServer(load_delay=0.05, response=f"host-{i}")) for i in range(3)]
+
+
+def test_least_outstanding_backend_is_chosen():
+    pool = OllamaPool(["http://a:11434", "http://b:11434"])
+
+    first = pool.acquire("qwen2.5:14b")
+    second = pool.acquire("qwen2.5:14b")
+    assert first is not second
+
+    pool.release(first)
+    assert pool.acquire("qwen2.5:14b") is first
+
+
+def test_excluded_backend_is_only_used_without_another():
+    pool = OllamaPool(["http://a:11434", "http://b:11434"])
+    first, second = pool.backends
+    first.loaded_models.add("qwen2.5:14b")
+
+    assert pool.acquire("qwen2.5:14b", exclude=[first]) is second
+    second.healthy = False
+    assert pool.acquire("qwen2.5:14b", exclude=[first]) is second
+    assert pool.acquire("qwen2.5:14b", exclude=[first, second]) is first
+
+
+def test_hedge_goes_to_another_backend(ollamas):
+    pool = OllamaPool([ollama.base_url for ollama in ollamas[:2]])
+    backends = []
+
+    for _ in range(2):
+        pool.post("/api/generate", "qwen2.5:14b", backends, json={"model": "qwen2.5:14b", "prompt": "Hi"})
+
+    assert [backend.base_url for backend in backends] == [ollamas[0].base_url, ollamas[1].base_url]
+
+
+def test_backend_with_the_model_loaded_is_preferred(ollamas):
+    pool = OllamaPool([ollama.base_url for ollama in ollamas])
+    ollamas[2].loaded_model = "qwen2.5:14b"
+
+    pool.check_health()
+
+    assert pool.acquire("qwen2.5:14b").base_url == ollamas[2].base_url
+    assert pool.acquire("qwen2.5:7b").base_url != ollamas[2].base_url
+
+
+def test_requests_are_spread_over_the_pool(ollamas, monkeypatch):
+    pool = OllamaPool([ollama.base_url for ollama in ollamas])
+    client = LLMClient(pool=pool)
+    items = [("Answer briefly.", f"question {i}") for i in range(6)]
+
+    results = asyncio.run(client.run_prompt_many(items, max_concurrency=6))
+
+    assert set(results) == {"host-0", "host-1", "host-2"}
+    assert all(backend["outstanding"] == 0 for backend in pool.stats())
+
+
+def test_streams_are_outstanding_until_read(ollamas):
+    pool = OllamaPool([ollama.base_url for ollama in ollamas[:2]])
+    client = LLMClient(pool=pool)
+
+    stream = client.stream_prompt("Answer briefly.", "Capital of France?")
+    assert [backend["outstanding"] for backend in pool.stats()] == [1, 0]
+    # The next request goes to the idle backend
+    assert client.run_prompt("Answer briefly.", "Capital of Italy?") == "host-1"
+
+    assert "".join(stream) == "host-0"
+    assert [backend["outstanding"] for backend in pool.stats()] == [0, 0]
+
+
+def test_failed_backend_leaves_and_rejoins_the_rotation(ollamas):
+    pool = OllamaPool([ollama.base_url for ollama in ollamas[:2]])
+    client = LLMClient(pool=pool)
+    ollamas[0].available = False
+
+    pool.check_health()
+    assert [backend["healthy"] for backend in pool.stats()] == [False, True]
+    assert {client.run_prompt("Answer briefly.", f"question {i}") for i in range(3)} == {"host-1"}
+
+    ollamas[0].available = True
+    pool.check_health()
+    assert [backend["healthy"] for backend in pool.stats()] == [True, True]
+
+
+def test_a_host_going_down_is_logged_once(ollamas, caplog):
+    pool = OllamaPool([ollamas[0].base_url])
+    telemetry.health_check_failures.clear()
+    ollamas[0].available = False
+
+    with caplog.at_level("INFO", logger=telemetry.logger.name):
+        pool.check_health()
+        pool.check_health()
+        ollamas[0].available = True
+        pool.check_health()
+
+    assert [record.levelname for record in caplog.records] == ["WARNING", "INFO"]
+    assert telemetry.health_check_failures.value(host=ollamas[0].base_url) == 2
+
+def test_expired_deadline_keeps_the_backend_healthy(ollamas):
+    pool = OllamaPool([ollamas[0].base_url])
+    with deadline.deadline(0), pytest.raises(deadline.DeadlineExceeded):
+        pool.post("/api/generate", json={"model": "qwen", "prompt": "hi", "stream": False})
+    ollamas[0].time_to_first_token = 0.5
+    with deadline.deadline(0.1), pytest.raises(requests.Timeout):
+        pool.post("/api/generate", json={"model": "qwen", "prompt": "hi", "stream": False})
+    assert pool.stats()[0]["healthy"]
+    assert pool.stats()[0]["failures"] == 0
+
+
+def test_background_health_checks_take_failing_hosts_out(ollamas):
+    pool = OllamaPool([ollama.base_url for ollama in ollamas[:2]], health_interval=0.05).start()
+    try:
+        ollamas[1].available = False
+        for _ in range(40):
+            if not pool.stats()[1]["healthy"]:
+                break
+            time.sleep(0.05)
+        assert not pool.stats()[1]["healthy"]
+    finally:
+        pool.stop()
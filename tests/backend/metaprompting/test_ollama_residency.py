@@ -0,0 +1,52 @@
+import asyncio
+
+from src.n8nprototype.backend.metaprompting.llm_client import LLMClient
+from src.n8nprototype.backend.metaprompting.ollama_residency import ModelResidencyManager
+from src.n8nprototype.backend.metaprompting.fake_llm_server import FakeLLMServer
+
+
+def test_warm_up_loads_models_and_reports_load_times():
+    with FakeLLMServer(load_delay=0.2) as ollama:
+        residency = ModelResidencyManager(ollama.base_url, models=["qwen2.5:14b"], keep_alive="-1")
+
+        durations = residency.warm_up()
+
+        assert durations["qwen2.5:14b"] >= 0.2
+        assert ollama.requests[0] == {"model": "qwen2.5:14b", "keep_alive": "-1", "stream": False}
+        assert residency.loaded_models() == ["qwen2.5:14b"]
+        assert residency.report()["qwen2.5:14b"]["max"] >= 0.2
+
+
+def test_warm_model_answers_without_load_delay(monkeypatch):
+    with FakeLLMServer(load_delay=0.2) as ollama:
+        monkeypatch.setenv("OLLAMA_BASE_URL", ollama.base_url)
+        residency = ModelResidencyManager(ollama.base_url, models=["qwen2.5:14b"], keep_alive="1h")
+        residency.warm_up()
+        client = LLMClient(residency=residency)
+
+        assert client.run_prompt("Answer briefly.", "Capital of France?") == "ok"
+
+        assert ollama.requests[-1]["keep_alive"] == "1h"
+        assert residency.load_times["qwen2.5:14b"][-1] < 0.1
+
+
+def test_batches_are_grouped_by_model_to_avoid_swaps(monkeypatch):
+    with FakeLLMServer(load_delay=0.05) as ollama:
+        monkeypatch.setenv("OLLAMA_BASE_URL", ollama.base_url)
+        residency = ModelResidencyManager(ollama.base_url, models=["qwen2.5:14b"])
+        client = LLMClient(residency=residency)
+        items = [("prompt", f"input-{i}", "qwen2.5:14b" if i % 2 else "qwen2.5:7b") for i in range(6)]
+
+        results = asyncio.run(client.run_prompt_many(items, max_concurrency=1))
+
+        assert results == ["ok"] * 6
+        assert ollama.loads == ["qwen2.5:14b", "qwen2.5:7b"]
+
+
+def test_schedule_starts_with_the_last_used_model():
+    residency = ModelResidencyManager("http://ollama.test", models=["qwen2.5:14b"])
+    residency.last_model = "deepseek-r1:32b"
+
+    order = residency.schedule(["qwen2.5:7b", "qwen2.5:14b", "deepseek-r1:32b", "qwen2.5:14b"])
+
+    assert order == [2, 1, 3, 0]
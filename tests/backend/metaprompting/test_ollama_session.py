@@ -0,0 +1,45 @@
+from src.n8nprototype.backend.metaprompting.llm_client import LLMClient
+from src.n8nprototype.backend.metaprompting.response_cache import ResponseCache
+from src.n8nprototype.backend.metaprompting.fake_llm_server import FakeLLMServer
+
+SOFT_PROMPT = "You validate issues against the rules of the SOFT framework. " * 50
+
+
+def test_session_evaluates_the_static_prompt_once(monkeypatch):
+    with FakeLLMServer(load_delay=0) as ollama:
+        monkeypatch.setenv("OLLAMA_BASE_URL", ollama.base_url)
+        session = LLMClient().session(SOFT_PROMPT)
+
+        assert session.run("Our core business is challenged by AI.") == "ok"
+        first_eval = session.prompt_eval_count
+        assert session.run("Our supply chain depends on one vendor.") == "ok"
+
+        assert ollama.requests[-1]["messages"] == [
+            {"role": "system", "content": SOFT_PROMPT},
+            {"role": "user", "content": "Input: Our supply chain depends on one vendor."},
+        ]
+        assert first_eval > 400
+        assert session.prompt_eval_count == 6
+
+
+def test_session_with_history_appends_the_exchange(monkeypatch):
+    with FakeLLMServer(load_delay=0) as ollama:
+        monkeypatch.setenv("OLLAMA_BASE_URL", ollama.base_url)
+        session = LLMClient().session(SOFT_PROMPT, keep_history=True)
+
+        session.run("first issue")
+        session.run("second issue")
+
+        assert [message["role"] for message in ollama.requests[-1]["messages"]] == ["system", "user", "assistant", "user"]
+        assert session.prompt_eval_count == 4
+
+
+def test_stateless_session_uses_the_response_cache(monkeypatch):
+    with FakeLLMServer(load_delay=0) as ollama:
+        monkeypatch.setenv("OLLAMA_BASE_URL", ollama.base_url)
+        session = LLMClient(cache=ResponseCache()).session(SOFT_PROMPT, options={"temperature": 0})
+
+        session.run("same issue")
+        session.run("same issue")
+
+        assert len(ollama.requests) == 1
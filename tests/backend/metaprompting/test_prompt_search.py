@@ -0,0 +1,200 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from src.n8nprototype.backend.metaprompting.experiment_store import ExperimentStore
+from src.n8nprototype.backend.metaprompting.fake_llm_server import FakeLLMServer
+from src.n8nprototype.backend.metaprompting.llm_client import LLMClient
+from src.n8nprototype.backend.metaprompting.prompt_search import PromptSearch
+from src.n8nprototype.backend.metaprompting.response_cache import LRUCache
+from src.n8nprototype.backend.metaprompting.scoring_executor import ScoringExecutor
+from src.n8nprototype.backend.metaprompting.text_similarity import json_similarity
+from src.n8nprototype.backend.utils.retry import RetryPolicy
+
+EXPECTED = '{"issue": "Gap in Identifying Planning Issues", "weight": "0.7"}'
+
+PROMPTS = [
+    "Validate the issue of the manager against the SOFT framework and answer in JSON.",
+    "List the strengths and weaknesses of the organisation as plain text.",
+    "Summarize the issue in a single short sentence without any formatting.",
+    "Translate the issue into French and explain every rule that applies to it.",
+    "Write a poem about planning issues in large organisations and their managers.",
+    "Answer with the number of words of the issue and nothing else at all.",
+]
+
+
+class ScriptedClient:
+    """
+    Stands in for LLMClient: candidate i gets PROMPTS[i], and every prompt takes delay
+    seconds to generate and to run.
+    """
+
+    def __init__(self, outputs, delays=None, prompts=PROMPTS):
+        self.outputs = outputs
+        self.delays = delays or {}
+        self.prompts = list(prompts)
+        self.runs = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def agenerate_prompt(self, input_text, expected_output, model=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        prompt = self.prompts.pop(0)
+        await asyncio.sleep(self.delays.get(prompt, 0.1))
+        return prompt
+
+    async def arun_prompt(self, prompt, input_text, model="qwen2.5:14b", options=None):
+        self.runs.append(prompt)
+        try:
+            await asyncio.sleep(self.delays.get(prompt, 0.1))
+            output = self.outputs[prompt]
+            if isinstance(output, Exception):
+                raise output
+            return output
+        finally:
+            self.in_flight -= 1
+
+
+def outputs(default='{"issue": "Something else"}', **overrides):
+    result = {prompt: default for prompt in PROMPTS}
+    result.update({PROMPTS[int(index[1:])]: output for index, output in overrides.items()})
+    return result
+
+
+def test_candidates_run_concurrently_and_are_ranked():
+    client = ScriptedClient(outputs(p2='{"issue": "Gap in Identifying Planning Issues", "weight": "0.5"}'))
+    search = PromptSearch(client, concurrency=6)
+
+    started_at = time.perf_counter()
+    result = search.search("issue", EXPECTED, candidates=6)
+
+    # Six sequential iterations would take 1.2s
+    assert time.perf_counter() - started_at < 0.6
+    assert [candidate.index for candidate in result.candidates][0] == 2
+    assert result.best.prompt == PROMPTS[2]
+    assert result.best.similarity == pytest.approx(json_similarity(client.outputs[PROMPTS[2]], EXPECTED))
+    assert result.cancelled == 0 and not result.stopped_early
+    assert set(result.best.timings) == {"generate", "run", "score"}
+    assert result.stage_totals()["run"] == pytest.approx(0.6, abs=0.1)
+
+
+def test_concurrency_is_capped():
+    client = ScriptedClient(outputs())
+    PromptSearch(client, concurrency=2).search("issue", EXPECTED, candidates=6)
+
+    assert client.max_in_flight == 2
+    assert len(client.runs) == 6
+
+
+def test_search_stops_when_the_target_is_reached():
+    client = ScriptedClient(outputs(p0=EXPECTED), delays={prompt: 1.0 for prompt in PROMPTS[1:]})
+    search = PromptSearch(client, concurrency=3, target_similarity=0.95)
+
+    started_at = time.perf_counter()
+    result = search.search("issue", EXPECTED, candidates=6)
+
+    assert time.perf_counter() - started_at < 0.8
+    assert result.stopped_early
+    assert result.best.similarity == 1.0
+    assert [candidate.index for candidate in result.candidates] == [0]
+    assert result.cancelled == 5
+    # The candidates waiting for a slot never started, the running ones stopped before their run
+    assert len(client.prompts) == 3
+    assert client.runs == [PROMPTS[0]]
+
+
+def test_failed_candidates_do_not_end_the_search():
+    client = ScriptedClient(outputs(p1=RuntimeError("Ollama is gone"), p3=EXPECTED))
+    result = PromptSearch(client).search("issue", EXPECTED, candidates=6)
+
+    assert result.best.index == 3
+    failed = [candidate for candidate in result.candidates if candidate.error is not None]
+    assert [candidate.index for candidate in failed] == [1]
+    assert result.candidates[-1] is failed[0]
+
+
+def test_near_duplicate_prompts_reuse_the_result():
+    prompts = [PROMPTS[0], PROMPTS[0].replace("answer in JSON", "answer in JSON only")] + PROMPTS[1:]
+    client = ScriptedClient(outputs(p0=EXPECTED), prompts=prompts)
+    client.outputs[prompts[1]] = '{"issue": "never run"}'
+
+    result = PromptSearch(client).search("issue", EXPECTED, candidates=4)
+
+    duplicate = next(candidate for candidate in result.candidates if candidate.index == 1)
+    assert duplicate.duplicate_of == 0
+    assert duplicate.similarity == 1.0 and duplicate.output == EXPECTED
+    assert "run" not in duplicate.timings
+    assert prompts[1] not in client.runs
+
+
+def test_best_is_the_prompt_that_was_run():
+    # The lower index generates slower, so it becomes the duplicate of the higher one
+    prompts = [PROMPTS[0], PROMPTS[0].replace("answer in JSON", "answer in JSON only")] + PROMPTS[1:]
+    client = ScriptedClient(outputs(), delays={prompts[0]: 0.3}, prompts=prompts)
+    client.outputs[prompts[1]] = EXPECTED
+
+    result = PromptSearch(client).search("issue", EXPECTED, candidates=2)
+
+    assert client.runs == [prompts[1]]
+    assert result.best.index == 1 and result.best.duplicate_of is None
+    assert result.best.prompt == prompts[1]
+    assert result.candidates[1].duplicate_of == 1
+
+
+def test_searches_with_the_llm_client_and_scoring_processes():
+    with FakeLLMServer(response=EXPECTED, time_to_first_token=0.1) as fake, \
+            ScoringExecutor(max_workers=1) as scoring:
+        client = LLMClient("local", retry=RetryPolicy(attempts=1))
+        client.ollama_base_url = fake.base_url
+        # The search's json_similarity scores in the workers, so a parsed reference works
+        result = PromptSearch(client, scoring=scoring).search(
+            "issue", EXPECTED, candidates=3, reference=json.loads(EXPECTED))
+
+    # The local prompt generator gives the same prompt every time, so only one is run
+    assert len(fake.requests) == 1
+    assert [candidate.similarity for candidate in result.candidates] == [1.0, 1.0, 1.0]
+    assert scoring.stats()["pairs"] == 1
+
+
+def test_deterministic_runs_are_answered_from_the_cache():
+    with FakeLLMServer(response=EXPECTED) as fake:
+        client = LLMClient("local", cache=LRUCache(), retry=RetryPolicy(attempts=1))
+        client.ollama_base_url = fake.base_url
+        search = PromptSearch(client, options={"temperature": 0})
+        search.search("issue", EXPECTED, candidates=1)
+        result = search.search("issue", EXPECTED, candidates=1)
+
+    assert len(fake.requests) == 1
+    assert result.best.similarity == 1.0
+
+
+def test_interrupted_search_resumes_from_the_store(tmp_path):
+    store = ExperimentStore(str(tmp_path / "experiments.sqlite3"))
+    client = ScriptedClient(outputs(p4=EXPECTED))
+    first = PromptSearch(client, store=store).search("issue", EXPECTED, candidates=3)
+
+    # The same search again, now with all six candidates
+    resumed = PromptSearch(client, store=store).search("issue", EXPECTED, candidates=6, run_id=first.run_id)
+
+    assert resumed.run_id == first.run_id
+    assert len(client.runs) == 6
+    assert sorted(candidate.index for candidate in resumed.candidates if candidate.resumed) == [0, 1, 2]
+    assert resumed.best.index == 4
+    assert [result["similarity"] for result in store.results(first.run_id)] == \
+        [candidate.similarity for candidate in sorted(resumed.candidates, key=lambda candidate: candidate.index)]
+
+
+def test_duplicates_are_stored_as_such(tmp_path):
+    store = ExperimentStore(str(tmp_path / "experiments.sqlite3"))
+    prompts = [PROMPTS[0], PROMPTS[0].replace("answer in JSON", "answer in JSON only")] + PROMPTS[1:]
+    client = ScriptedClient(outputs(p0=EXPECTED), prompts=prompts)
+
+    first = PromptSearch(client, store=store).search("issue", EXPECTED, candidates=2)
+    resumed = PromptSearch(client, store=store).search("issue", EXPECTED, candidates=2, run_id=first.run_id)
+
+    assert [result["duplicate_of"] for result in store.results(first.run_id)] == [None, 0]
+    assert [result["prompt"] for result in store.best("issue", "qwen2.5:14b", limit=5)] == [prompts[0]]
+    assert resumed.best.index == 0 and resumed.candidates[1].duplicate_of == 0
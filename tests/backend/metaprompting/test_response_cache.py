@@ -0,0 +1,101 @@
+import time
+
+import requests_mock
+
+from src.n8nprototype.backend.metaprompting.llm_client import LLMClient
+from src.n8nprototype.backend.metaprompting.response_cache import (
+    LRUCache,
+    ResponseCache,
+    is_deterministic,
+    make_key,
+)
+from src.n8nprototype.backend.utils.retry import RetryPolicy
+
+OLLAMA_URL = "http://ollama.test:11434"
+
+
+def test_key_depends_on_every_part_and_options():
+    key = make_key("run", "qwen2.5:14b", "prompt", "input")
+    assert key == make_key("run", "qwen2.5:14b", "prompt", "input", options={})
+    assert key != make_key("run", "qwen2.5:7b", "prompt", "input")
+    assert key != make_key("run", "qwen2.5:14b", "prompt", "input", options={"num_ctx": 4096})
+
+
+def test_sampling_is_not_deterministic():
+    assert not is_deterministic(None)
+    assert not is_deterministic({"num_ctx": 4096})
+    assert is_deterministic({"temperature": 0})
+    assert is_deterministic({"temperature": 0.7, "seed": 42})
+    assert not is_deterministic({"temperature": 0.7})
+
+
+def test_lru_evicts_least_recently_used_and_expired_entries():
+    cache = LRUCache(max_entries=2, ttl=0.05)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    time.sleep(0.06)
+    assert cache.get("c") is None
+    assert cache.stats() == {"hits": 2, "misses": 2, "entries": 1}
+
+
+def test_disk_store_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    first = ResponseCache(path)
+    first.set("key", "value")
+    first.close()
+
+    second = ResponseCache(path)
+    assert second.get("key") == "value"
+    assert second.stats()["disk"]["hits"] == 1
+    assert second.get("key") == "value"
+    assert second.stats()["memory"]["hits"] == 1
+    second.close()
+
+
+def test_disk_store_keeps_max_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), memory_entries=1, disk_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+    assert cache.disk.stats()["entries"] == 2
+    cache.close()
+
+
+def test_run_prompt_is_served_from_cache_unless_sampling(monkeypatch):
+    monkeypatch.setenv("OLLAMA_BASE_URL", OLLAMA_URL)
+    client = LLMClient(cache=ResponseCache())
+
+    with requests_mock.Mocker() as mock:
+        mock.post(f"{OLLAMA_URL}/api/generate", json={"response": "Paris"})
+
+        greedy = {"temperature": 0}
+        assert client.run_prompt("Answer briefly.", "Capital of France?", options=greedy) == "Paris"
+        assert client.run_prompt("Answer briefly.", "Capital of France?", options=greedy) == "Paris"
+        assert mock.call_count == 1
+
+        client.run_prompt("Answer briefly.", "Capital of France?", options={"temperature": 0.8})
+        client.run_prompt("Answer briefly.", "Capital of France?", options={"temperature": 0.8})
+        assert mock.call_count == 3
+        assert mock.last_request.json()["options"] == {"temperature": 0.8}
+
+        # Without options Ollama samples with its default temperature
+        client.run_prompt("Answer briefly.", "Capital of France?")
+        client.run_prompt("Answer briefly.", "Capital of France?")
+        assert mock.call_count == 5
+    assert client.cache.stats()["hits"] == 1
+
+
+def test_fallback_answers_are_not_cached(monkeypatch):
+    monkeypatch.setenv("OLLAMA_BASE_URL", OLLAMA_URL)
+    client = LLMClient(cache=ResponseCache(), retry=RetryPolicy(attempts=1))
+
+    with requests_mock.Mocker() as mock:
+        mock.post(f"{OLLAMA_URL}/api/generate", status_code=500)
+
+        client.run_prompt("Answer briefly.", "Capital of France?")
+
+    assert client.cache.stats()["memory"]["entries"] == 0
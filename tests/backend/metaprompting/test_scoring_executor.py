@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from src.n8nprototype.backend.metaprompting.scoring_executor import ScoringExecutor
+from src.n8nprototype.backend.metaprompting.text_similarity import combined_similarity, simple_similarity
+
+PAIRS = [
+    ("The capital of France is Paris.", "Paris is the capital of France."),
+    ("Regular exercise improves health.", "Exercise regularly for better health."),
+    ("abc", "xyz"),
+    ('{"issue": "AI"}', '{"issue": "AI"}'),
+    ("one", "one two"),
+]
+
+
+@pytest.fixture(scope="module")
+def scoring():
+    with ScoringExecutor(max_workers=2, chunk_size=2) as executor:
+        yield executor
+
+
+def test_scores_match_the_calling_thread(scoring):
+    assert scoring.score_many(PAIRS) == pytest.approx([combined_similarity(*pair) for pair in PAIRS])
+    assert scoring.submit(*PAIRS[0]).result() == pytest.approx(combined_similarity(*PAIRS[0]))
+
+
+def test_pairs_are_submitted_in_chunks():
+    with ScoringExecutor(max_workers=1, chunk_size=2, scorer=simple_similarity) as executor:
+        executor.score_many(PAIRS)
+        assert executor.stats() == {"workers": 1, "jobs": 3, "pairs": 5}
+
+
+def test_event_loop_keeps_running_while_scoring(scoring):
+    long_text = " ".join(f"word{i}" for i in range(5000))
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.001)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        await scoring.ascore(long_text, long_text[::-1])
+        scores = await scoring.ascore_many(PAIRS)
+        ticker.cancel()
+        return ticks, scores
+
+    ticks, scores = asyncio.run(main())
+    assert ticks > 0
+    assert len(scores) == len(PAIRS)
+
+
+def test_errors_surface_on_the_future(scoring):
+    future = scoring.submit(None, "text")
+    with pytest.raises(TypeError):
+        future.result(timeout=30)
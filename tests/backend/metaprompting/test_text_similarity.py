@@ -0,0 +1,227 @@
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from benchmarks import inputs
+from src.n8nprototype.backend.metaprompting.text_similarity import (
+    combined_similarity,
+    combined_similarity_many,
+    cosine_text_similarity,
+    cosine_text_similarity_many,
+    full_comparisons,
+    hashed_cosine_similarity,
+    hashed_cosine_similarity_many,
+    iter_hashed_cosine_similarity,
+    json_similarity,
+    parse_json_output,
+    rejections,
+    simple_similarity,
+    SimilarityReference,
+)
+from src.n8nprototype.backend.utils import telemetry
+
+SAMPLE_RESPONSE = os.path.join(os.path.dirname(__file__), "..", "..", "..",
+                               "src", "n8nprototype", "backend", "metaprompting", "in", "sample-response.json")
+
+
+def sample_response():
+    with open(SAMPLE_RESPONSE, "r") as f:
+        return json.dumps(json.load(f), indent=2)
+
+
+def candidates_for(reference):
+    words = reference.split(" ")
+    return [
+        reference,
+        reference.upper(),
+        " ".join(words[:len(words) // 2]),
+        " ".join(reversed(words)),
+        "The capital of France is Paris.",
+        "",
+        "!!! ???",
+        json.dumps({"attentions": [{"name": "Title", "value": "Gap in Identifying Planning Issues"}]}),
+    ]
+
+
+@pytest.mark.parametrize("reference", ["The capital of France is Paris.", sample_response(), "!!!"])
+def test_many_matches_the_pairwise_functions(reference):
+    candidates = candidates_for(reference)
+
+    cosine = cosine_text_similarity_many(reference, candidates)
+    combined = combined_similarity_many(reference, candidates)
+
+    assert isinstance(combined, np.ndarray)
+    assert cosine == pytest.approx([cosine_text_similarity(candidate, reference) for candidate in candidates])
+    assert combined == pytest.approx([combined_similarity(candidate, reference) for candidate in candidates])
+
+
+@pytest.mark.parametrize("reference", ["The capital of France is Paris.", sample_response(), "!!!", ""])
+def test_reference_matches_the_pairwise_functions(reference):
+    prepared = SimilarityReference(reference)
+    for candidate in candidates_for(reference):
+        assert prepared.simple(candidate) == simple_similarity(candidate, reference)
+        assert prepared.cosine(candidate) == pytest.approx(cosine_text_similarity(candidate, reference))
+        assert prepared.score(candidate) == pytest.approx(combined_similarity(candidate, reference))
+
+
+def test_reference_is_faster_than_pairwise_scoring():
+    reference = sample_response()
+    candidates = [reference.replace("0.7", str(i)) for i in range(20)]
+    prepared = SimilarityReference(reference)
+
+    started_at = time.perf_counter()
+    scores = prepared.score_many(candidates)
+    prepared_time = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    expected = [combined_similarity(candidate, reference) for candidate in candidates]
+    pairwise_time = time.perf_counter() - started_at
+
+    assert scores == pytest.approx(expected)
+    assert prepared_time < pairwise_time
+
+
+def test_no_candidates():
+    assert combined_similarity_many("reference", []).shape == (0,)
+
+
+def test_batch_fits_the_vocabulary_once():
+    reference = sample_response()
+    candidates = [reference.replace("0.7", str(i)) for i in range(50)]
+
+    started_at = time.perf_counter()
+    cosine_text_similarity_many(reference, candidates)
+    batch = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for candidate in candidates:
+        cosine_text_similarity(candidate, reference)
+    pairwise = time.perf_counter() - started_at
+
+    assert batch < pairwise / 5
+
+
+def test_min_score_keeps_scores_that_reach_it():
+    reference = sample_response()
+    prepared = SimilarityReference(reference)
+    for candidate in candidates_for(reference):
+        exact = combined_similarity(candidate, reference)
+        for min_score in (0.0, exact - 1e-9):
+            assert combined_similarity(candidate, reference, min_score=min_score) == pytest.approx(exact)
+            assert prepared.score(candidate, min_score=min_score) == pytest.approx(exact)
+        assert simple_similarity(candidate, reference, min_score=0.0) == simple_similarity(candidate, reference)
+
+
+def test_hopeless_candidates_are_rejected_early():
+    telemetry.registry.clear()
+    reference = sample_response()
+    candidates = [
+        "short",                                       # too short: real_quick_ratio
+        "unrelated " * (len(reference) // 10),         # no shared word: cosine
+        reference.upper(),                             # same words, other characters: quick_ratio
+        " ".join(reversed(reference.split(" "))),      # passes all bounds
+    ]
+
+    scores = combined_similarity_many(reference, candidates, min_score=0.9)
+    exact = combined_similarity_many(reference, candidates)
+
+    assert all(exact < scores + 1e-9)
+    assert all(scores < 0.9)
+    assert full_comparisons.value() == 1
+    assert rejections.value(stage="real_quick_ratio") == 1
+    assert rejections.value(stage="cosine") == 1
+    assert rejections.value(stage="quick_ratio") == 1
+
+
+def test_early_exit_skips_the_quadratic_comparison():
+    reference = sample_response() * 5
+    candidate = inputs.mutate(reference, rate=0.5)
+    prepared = SimilarityReference(reference)
+
+    started_at = time.perf_counter()
+    exact = prepared.simple(candidate)
+    full_time = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    assert prepared.simple(candidate, min_score=0.99) < 0.99
+    bounded_time = time.perf_counter() - started_at
+
+    assert exact < 0.99
+    assert bounded_time < full_time / 5
+
+
+def test_json_similarity_ignores_formatting_and_order():
+    expected = sample_response()
+    actual = json.loads(expected)
+    actual["attentions"].reverse()
+    fenced = f"Here is the validation:\n```json\n{json.dumps(actual)}\n```"
+
+    assert json_similarity(fenced, expected) == 1.0
+    assert parse_json_output(fenced) == actual
+    assert combined_similarity(json.dumps(actual), expected) < 0.9
+
+
+def test_json_similarity_compares_field_by_field():
+    expected = {"attentions": [{"id": 1, "name": "Title", "value": "Gap in Identifying Planning Issues", "weight": "0.7"},
+                               {"id": 2, "name": "SOFT Question", "value": "What must be done?", "weight": "0.6"}]}
+    renumbered = {"attentions": [{"id": 7, "name": "SOFT Question", "value": "What must be done?", "weight": "0.6"},
+                                 {"id": 8, "name": "Title", "value": "Gap in Identifying Planning Issues", "weight": "0.35"}]}
+    missing = {"attentions": [expected["attentions"][0]]}
+
+    # Aligned by name, only the ids and one weight differ; numbers score by relative difference
+    soft_question = (1 - 5 / 7 + 3) / 4
+    title = (1 - 7 / 8 + 2 + 0.5) / 4
+    assert json_similarity(renumbered, expected) == pytest.approx((soft_question + title) / 2)
+    assert json_similarity(missing, expected) == pytest.approx(0.5)
+    assert json_similarity({"attentions": "none"}, expected) == 0.0
+
+
+def test_json_similarity_falls_back_to_text():
+    assert json_similarity("The capital is Paris.", "{\"capital\": \"Paris\"}") == \
+        pytest.approx(combined_similarity("The capital is Paris.", "{\"capital\": \"Paris\"}"))
+    assert parse_json_output("no json here") is None
+    assert parse_json_output("42") is None
+
+
+@pytest.mark.parametrize("reference", ["The capital of France is Paris.", sample_response(), "!!!", ""])
+def test_hashed_mode_matches_the_fitted_vocabulary(reference):
+    candidates = candidates_for(reference)
+
+    scores = hashed_cosine_similarity_many(reference, candidates, chunk_size=3)
+
+    assert scores.dtype == np.float32
+    expected = [cosine_text_similarity(candidate, reference) for candidate in candidates]
+    assert scores == pytest.approx(expected, abs=1e-5)
+    assert [hashed_cosine_similarity(candidate, reference) for candidate in candidates] == \
+        pytest.approx(expected, abs=1e-5)
+
+
+def test_hashed_mode_reads_texts_in_chunks():
+    reference = sample_response()
+    candidate = reference.replace("0.7", "0.9")
+    # Chunks cutting through words, like the tokens of a streamed generation
+    chunks = [candidate[start:start + 7] for start in range(0, len(candidate), 7)]
+
+    assert hashed_cosine_similarity(iter(chunks), reference) == \
+        pytest.approx(hashed_cosine_similarity(candidate, reference), abs=1e-6)
+
+
+def test_hashed_mode_memory_stays_flat():
+    reference = inputs.output_text(1_000, seed=1)
+
+    def peak(count):
+        # Every candidate brings new words, so a fitted vocabulary would grow with the count
+        candidates = (f"{inputs.output_text(200, seed=index)} unique{index}word" for index in range(count))
+        tracemalloc.start()
+        try:
+            for _ in iter_hashed_cosine_similarity(reference, candidates, chunk_size=50):
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    assert peak(2_000) < 1.5 * peak(200)
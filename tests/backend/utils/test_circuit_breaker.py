@@ -0,0 +1,85 @@
+import time
+
+import pytest
+import requests
+import requests_mock
+
+from src.n8nprototype.backend.utils import transport
+from src.n8nprototype.backend.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.n8nprototype.backend.utils.source_sink import source_to_n8n
+
+N8N_URL = "http://localhost:5678"
+
+
+def test_only_failures_of_the_dependency_open_the_breaker():
+    breaker = CircuitBreaker("openai", failure_threshold=2)
+
+    def rejected():
+        raise ValueError("bad request")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            breaker.call(rejected, is_failure=lambda e: not isinstance(e, ValueError))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            breaker.call(rejected)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_breaker_opens_after_consecutive_failures_and_recovers():
+    breaker = CircuitBreaker("n8n", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+
+    time.sleep(0.06)
+    breaker.before()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one probe passes while half open
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    breaker.record_success()
+    assert breaker.stats() == {"state": "closed", "failures": 0, "opens": 1, "rejected": 2}
+
+
+def test_failed_probe_opens_the_breaker_again():
+    breaker = CircuitBreaker("n8n", failure_threshold=1, reset_timeout=0.01)
+    with pytest.raises(RuntimeError):
+        breaker.call(lambda: (_ for _ in ()).throw(RuntimeError("down")))
+    time.sleep(0.02)
+    with pytest.raises(RuntimeError):
+        breaker.call(lambda: (_ for _ in ()).throw(RuntimeError("still down")))
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opens == 2
+
+
+def test_transport_fails_fast_once_the_host_is_down():
+    shared = transport.get_transport()
+    url = f"{N8N_URL}/webhook/down"
+    with requests_mock.Mocker() as mock:
+        mock.post(url, exc=requests.ConnectionError)
+        for _ in range(shared.failure_threshold):
+            with pytest.raises(requests.ConnectionError):
+                transport.post(url, json={})
+        with pytest.raises(CircuitOpenError):
+            transport.post(url, json={})
+        assert mock.call_count == shared.failure_threshold
+    assert shared.breaker_states()[N8N_URL]["state"] == "open"
+
+
+def test_open_circuit_is_handled_like_a_connection_error():
+    url = f"{N8N_URL}/webhook/down"
+    breaker = transport.get_transport().breaker_for(url)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    with requests_mock.Mocker() as mock:
+        mock.post(url, json={"success": True})
+        response = source_to_n8n({"key": "value"}, url)
+        assert not mock.called
+    assert "error" in response
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+import requests
+import requests_mock
+
+from src.n8nprototype.backend.utils import deadline, transport
+from src.n8nprototype.backend.utils.retry import RetryPolicy
+from src.n8nprototype.backend.utils.source_sink import source_to_n8n
+
+WEBHOOK_URL = "http://localhost:5678/webhook/deadline"
+
+
+def test_timeout_is_shortened_to_the_deadline():
+    assert deadline.timeout(30) == 30
+    with deadline.deadline(2):
+        assert deadline.timeout(30) <= 2
+        assert all(part <= 2 for part in deadline.timeout((10, 300)))
+        assert deadline.timeout(None) <= 2
+    assert deadline.remaining() is None
+
+
+def test_nested_deadline_never_extends_the_outer_one():
+    with deadline.deadline(1) as outer:
+        with deadline.deadline(60) as inner:
+            assert inner == outer
+
+
+def test_expired_deadline_fails_before_sending():
+    with requests_mock.Mocker() as mock:
+        mock.get(WEBHOOK_URL, json={})
+        with deadline.deadline(0.01):
+            time.sleep(0.02)
+            with pytest.raises(deadline.DeadlineExceeded):
+                transport.get(WEBHOOK_URL)
+        assert not mock.called
+
+
+def test_transport_sets_a_default_timeout():
+    with requests_mock.Mocker() as mock:
+        mock.get(WEBHOOK_URL, json={})
+        transport.get(WEBHOOK_URL)
+        assert mock.last_request.timeout == transport.get_transport().default_timeout
+
+
+def test_deadline_is_propagated_to_n8n():
+    with requests_mock.Mocker() as mock:
+        mock.post(WEBHOOK_URL, json={"success": True})
+        with deadline.deadline(5) as expires_at:
+            source_to_n8n({"key": "value"}, WEBHOOK_URL)
+        assert mock.last_request.headers[deadline.DEADLINE_HEADER] == str(int(expires_at * 1000))
+        assert mock.last_request.timeout <= 5
+
+
+def test_retries_stop_at_the_deadline():
+    policy = RetryPolicy(attempts=10, base_delay=1.0)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        return transport.get(WEBHOOK_URL)
+
+    with requests_mock.Mocker() as mock:
+        mock.get(WEBHOOK_URL, exc=requests.ConnectTimeout)
+        started_at = time.perf_counter()
+        with deadline.deadline(0.3), pytest.raises(requests.Timeout):
+            policy.call(failing)
+    assert time.perf_counter() - started_at < 1.0
+    assert len(calls) < 10
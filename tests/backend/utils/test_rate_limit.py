@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pytest
+import requests_mock
+
+from src.n8nprototype.backend.metaprompting.fake_llm_server import FakeLLMServer
+from src.n8nprototype.backend.metaprompting.llm_client import LLMClient
+from src.n8nprototype.backend.metaprompting.ollama_pool import OllamaPool
+from src.n8nprototype.backend.utils import deadline, rate_limit
+from src.n8nprototype.backend.utils.rate_limit import AIMDController, RateLimited, RateLimiter, TokenBucket
+from src.n8nprototype.backend.utils.retry import RetryPolicy
+
+
+def test_token_bucket_blocks_once_the_burst_is_used():
+    bucket = TokenBucket(per_minute=600, capacity=2)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    waited = bucket.acquire()
+
+    assert 0.05 < waited < 0.5
+
+
+def test_waiting_for_capacity_ends_at_the_deadline():
+    bucket = TokenBucket(per_minute=60, capacity=1)
+    controller = AIMDController(initial=1)
+    bucket.acquire()
+    controller.acquire()
+
+    started = time.perf_counter()
+    with deadline.deadline(0.1):
+        with pytest.raises(deadline.DeadlineExceeded):
+            bucket.acquire()
+        with pytest.raises(deadline.DeadlineExceeded):
+            controller.acquire()
+
+    assert time.perf_counter() - started < 0.5
+    assert controller.in_flight == 1
+
+
+def test_aimd_backs_off_on_overload_and_probes_upward():
+    controller = AIMDController(initial=8, minimum=1, maximum=10, cooldown=0)
+
+    controller.acquire()
+    controller.release(429)
+    assert controller.limit == 4
+
+    for _ in range(8):
+        controller.acquire()
+        controller.release(200, latency=0.1)
+    assert 5 < controller.limit < 6
+
+
+def test_aimd_backs_off_when_latency_rises():
+    controller = AIMDController(initial=8, cooldown=0)
+    for _ in range(20):
+        controller.acquire()
+        controller.release(200, latency=0.1)
+    limit = controller.limit
+
+    for _ in range(5):
+        controller.acquire()
+        controller.release(200, latency=2.0)
+
+    assert controller.limit < limit
+    assert controller.decreases >= 1
+
+
+def test_concurrency_never_exceeds_the_limit():
+    limiter = RateLimiter("test", initial_concurrency=2)
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def request():
+        nonlocal in_flight, peak
+        with limiter.limit() as outcome:
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.02)
+            with lock:
+                in_flight -= 1
+            outcome.status = 503
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak <= 2
+    assert limiter.metrics()["concurrency_limit"] == 1
+
+
+def test_ollama_rate_limited_response_lowers_the_limit(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+    monkeypatch.setenv("OLLAMA_BASE_URL", "http://ollama.test:11434")
+    monkeypatch.setenv("OLLAMA_INITIAL_CONCURRENCY", "4")
+    client = LLMClient(retry=RetryPolicy(attempts=1))
+
+    with requests_mock.Mocker() as mock:
+        mock.post("http://ollama.test:11434/api/generate", status_code=503)
+        client.run_prompt("Answer briefly.", "Capital of France?")
+
+    assert rate_limit.metrics()["ollama http://ollama.test:11434"]["concurrency_limit"] == 2
+
+
+def test_each_pool_backend_has_its_own_limiter(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+    monkeypatch.setenv("OLLAMA_INITIAL_CONCURRENCY", "4")
+    pool = OllamaPool(["http://gpu-1.test:11434", "http://gpu-2.test:11434"])
+    client = LLMClient(pool=pool, retry=RetryPolicy(attempts=1))
+
+    with requests_mock.Mocker() as mock:
+        mock.post("http://gpu-1.test:11434/api/generate", status_code=503)
+        client.run_prompt("Answer briefly.", "Capital of France?")
+
+    metrics = rate_limit.metrics()
+    assert metrics["ollama http://gpu-1.test:11434"]["concurrency_limit"] == 2
+    assert "ollama" not in metrics
+
+
+def test_streams_hold_their_slot_until_closed(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+    with FakeLLMServer(response="Paris is the capital") as fake:
+        client = LLMClient()
+        client.ollama_base_url = fake.base_url
+        limiter = rate_limit.get_limiter("ollama", fake.base_url)
+
+        stream = client.stream_prompt("Answer briefly.", "Capital of France?")
+        assert limiter.concurrency.in_flight == 1
+        assert "".join(stream) == "Paris is the capital"
+        assert limiter.concurrency.in_flight == 0
+
+        client.stream_prompt("Answer briefly.", "Capital of Italy?").response.close()
+        assert limiter.concurrency.in_flight == 0
+
+
+def test_rate_limited_run_is_not_answered_with_a_default(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+    client = LLMClient(retry=RetryPolicy(attempts=2, base_delay=0.01))
+    client.ollama_base_url = "http://ollama.test:11434"
+
+    with requests_mock.Mocker() as mock:
+        mock.post("http://ollama.test:11434/api/generate", status_code=429)
+        with pytest.raises(RateLimited):
+            client.run_prompt("Answer briefly.", "Capital of France?")
+
+    assert mock.call_count == 2
@@ -0,0 +1,113 @@
+import time
+
+import requests
+import requests_mock
+
+from src.n8nprototype.backend.metaprompting.llm_client import LLMClient
+from src.n8nprototype.backend.utils.retry import HedgePolicy, LatencyTracker, RetryPolicy
+
+OLLAMA_URL = "http://ollama.test:11434"
+
+
+def test_retries_retryable_status_until_success(monkeypatch):
+    monkeypatch.setenv("OLLAMA_BASE_URL", OLLAMA_URL)
+    client = LLMClient(retry=RetryPolicy(attempts=3, base_delay=0.01))
+
+    with requests_mock.Mocker() as mock:
+        mock.post(f"{OLLAMA_URL}/api/generate", [
+            {"status_code": 503},
+            {"exc": requests.ConnectTimeout},
+            {"json": {"response": "Paris"}},
+        ])
+
+        assert client.run_prompt("Answer briefly.", "Capital of France?") == "Paris"
+        assert mock.call_count == 3
+        assert mock.last_request.timeout is not None
+    assert client.retry.retries == 2
+
+
+def test_gives_up_after_the_last_attempt():
+    policy = RetryPolicy(attempts=2, base_delay=0.01)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise requests.ConnectionError("refused")
+
+    try:
+        policy.call(failing)
+        assert False, "expected ConnectionError"
+    except requests.ConnectionError:
+        pass
+    assert len(calls) == 2
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=3.0)
+
+    delays = [policy.delay(attempt) for attempt in range(6) for _ in range(20)]
+
+    assert all(0 <= delay <= 3.0 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_latency_percentile():
+    tracker = LatencyTracker()
+    for latency in range(1, 101):
+        tracker.record(latency / 100)
+
+    assert tracker.percentile(95) == 0.96
+    assert LatencyTracker().percentile(95) is None
+
+
+def test_slow_request_is_hedged_and_the_faster_answer_wins():
+    hedge = HedgePolicy(min_samples=5)
+    for _ in range(5):
+        hedge.latencies().record(0.02)
+    answers = iter(["stuck", "fast"])
+
+    def request():
+        answer = next(answers)
+        time.sleep(1.0 if answer == "stuck" else 0.01)
+        return answer
+
+    started_at = time.perf_counter()
+    assert hedge.call(request) == "fast"
+    assert time.perf_counter() - started_at < 0.5
+    assert hedge.stats()["hedged"] == 1
+    assert hedge.stats()["hedge_wins"] == 1
+
+
+def test_failed_hedge_does_not_win():
+    hedge = HedgePolicy(min_samples=5)
+    for _ in range(5):
+        hedge.latencies().record(0.02)
+    answers = iter([(0.2, 200), (0.0, 503)])
+
+    def request():
+        delay, status_code = next(answers)
+        time.sleep(delay)
+        response = requests.Response()
+        response.status_code = status_code
+        response._content, response._content_consumed = b"", True
+        return response
+
+    assert hedge.call(request).status_code == 200
+    assert hedge.stats()["hedge_wins"] == 0
+    assert hedge.latencies().percentile(100) >= 0.2
+
+
+def test_latencies_are_tracked_per_kind_of_request():
+    hedge = HedgePolicy(min_samples=1)
+    hedge.call(lambda: time.sleep(0.05), key=("/api/generate", "qwen2.5:14b"))
+
+    assert hedge.hedge_delay(("/api/generate", "qwen2.5:14b")) >= 0.05
+    assert hedge.hedge_delay(("/api/generate", "qwen2.5:7b")) is None
+
+
+def test_no_hedge_before_enough_samples():
+    hedge = HedgePolicy(min_samples=5)
+
+    assert hedge.call(lambda: "answer") == "answer"
+    assert hedge.hedged == 0
+    assert len(hedge.latencies()) == 1
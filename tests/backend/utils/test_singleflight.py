@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests_mock
+
+from src.n8nprototype.backend.utils import deadline, source_sink
+from src.n8nprototype.backend.utils.singleflight import SingleFlight, fingerprint
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint("url", {"a": 1, "b": 2}) == fingerprint("url", {"b": 2, "a": 1})
+    assert fingerprint("url", {"a": 1}) != fingerprint("url", {"a": 2})
+
+
+def test_concurrent_threads_share_one_execution():
+    group = SingleFlight()
+    executions = []
+
+    def slow_call():
+        executions.append(1)
+        time.sleep(0.1)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: group.do("key", slow_call), range(5)))
+
+    assert results == ["result"] * 5
+    assert len(executions) == 1
+    assert group.stats() == {"calls": 5, "executions": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_followers_receive_the_leaders_exception():
+    group = SingleFlight()
+    started = threading.Event()
+
+    def failing_call():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("upstream failed")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(group.do, "key", failing_call)
+        started.wait()
+        follower = pool.submit(group.do, "key", failing_call)
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+    assert group.stats()["executions"] == 1
+
+
+def test_concurrent_tasks_share_one_execution():
+    group = SingleFlight()
+    executions = []
+
+    async def slow_call():
+        executions.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(group.ado("key", slow_call) for _ in range(4)))
+
+    assert asyncio.run(main()) == ["result"] * 4
+    assert len(executions) == 1
+    assert group.stats()["coalesced"] == 3
+
+
+def test_followers_keep_their_own_deadline():
+    group = SingleFlight()
+    started = threading.Event()
+
+    def slow_call():
+        started.set()
+        time.sleep(0.3)
+        return "result"
+
+    def impatient_call():
+        with deadline.deadline(0.05):
+            return group.do("key", slow_call)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(group.do, "key", slow_call)
+        started.wait()
+        follower = pool.submit(impatient_call)
+        with pytest.raises(deadline.DeadlineExceeded):
+            follower.result(timeout=0.2)
+        assert leader.result() == "result"
+
+
+def test_task_followers_keep_their_own_deadline():
+    group = SingleFlight()
+
+    async def slow_call():
+        await asyncio.sleep(0.3)
+        return "result"
+
+    async def impatient_call():
+        with deadline.deadline(0.05):
+            return await group.ado("key", slow_call)
+
+    async def main():
+        leader = asyncio.ensure_future(group.ado("key", slow_call))
+        await asyncio.sleep(0)
+        with pytest.raises(deadline.DeadlineExceeded):
+            await impatient_call()
+        return await leader
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_followers_survive_a_cancelled_leader():
+    group = SingleFlight()
+    executions = []
+
+    async def slow_call():
+        executions.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        leader = asyncio.ensure_future(group.ado("key", slow_call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(group.ado("key", slow_call))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == "result"
+    assert len(executions) == 2
+    assert group.stats() == {"calls": 2, "executions": 2, "coalesced": 0, "in_flight": 0}
+
+
+def test_identical_webhook_calls_are_coalesced():
+    webhook_url = "http://localhost:5678/webhook/selectworkflow"
+    payload = [{"role": "user", "content": "Which workflow fits my issue?"}]
+
+    def slow_response(request, context):
+        time.sleep(0.1)
+        return {"success": True}
+
+    with requests_mock.Mocker() as mock:
+        mock.post(webhook_url, json=slow_response)
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            results = list(pool.map(lambda _: source_sink.source_to_n8n(payload, webhook_url, coalesce=True),
+                                    range(3)))
+
+        assert results == [{"success": True}] * 3
+        assert mock.call_count == 1
+
+        # Webhooks may have side effects, so calls are only coalesced on request
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            list(pool.map(lambda _: source_sink.source_to_n8n(payload, webhook_url), range(3)))
+        assert mock.call_count == 4
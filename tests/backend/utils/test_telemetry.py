@@ -0,0 +1,125 @@
+import logging
+
+import requests
+import requests_mock
+
+from src.n8nprototype.backend.metaprompting.llm_client import LLMClient
+from src.n8nprototype.backend.utils import rate_limit, telemetry, transport
+from src.n8nprototype.backend.utils.retry import RetryPolicy
+from src.n8nprototype.backend.utils.singleflight import SingleFlight
+from src.n8nprototype.backend.utils.source_sink import source_to_n8n
+
+WEBHOOK_URL = "http://localhost:5678/webhook/telemetry"
+OLLAMA_URL = "http://ollama.test:11434"
+
+
+def setup_function():
+    telemetry.registry.clear()
+
+
+def test_histogram_buckets_and_percentile():
+    histogram = telemetry.Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, span="test")
+    assert histogram.snapshot(span="test") == {"count": 4, "sum": 6.05, "counts": [1, 2, 1]}
+    assert histogram.percentile(50, span="test") == 1.0
+    assert histogram.snapshot(span="other") is None
+
+    lines = histogram.exposition()
+    assert 'latency_seconds_bucket{span="test",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{span="test",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{span="test"} 4' in lines
+
+
+def test_webhook_call_is_recorded_as_nested_spans():
+    with requests_mock.Mocker() as mock:
+        mock.post(WEBHOOK_URL, json={"success": True})
+        source_to_n8n({"key": "value"}, WEBHOOK_URL)
+
+    http = telemetry.recent_spans("http")[-1]
+    assert http["parent"] == "n8n.webhook"
+    assert http["status"] == 200
+    assert http["bytes_sent"] == len('{"key": "value"}')
+    assert http["bytes_received"] == len('{"success": true}')
+
+    labels = {"span": "http", "host": "http://localhost:5678", "status": 200}
+    assert telemetry.requests_total.value(**labels) == 1
+    assert 'outbound_requests_total{host="http://localhost:5678",span="http",status="200"} 1' in telemetry.exposition()
+
+
+def test_ollama_generation_records_tokens(monkeypatch):
+    monkeypatch.setenv("OLLAMA_BASE_URL", OLLAMA_URL)
+    client = LLMClient(retry=RetryPolicy(attempts=1))
+    with requests_mock.Mocker() as mock:
+        mock.post(f"{OLLAMA_URL}/api/generate",
+                  json={"response": "Paris", "prompt_eval_count": 12, "eval_count": 3})
+        assert client.run_prompt("Answer briefly.", "Capital of France?", model="qwen-telemetry") == "Paris"
+
+    assert telemetry.llm_tokens.value(model="qwen-telemetry", kind="prompt") == 12
+    assert telemetry.llm_tokens.value(model="qwen-telemetry", kind="completion") == 3
+
+
+def test_payload_is_only_serialized_with_debug_logging():
+    class Payload:
+        serialized = 0
+
+        def __str__(self):
+            Payload.serialized += 1
+            return "payload"
+
+    logger = telemetry.logger
+    level = logger.level
+    try:
+        logger.setLevel(logging.INFO)
+        telemetry.log_payload("Payload", {"value": Payload()})
+        assert Payload.serialized == 0
+        logger.setLevel(logging.DEBUG)
+        telemetry.log_payload("Payload", {"value": Payload()})
+        assert Payload.serialized == 1
+    finally:
+        logger.setLevel(level)
+
+
+def test_metrics_endpoint():
+    telemetry.requests_total.inc(span="test", host="", status="ok")
+    server = telemetry.serve(port=0, host="127.0.0.1")
+    try:
+        response = requests.get(f"http://127.0.0.1:{server.server_port}/metrics", timeout=5)
+    finally:
+        server.shutdown()
+    assert response.status_code == 200
+    assert 'outbound_requests_total{host="",span="test",status="ok"} 1' in response.text
+
+
+def test_limiters_breakers_and_flights_are_exported():
+    limiter = rate_limit.get_limiter("openai")
+    with limiter.limit():
+        exposition = telemetry.exposition()
+    assert 'rate_limit_in_flight{limiter="openai"} 1' in exposition
+    assert "# TYPE rate_limit_throttled_total counter" in exposition
+
+    transport.get_transport().breaker_for("http://exported.test/api").record_failure()
+    exposition = telemetry.exposition()
+    assert 'circuit_breaker_state{host="http://exported.test",state="closed"} 1' in exposition
+    assert 'circuit_breaker_state{host="http://exported.test",state="open"} 0' in exposition
+
+    flights = SingleFlight("exported")
+    flights.do("key", lambda: "result")
+    assert 'singleflight_executions_total{flight="exported"} 1' in telemetry.exposition()
+
+
+def test_retries_and_fallbacks_are_recorded_instead_of_printed(monkeypatch, capsys):
+    monkeypatch.setenv("OLLAMA_BASE_URL", OLLAMA_URL)
+    client = LLMClient(retry=RetryPolicy(attempts=2, base_delay=0.01))
+    capsys.readouterr()
+
+    with requests_mock.Mocker() as mock:
+        mock.post(f"{OLLAMA_URL}/api/generate", [{"status_code": 500}, {"status_code": 500},
+                                                  {"status_code": 500}, {"text": '{"response": "Paris", "done": true}'}])
+        assert client.run_prompt("Answer briefly.", "Capital of France?") == "Paris"
+
+    assert capsys.readouterr().out == ""
+    assert telemetry.retries_total.value(reason=500) == 2
+    failed, fallback = telemetry.recent_spans("ollama.generate")[-2:]
+    assert failed["status"] == 500 and failed["retries"] == 1
+    assert fallback["stream_fallback"] and "status" not in fallback
@@ -0,0 +1,34 @@
+import requests_mock
+
+from src.n8nprototype.backend.utils import transport
+from src.n8nprototype.backend.utils.transport import Transport
+
+
+def test_shared_transport_is_reused():
+    assert transport.get_transport() is transport.get_transport()
+
+
+def test_pool_sizes_and_host_limits():
+    pooled = Transport(pool_connections=4, pool_maxsize=8, host_limits={"http://localhost:5678/api": 2})
+
+    default_adapter = pooled.session.get_adapter("http://ollama.test:11434/api/generate")
+    assert default_adapter._pool_connections == 4
+    assert default_adapter._pool_maxsize == 8
+
+    limited_adapter = pooled.session.get_adapter("http://localhost:5678/webhook/abc")
+    assert limited_adapter._pool_maxsize == 2
+    assert limited_adapter._pool_block is True
+    pooled.close()
+
+
+def test_requests_go_through_the_pooled_session():
+    pooled = Transport()
+
+    with requests_mock.Mocker() as mock:
+        mock.put("http://localhost:5678/api/v1/workflows/1", json={"id": "1"})
+
+        response = pooled.put("http://localhost:5678/api/v1/workflows/1", json={"name": "x"})
+
+        assert response.json() == {"id": "1"}
+        assert mock.call_count == 1
+    pooled.close()
@@ -0,0 +1,32 @@
+from benchmarks import run
+from benchmarks.cases import CASES, Case
+
+BASELINE = {"case": {"10": 0.001, "100": 0.01, "1000": 0.1}}
+
+
+def test_slope_of_linear_and_quadratic_timings():
+    assert round(run.slope({"10": 0.001, "100": 0.01}), 6) == 1.0
+    assert round(run.slope({"10": 0.001, "100": 0.1}), 6) == 2.0
+
+
+def test_slowdown_beyond_the_threshold_is_a_regression():
+    assert run.compare({"case": {"10": 0.0014, "100": 0.014, "1000": 0.14}}, BASELINE, threshold=1.5) == []
+    regressions = run.compare({"case": {"10": 0.001, "100": 0.01, "1000": 0.2}}, BASELINE, threshold=1.5)
+    assert regressions == ["case [1000]: 200.000 ms, baseline 100.000 ms (2.0x)"]
+
+
+def test_complexity_regression_is_found_on_a_faster_machine():
+    # Ten times faster overall, but quadratic instead of linear
+    regressions = run.compare({"case": {"10": 0.0001, "100": 0.001, "1000": 0.1}}, BASELINE)
+    assert any("exponent" in regression for regression in regressions)
+
+
+def test_expensive_sizes_are_skipped():
+    calls = []
+    case = Case("sleepy", (1, 10, 100), lambda size: lambda: calls.append(size))
+    assert list(run.run_case(case, max_call=5.0, max_size=10, min_time=0.001)) == ["1", "10"]
+
+
+def test_every_case_runs_at_its_smallest_size():
+    for case in CASES:
+        case.setup(case.sizes[0])()
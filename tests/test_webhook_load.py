@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from benchmarks import webhook_load
+
+
+class StandInWebhook:
+    """
+    Local stand-in for an n8n webhook that answers after delay seconds and fails every
+    fail_every-th request with 500.
+    """
+
+    def __init__(self, delay=0.01, fail_every=None):
+        self.delay = delay
+        self.fail_every = fail_every
+        self.bodies = []
+        self.authorizations = []
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stand_in._lock:
+                    stand_in.bodies.append(body)
+                    stand_in.authorizations.append(self.headers.get("Authorization"))
+                    failing = stand_in.fail_every and len(stand_in.bodies) % stand_in.fail_every == 0
+                time.sleep(stand_in.delay)
+                data = json.dumps({"output": "ok"}).encode("utf-8")
+                self.send_response(500 if failing else 200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/webhook/softvalidator"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_corpus_wraps_issues_in_messages():
+    corpus = webhook_load.load_corpus()
+    assert corpus[0] == [{"role": "user", "content": "New artificial intelligence technology is challenging our core business of on-demand translation."}]
+    assert all(isinstance(item, list) for item in corpus)
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert webhook_load.percentile(values, 50) == 50
+    assert webhook_load.percentile(values, 99) == 99
+    assert webhook_load.percentile([], 50) is None
+
+
+def test_closed_loop_run_with_jwt_and_query_format():
+    with StandInWebhook(fail_every=10) as webhook:
+        generator = webhook_load.LoadGenerator(webhook.url, [["a"], ["b"]], jwt_token="secret",
+                                               payload_format="query", concurrency=4)
+        results = generator.run(requests=40)
+
+    summary = webhook_load.summarize(results, generator.elapsed)
+    assert summary["requests"] == 40
+    assert summary["errors"] == {"500": 4}
+    assert summary["error_rate"] == pytest.approx(0.1)
+    assert summary["p50"] >= 0.01
+    assert webhook.bodies[0] in ({"body": ["a"]}, {"body": ["b"]})
+    assert set(webhook.authorizations) == {"Bearer secret"}
+
+
+def test_failing_webhook_gets_every_request():
+    with StandInWebhook(fail_every=1) as webhook:
+        generator = webhook_load.LoadGenerator(webhook.url, [["a"]], concurrency=4)
+        results = generator.run(requests=40)
+
+    assert len(webhook.bodies) == 40
+    assert webhook_load.summarize(results, generator.elapsed)["errors"] == {"500": 40}
+
+
+def test_open_loop_run_keeps_the_rate():
+    with StandInWebhook(delay=0.05) as webhook:
+        generator = webhook_load.LoadGenerator(webhook.url, webhook_load.load_corpus(), concurrency=8, rate=50)
+        results = generator.run(duration=1.0)
+
+    assert 45 <= len(results) <= 55
+    intervals = webhook_load.timeline(results, interval=0.5)
+    assert [row["requests"] for row in intervals][:2] == [25, 25]
+
+
+def test_cli_prints_a_json_report(capsys):
+    with StandInWebhook() as webhook:
+        assert webhook_load.main([webhook.url, "--requests", "5", "--concurrency", "2", "--json"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["summary"]["requests"] == 5
+    assert report["summary"]["error_rate"] == 0.0